@@ -1,3 +1,5 @@
+import uuid
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -6,8 +8,11 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from database import get_db
-from models import User
+from cache import TTLCache, invalidate_on_commit
+from models import User, UserRole, UserLocation
+from password_policy import BCRYPT_ROUNDS
 from schemas import TokenData
+from token_revocation import TokenAlreadyRevoked, revocation_store
 import os
 from dotenv import load_dotenv
 
@@ -18,10 +23,45 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "aej-cosmetic-secret-key-2024-super-secure-CHANGE-IN-PRODUCTION")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_MAXSIZE = int(os.getenv("USER_CACHE_MAXSIZE", "1024"))
+TOKEN_VERSION_CACHE_TTL = float(os.getenv("TOKEN_VERSION_CACHE_TTL", "30"))
 
 # Token security
 security = HTTPBearer()
 
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    """Authenticated user as seen by endpoints: the fields needed for authorization"""
+    id: int
+    username: str
+    rol: UserRole
+    is_active: bool
+    ubicacion: UserLocation
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserPrincipal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            rol=user.rol,
+            is_active=user.is_active,
+            ubicacion=user.ubicacion
+        )
+
+
+# Principals keyed by username; any committed write to users clears the cache
+# (a rename or deactivation must not leave a stale entry behind)
+user_cache = TTLCache("users", maxsize=USER_CACHE_MAXSIZE, ttl=USER_CACHE_TTL)
+invalidate_on_commit(user_cache, (User,))
+
+# {user id: (token_version, is_active)} for every user, used to check role-bearing
+# tokens; reloaded on any committed user write here and after the TTL elsewhere
+token_versions = TTLCache("token_versions", maxsize=1, ttl=TOKEN_VERSION_CACHE_TTL)
+invalidate_on_commit(token_versions, (User,))
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a plain password against its hash"""
     password_bytes = plain_password.encode('utf-8')
@@ -29,12 +69,22 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(password_bytes, hashed_bytes)
 
 def get_password_hash(password: str) -> str:
-    """Hash a password"""
+    """Hash a password with the work factor of the hashing policy"""
     password_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password_bytes, salt)
     return hashed.decode('utf-8')
 
+def access_token_claims(user: User) -> dict:
+    """Claims that let protected endpoints authorize without reading the user"""
+    return {
+        "sub": user.username,
+        "uid": user.id,
+        "rol": user.rol.value,
+        "ubi": user.ubicacion.value,
+        "tv": user.token_version or 0,
+    }
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
     to_encode = data.copy()
@@ -43,11 +93,30 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    # Unique id so a single token can be revoked (logout)
+    to_encode.setdefault("jti", uuid.uuid4().hex)
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str) -> TokenData:
-    """Verify JWT token"""
+def create_refresh_token(claims: dict, expires_delta: Optional[timedelta] = None):
+    """Create a long-lived refresh token (only accepted by /auth/refresh)"""
+    return create_access_token(
+        data={**claims, "typ": "refresh", "jti": uuid.uuid4().hex},
+        expires_delta=expires_delta or timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+
+def create_token_pair(claims: dict) -> dict:
+    """Access + refresh tokens for the given claims"""
+    return {
+        "access_token": create_access_token(
+            data=claims, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        ),
+        "refresh_token": create_refresh_token(claims),
+        "token_type": "bearer",
+    }
+
+def verify_token(token: str, token_type: str = "access") -> TokenData:
+    """Verify JWT token (access tokens have no "typ" claim, refresh tokens "refresh")"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -56,10 +125,20 @@ def verify_token(token: str) -> TokenData:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        if username is None:
+        if username is None or payload.get("typ", "access") != token_type:
             raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
+        if payload.get("tv") is not None and None in (payload.get("uid"), payload.get("rol"), payload.get("ubi")):
+            raise credentials_exception
+        token_data = TokenData(
+            username=username,
+            user_id=payload.get("uid"),
+            rol=payload.get("rol"),
+            ubicacion=payload.get("ubi"),
+            token_version=payload.get("tv"),
+            jti=payload.get("jti"),
+            expires_at=datetime.utcfromtimestamp(payload["exp"]) if "exp" in payload else None
+        )
+    except (JWTError, ValueError):
         raise credentials_exception
     return token_data
 
@@ -76,23 +155,127 @@ def authenticate_user(db: Session, username: str, password: str) -> Optional[Use
         return None
     return user
 
-async def get_current_user(
+def load_token_versions(db: Session) -> dict:
+    """Current token version and status of every user (one narrow query)"""
+    return {
+        user_id: (token_version, is_active)
+        for user_id, token_version, is_active in db.query(User.id, User.token_version, User.is_active)
+    }
+
+def _principal_from_claims(db: Session, token_data: TokenData) -> UserPrincipal:
+    versions = token_versions.get_or_compute("all", lambda: load_token_versions(db))
+    if token_data.user_id not in versions:
+        # Possibly created after the map was cached by this worker
+        token_versions.invalidate()
+        versions = token_versions.get_or_compute("all", lambda: load_token_versions(db))
+
+    current = versions.get(token_data.user_id)
+    if current is None or current[0] != token_data.token_version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return UserPrincipal(
+        id=token_data.user_id,
+        username=token_data.username,
+        rol=token_data.rol,
+        is_active=current[1],
+        ubicacion=token_data.ubicacion
+    )
+
+def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
-) -> User:
-    """Get current authenticated user"""
+) -> UserPrincipal:
+    """
+    Get current authenticated user (sync: runs in the threadpool, not the event loop).
+
+    Role-bearing tokens are authorized from their claims, checked against the cached
+    token version map. Tokens that only carry "sub" fall back to ``user_cache``.
+    """
     token = credentials.credentials
     token_data = verify_token(token)
-    user = get_user_by_username(db, username=token_data.username)
-    if user is None:
+    revocation_store.sync(db)
+    if revocation_store.is_revoked(token_data.jti):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if token_data.token_version is not None:
+        return _principal_from_claims(db, token_data)
+
+    def load_principal() -> UserPrincipal:
+        user = get_user_by_username(db, username=token_data.username)
+        if user is None:
+            # Raised (not returned) so unknown usernames are never cached
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return UserPrincipal.from_user(user)
+
+    return user_cache.get_or_compute(token_data.username, load_principal)
+
+def rotate_refresh_token(db: Session, refresh_token: str) -> dict:
+    """
+    Exchange a refresh token for a new access/refresh pair, without password checks.
+
+    The presented refresh token is revoked. Presenting an already used one means it
+    leaked: the user's token_version is bumped, revoking every token of the user.
+    """
+    token_data = verify_token(refresh_token, token_type="refresh")
+    if token_data.token_version is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return user
+    revocation_store.sync(db)
+    principal = _principal_from_claims(db, token_data)
+    if not principal.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+
+    try:
+        if revocation_store.is_revoked(token_data.jti):
+            raise TokenAlreadyRevoked(token_data.jti)
+        revocation_store.revoke(db, [(token_data.jti, token_data.expires_at, principal.id)])
+    except TokenAlreadyRevoked:
+        db.query(User).filter(User.id == principal.id).update(
+            {User.token_version: User.token_version + 1}, synchronize_session=False
+        )
+        db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token reuse detected, please log in again",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return create_token_pair({
+        "sub": principal.username,
+        "uid": principal.id,
+        "rol": principal.rol.value,
+        "ubi": principal.ubicacion.value,
+        "tv": token_data.token_version,
+    })
+
+def revoke_tokens(db: Session, access_token: str, refresh_token: Optional[str] = None):
+    """Revoke an access token and, optionally, a refresh token of the same user (logout)"""
+    access = verify_token(access_token)
+    revocations = [(access.jti, access.expires_at, access.user_id)]
+    if refresh_token:
+        refresh = verify_token(refresh_token, token_type="refresh")
+        if refresh.username != access.username:
+            raise HTTPException(status_code=400, detail="Refresh token belongs to another user")
+        revocations.append((refresh.jti, refresh.expires_at, refresh.user_id))
+    try:
+        revocation_store.revoke(db, revocations)
+    except TokenAlreadyRevoked:
+        pass  # logging out twice is harmless
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_active_user(current_user: UserPrincipal = Depends(get_current_user)) -> UserPrincipal:
     """Get current active user"""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
@@ -101,7 +284,7 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
 # Permission decorators
 def require_role(required_roles: list):
     """Decorator to require specific roles"""
-    def decorator(current_user: User = Depends(get_current_active_user)):
+    def decorator(current_user: UserPrincipal = Depends(get_current_active_user)):
         if current_user.rol not in required_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -110,7 +293,7 @@ def require_role(required_roles: list):
         return current_user
     return decorator
 
-def require_superuser(current_user: User = Depends(get_current_active_user)):
+def require_superuser(current_user: UserPrincipal = Depends(get_current_active_user)):
     """Require superuser role"""
     if current_user.rol != "SUPERUSUARIO":
         raise HTTPException(
@@ -119,7 +302,7 @@ def require_superuser(current_user: User = Depends(get_current_active_user)):
         )
     return current_user
 
-def require_admin_or_super(current_user: User = Depends(get_current_active_user)):
+def require_admin_or_super(current_user: UserPrincipal = Depends(get_current_active_user)):
     """Require admin or superuser role"""
     if current_user.rol not in ["ADMIN", "SUPERUSUARIO"]:
         raise HTTPException(
@@ -0,0 +1,151 @@
+"""
+Concurrency benchmark for database-bound handlers
+
+Compares the old pattern (an `async def` handler calling the synchronous
+Session on the event loop) with the current one (plain `def` handlers run
+in FastAPI's threadpool). A per-statement delay simulates the network round
+trip to a real database server.
+
+Usage (from backend/):
+    python benchmarks/bench_concurrency.py --requests 200 --concurrency 20 --db-latency-ms 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import Depends
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+
+from auth import create_access_token, get_current_active_user
+from database import Base, get_db
+from main import app
+from models import Product, ProductCategory, User, UserLocation, UserRole
+
+
+def build_database(path: str, products: int, latency_ms: float):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = SessionLocal()
+    db.add(User(
+        username="bench", email="bench@example.com", nombre_completo="Bench",
+        password_hash="x", rol=UserRole.ADMIN, ubicacion=UserLocation.COLOMBIA
+    ))
+    db.add_all([
+        Product(
+            codigo=f"BENCH-{i:06d}", nombre=f"Producto {i}", categoria=ProductCategory.MAQUILLAJE,
+            precio_compra=1000, precio_venta=1500, stock_actual=100
+        )
+        for i in range(products)
+    ])
+    db.commit()
+    db.close()
+
+    if latency_ms:
+        @event.listens_for(engine, "before_cursor_execute")
+        def simulate_network(*args):
+            time.sleep(latency_ms / 1000)
+
+    return SessionLocal
+
+
+def install_routes(SessionLocal):
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+
+    # Old pattern: async handler blocking the loop with the sync session
+    @app.get("/bench/products-on-loop")
+    async def products_on_loop(
+        db: Session = Depends(get_db),
+        current_user: User = Depends(get_current_active_user)
+    ):
+        return [p.id for p in db.query(Product).limit(100).all()]
+
+    # Current pattern: sync handler, dispatched to the threadpool
+    @app.get("/bench/products-threadpool")
+    def products_threadpool(
+        db: Session = Depends(get_db),
+        current_user: User = Depends(get_current_active_user)
+    ):
+        return [p.id for p in db.query(Product).limit(100).all()]
+
+
+async def run_load(client, path, headers, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    health_latencies = []
+    done = asyncio.Event()
+
+    async def one():
+        async with semaphore:
+            response = await client.get(path, headers=headers)
+            response.raise_for_status()
+
+    async def probe_health():
+        # Latency of a DB-free endpoint while the load is running, measured from
+        # the moment the probe was due so that event loop stalls are included
+        while not done.is_set():
+            due = time.perf_counter() + 0.005
+            await asyncio.sleep(0.005)
+            await client.get("/health")
+            health_latencies.append((time.perf_counter() - due) * 1000)
+
+    probe = asyncio.create_task(probe_health())
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await probe
+
+    return {
+        "throughput": total / elapsed,
+        "health_p50": statistics.median(health_latencies) if health_latencies else 0.0,
+        "health_max": max(health_latencies) if health_latencies else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--db-latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        SessionLocal = build_database(os.path.join(tmp, "bench.db"), args.products, args.db_latency_ms)
+        install_routes(SessionLocal)
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'bench'})}"}
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(f"{args.requests} requests, concurrency {args.concurrency}, "
+                  f"simulated DB latency {args.db_latency_ms} ms/statement\n")
+            print(f"{'mode':<22}{'req/s':>10}{'health p50 ms':>16}{'health max ms':>16}")
+            for label, path in (
+                ("async def (before)", "/bench/products-on-loop"),
+                ("def/threadpool (now)", "/bench/products-threadpool"),
+            ):
+                result = await run_load(client, path, headers, args.requests, args.concurrency)
+                print(f"{label:<22}{result['throughput']:>10.1f}"
+                      f"{result['health_p50']:>16.2f}{result['health_max']:>16.2f}")
+
+        app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
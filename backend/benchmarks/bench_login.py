@@ -0,0 +1,149 @@
+"""
+Login throughput benchmark
+
+Fires bursts of concurrent logins and measures, at the same time, the latency
+of other endpoints (/health on the event loop and /products in the threadpool).
+Compares bcrypt verification on the event loop (the old `async def` login)
+with the current login, which offloads bcrypt to the bounded hashing pool.
+
+Usage (from backend/):
+    python benchmarks/bench_login.py --logins 40 --concurrency 10 --rounds 12
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt
+import httpx
+from fastapi import Depends, HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from auth import create_access_token, get_user_by_username, verify_password
+from database import Base, get_db
+from main import app, password_hasher
+from models import Product, ProductCategory, User, UserLocation, UserRole
+from schemas import LoginRequest
+
+PASSWORD = "benchpassword"
+
+
+def build_database(path: str, rounds: int):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = SessionLocal()
+    db.add(User(
+        username="bench", email="bench@example.com", nombre_completo="Bench",
+        password_hash=bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds)).decode(),
+        rol=UserRole.ADMIN, ubicacion=UserLocation.COLOMBIA
+    ))
+    db.add_all([
+        Product(
+            codigo=f"BENCH-{i:04d}", nombre=f"Producto {i}", categoria=ProductCategory.MAQUILLAJE,
+            precio_compra=1000, precio_venta=1500, stock_actual=100
+        )
+        for i in range(100)
+    ])
+    db.commit()
+    db.close()
+    return SessionLocal
+
+
+def install_routes(SessionLocal):
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+
+    # Old pattern: bcrypt runs on the event loop thread
+    @app.post("/bench/login-on-loop")
+    async def login_on_loop(login_data: LoginRequest, db: Session = Depends(get_db)):
+        user = get_user_by_username(db, login_data.username)
+        if not user or not verify_password(login_data.password, user.password_hash):
+            raise HTTPException(status_code=401)
+        return {"access_token": create_access_token(data={"sub": user.username})}
+
+
+async def probe(client, path, headers, latencies, done):
+    # Latency measured from the moment the probe was due, so loop stalls count
+    while not done.is_set():
+        due = time.perf_counter() + 0.01
+        await asyncio.sleep(0.01)
+        response = await client.get(path, headers=headers)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - due) * 1000)
+
+
+async def run_load(client, login_path, headers, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    done = asyncio.Event()
+    health, products = [], []
+
+    async def one():
+        async with semaphore:
+            response = await client.post(login_path, json={"username": "bench", "password": PASSWORD})
+            response.raise_for_status()
+
+    probes = [
+        asyncio.create_task(probe(client, "/health", None, health, done)),
+        asyncio.create_task(probe(client, "/products?limit=20", headers, products, done)),
+    ]
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await asyncio.gather(*probes)
+
+    def p95(values):
+        return statistics.quantiles(values, n=20)[-1] if len(values) >= 2 else (values or [0.0])[0]
+
+    return {
+        "throughput": total / elapsed,
+        "health_p95": p95(health),
+        "products_p95": p95(products),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor of the bench user")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        SessionLocal = build_database(os.path.join(tmp, "bench.db"), args.rounds)
+        install_routes(SessionLocal)
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'bench'})}"}
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            print(f"{args.logins} logins, concurrency {args.concurrency}, bcrypt cost {args.rounds}, "
+                  f"{password_hasher.workers} hashing workers\n")
+            print(f"{'mode':<22}{'logins/s':>10}{'health p95 ms':>16}{'products p95 ms':>18}")
+            for label, path in (
+                ("bcrypt on loop", "/bench/login-on-loop"),
+                ("hashing pool (now)", "/auth/login"),
+            ):
+                result = await run_load(client, path, headers, args.logins, args.concurrency)
+                print(f"{label:<22}{result['throughput']:>10.1f}"
+                      f"{result['health_p95']:>16.2f}{result['products_p95']:>18.2f}")
+
+        app.dependency_overrides.clear()
+        password_hasher.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+"""
+Password hashing cost benchmark
+
+Reports bcrypt hash and verify time per work factor, to choose BCRYPT_ROUNDS
+for each environment (see password_policy.py), and the time to seed the
+initial users serially versus on the hashing pool.
+
+Usage (from backend/):
+    python benchmarks/bench_password_hashing.py --min-rounds 4 --max-rounds 13 --samples 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt
+
+from password_hashing import password_hasher
+from password_policy import BCRYPT_ROUNDS, DEFAULT_ROUNDS, ENVIRONMENT
+
+
+def time_ms(fn, samples):
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-rounds", type=int, default=4)
+    parser.add_argument("--max-rounds", type=int, default=13)
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--users", type=int, default=5, help="passwords hashed in the seed comparison")
+    args = parser.parse_args()
+
+    password = b"benchmark-password"
+    environments = {rounds: name for name, rounds in DEFAULT_ROUNDS.items()}
+    print(f"ENVIRONMENT={ENVIRONMENT}, active work factor {BCRYPT_ROUNDS}\n")
+    print(f"{'rounds':>6}{'hash ms':>12}{'verify ms':>12}  default for")
+    for rounds in range(args.min_rounds, args.max_rounds + 1):
+        hashed = bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+        hash_ms = time_ms(lambda: bcrypt.hashpw(password, bcrypt.gensalt(rounds)), args.samples)
+        verify_ms = time_ms(lambda: bcrypt.checkpw(password, hashed), args.samples)
+        print(f"{rounds:>6}{hash_ms:>12.1f}{verify_ms:>12.1f}  {environments.get(rounds, '')}")
+
+    salt = bcrypt.gensalt(BCRYPT_ROUNDS)
+    passwords = [f"user-{i}".encode() for i in range(args.users)]
+    serial = time_ms(lambda: [bcrypt.hashpw(p, salt) for p in passwords], 1)
+    pooled = time_ms(lambda: [f.result() for f in [
+        password_hasher.submit(bcrypt.hashpw, p, salt) for p in passwords
+    ]], 1)
+    password_hasher.shutdown()
+    print(f"\nseeding {args.users} users at cost {BCRYPT_ROUNDS}: serial {serial:.0f} ms, "
+          f"hashing pool ({password_hasher.workers} workers) {pooled:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
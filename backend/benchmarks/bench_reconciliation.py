@@ -0,0 +1,96 @@
+"""
+Product reconciliation benchmark
+
+Builds a synthetic catalog (type, brand, two descriptive words, size and
+shade per product), then scores batches of invoice lines taken from it with a
+perturbation each (a dropped word, a typo or an extra word, in another case)
+and reports the matrix build time, the time per batch and how often the
+original product ranks first.
+
+Usage (from backend/):
+    python benchmarks/bench_reconciliation.py --products 50000 --lines 100
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from product_reconciliation import ProductReconciler
+
+TYPES = [
+    "LABIAL", "BASE", "SERUM", "CREMA", "POLVO", "SOMBRA", "RUBOR", "DELINEADOR",
+    "MASCARA", "PESTAÑAS", "SHAMPOO", "ACONDICIONADOR", "TONICO", "EXFOLIANTE",
+]
+
+
+def make_word(rng: random.Random) -> str:
+    return "".join(rng.choice("aeiou" if i % 2 else "bcdfghjklmnprstvz") for i in range(rng.randint(4, 9))).upper()
+
+
+def make_catalog(size: int, rng: random.Random):
+    brands = [make_word(rng) for _ in range(400)]
+    words = [make_word(rng) for _ in range(5000)]
+    return [
+        (product_id, f"REF-{product_id}",
+         f"{rng.choice(TYPES)} {rng.choice(brands)} {rng.choice(words)} {rng.choice(words)} "
+         f"{rng.choice([15, 30, 50, 100, 200])}ML TONO {rng.randint(1, 60)}")
+        for product_id in range(1, size + 1)
+    ]
+
+
+def perturb(nombre: str, rng: random.Random) -> str:
+    words = nombre.split()
+    change = rng.random()
+    if change < 0.3:
+        del words[rng.randrange(1, len(words))]
+    elif change < 0.6:
+        position = rng.randrange(len(words))
+        word = words[position]
+        if len(word) > 3:
+            cut = rng.randrange(len(word))
+            words[position] = word[:cut] + rng.choice("aeiousrt") + word[cut + 1:]
+    else:
+        words = [word.lower() for word in words]
+        words.insert(2, "NUEVO")
+    return " ".join(words)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--lines", type=int, default=100, help="Invoice lines per batch")
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    catalog = make_catalog(args.products, rng)
+
+    started = time.perf_counter()
+    reconciler = ProductReconciler(catalog)
+    build_seconds = time.perf_counter() - started
+
+    timings = []
+    found = total = 0
+    for _ in range(args.batches):
+        picks = [catalog[rng.randrange(len(catalog))] for _ in range(args.lines)]
+        lines = [perturb(nombre, rng) for _, _, nombre in picks]
+        started = time.perf_counter()
+        ranked = reconciler.rank(lines)
+        timings.append(time.perf_counter() - started)
+        found += sum(1 for (product_id, _, _), candidates in zip(picks, ranked)
+                     if candidates and candidates[0].product_id == product_id)
+        total += len(picks)
+
+    print(f"Catalog: {args.products} products, matrix built in {build_seconds * 1000:.0f} ms")
+    print(f"Batches of {args.lines} lines: median {statistics.median(timings) * 1000:.1f} ms, "
+          f"max {max(timings) * 1000:.1f} ms ({args.lines / statistics.median(timings):,.0f} lines/s)")
+    print(f"Original product ranked first: {found}/{total} ({found / total:.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+DIAN UBL parser throughput benchmark
+
+Generates a corpus of AttachedDocument XMLs (or uses a folder of real ones)
+and reports documents/s, MB/s and lines/s for ubl_parser.parse_ubl_invoice,
+plus the peak traced memory of the largest document, which should stay flat
+as documents grow.
+
+Usage (from backend/):
+    python benchmarks/bench_ubl_parser.py --documents 200 --lines 50 --large-lines 20000
+    python benchmarks/bench_ubl_parser.py --corpus /ruta/a/xmls
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ubl_parser import parse_ubl_invoice
+
+INVOICE_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<Invoice xmlns="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"
+    xmlns:cac="urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2"
+    xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2">
+    <cbc:ID>{numero}</cbc:ID>
+    <cbc:UUID schemeName="CUFE-SHA384">{cufe}</cbc:UUID>
+    <cbc:IssueDate>2024-10-24</cbc:IssueDate>
+    <cbc:IssueTime>17:40:49-05:00</cbc:IssueTime>
+    <cac:AccountingSupplierParty><cac:Party><cac:PartyTaxScheme>
+        <cbc:RegistrationName>PROVEEDOR BENCHMARK S.A.S</cbc:RegistrationName>
+        <cbc:CompanyID schemeID="7">900479120</cbc:CompanyID>
+    </cac:PartyTaxScheme></cac:Party></cac:AccountingSupplierParty>
+    <cac:TaxTotal><cbc:TaxAmount>{iva}</cbc:TaxAmount><cac:TaxSubtotal><cac:TaxCategory><cac:TaxScheme><cbc:ID>01</cbc:ID></cac:TaxScheme></cac:TaxCategory></cac:TaxSubtotal></cac:TaxTotal>
+    <cac:LegalMonetaryTotal><cbc:LineExtensionAmount>{subtotal}</cbc:LineExtensionAmount><cbc:PayableAmount>{total}</cbc:PayableAmount></cac:LegalMonetaryTotal>
+{lines}
+</Invoice>"""
+
+LINE_TEMPLATE = """    <cac:InvoiceLine>
+        <cbc:ID>{n}</cbc:ID>
+        <cbc:InvoicedQuantity unitCode="94">3.00</cbc:InvoicedQuantity>
+        <cbc:LineExtensionAmount>3000.00</cbc:LineExtensionAmount>
+        <cac:Item><cbc:Description>PRODUCTO DE PRUEBA {n}</cbc:Description>
+            <cac:SellersItemIdentification><cbc:ID>REF-{n}</cbc:ID></cac:SellersItemIdentification></cac:Item>
+        <cac:Price><cbc:PriceAmount>1000.00</cbc:PriceAmount></cac:Price>
+    </cac:InvoiceLine>"""
+
+ATTACHED_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<AttachedDocument xmlns="urn:oasis:names:specification:ubl:schema:xsd:AttachedDocument-2"
+    xmlns:cac="urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2"
+    xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2">
+    <cac:Attachment><cac:ExternalReference><cbc:MimeCode>text/xml</cbc:MimeCode>
+        <cbc:Description><![CDATA[{invoice}]]></cbc:Description>
+    </cac:ExternalReference></cac:Attachment>
+    <cac:ParentDocumentLineReference><cac:DocumentReference><cac:ResultOfVerification>
+        <cbc:ValidationDate>2024-10-24</cbc:ValidationDate><cbc:ValidationTime>17:41:23-05:00</cbc:ValidationTime>
+    </cac:ResultOfVerification></cac:DocumentReference></cac:ParentDocumentLineReference>
+</AttachedDocument>"""
+
+
+def make_document(numero: str, lines: int) -> bytes:
+    subtotal = 3000 * lines
+    invoice = INVOICE_TEMPLATE.format(
+        numero=numero,
+        cufe=f"{numero:0>96}",
+        iva=subtotal * 0.19,
+        subtotal=subtotal,
+        total=subtotal * 1.19,
+        lines="\n".join(LINE_TEMPLATE.format(n=n) for n in range(1, lines + 1)),
+    )
+    return ATTACHED_TEMPLATE.format(invoice=invoice).encode("utf-8")
+
+
+def write_corpus(directory: str, documents: int, lines: int):
+    for i in range(documents):
+        with open(os.path.join(directory, f"ad{i:06d}.xml"), "wb") as fh:
+            fh.write(make_document(f"FE{i}", lines))
+
+
+def bench_corpus(directory: str):
+    paths = sorted(
+        os.path.join(root, name)
+        for root, _, files in os.walk(directory) for name in files if name.lower().endswith(".xml")
+    )
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    start = time.perf_counter()
+    lines = sum(len(parse_ubl_invoice(path)["productos"]) for path in paths)
+    elapsed = time.perf_counter() - start
+    print(f"{len(paths)} documentos, {total_bytes / 1e6:.1f} MB, {lines} líneas en {elapsed:.2f}s")
+    print(f"  {len(paths) / elapsed:.0f} docs/s, {total_bytes / 1e6 / elapsed:.1f} MB/s, {lines / elapsed:.0f} líneas/s")
+
+
+def bench_memory(lines: int):
+    raw = make_document("FE-LARGE", lines)
+    path = os.path.join(tempfile.gettempdir(), "bench_ubl_large.xml")
+    with open(path, "wb") as fh:
+        fh.write(raw)
+    try:
+        tracemalloc.start()
+        data = parse_ubl_invoice(path)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        os.remove(path)
+    # The emitted dict itself grows with the lines; the parser state does not
+    print(f"Documento de {len(raw) / 1e6:.1f} MB ({len(data['productos'])} líneas): "
+          f"pico de memoria {peak / 1e6:.1f} MB ({peak / len(raw):.2f}x el tamaño del XML)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="folder of real XMLs (a synthetic corpus is generated otherwise)")
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=50, help="invoice lines per generated document")
+    parser.add_argument("--large-lines", type=int, default=20000, help="lines of the memory test document")
+    args = parser.parse_args()
+
+    if args.corpus:
+        bench_corpus(args.corpus)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            write_corpus(directory, args.documents, args.lines)
+            bench_corpus(directory)
+    bench_memory(args.large_lines)
+
+
+if __name__ == "__main__":
+    main()
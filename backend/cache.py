@@ -0,0 +1,199 @@
+"""
+In-Process Cache Module
+Bounded TTL caches with single-flight computation, hit/miss counters and
+invalidation driven by SQLAlchemy commits
+"""
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from typing import Callable, Hashable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Marker meaning "invalidate every key of this cache"
+ALL_KEYS = object()
+
+_PENDING_INFO_KEY = "pending_cache_invalidations"
+
+
+class _Flight:
+    """A computation in progress that concurrent callers wait on"""
+
+    def __init__(self, generation: int):
+        self.generation = generation
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire after ``ttl`` seconds.
+
+    ``get_or_compute`` coalesces concurrent misses for the same key: one caller
+    computes while the others wait for its result (single flight).
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 30.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def _lookup(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def _store(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value):
+        with self._lock:
+            self._store(key, value)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], object]):
+        """Return the cached value or compute it once, sharing the result with concurrent callers"""
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = self._inflight[key] = _Flight(self._generation)
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                # Do not cache a value computed before an invalidation
+                if flight.error is None and flight.generation == self._generation:
+                    self._store(key, flight.value)
+                self._inflight.pop(key, None)
+            flight.done.set()
+        return flight.value
+
+    def invalidate(self, key=ALL_KEYS):
+        """Drop one key, or every key when called without arguments"""
+        with self._lock:
+            self.invalidations += 1
+            self._generation += 1
+            if key is ALL_KEYS:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def reset(self):
+        """Drop all entries and counters"""
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+            self.hits = self.misses = self.coalesced = self.invalidations = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "invalidations": self.invalidations,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
+
+
+def _mark(session: Session, cache: TTLCache, key):
+    pending = session.info.setdefault(_PENDING_INFO_KEY, {})
+    keys = pending.setdefault(cache, set())
+    keys.add(key)
+
+
+def invalidate_on_commit(
+    cache: TTLCache, models: tuple, key_for: Optional[Callable] = None, when: Optional[Callable] = None
+):
+    """
+    Invalidate ``cache`` when a transaction that wrote any of ``models`` commits.
+
+    Objects flushed through the unit of work invalidate ``key_for(obj)`` (or
+    the whole cache when no ``key_for`` is given); ``when(obj)`` can skip new or
+    changed objects whose changes the cache does not depend on, deletions always
+    count. Bulk ORM insert/update/delete statements always invalidate the whole
+    cache. Rolled back writes are ignored.
+    """
+    models = tuple(models)
+
+    @event.listens_for(Session, "after_flush")
+    def _track_flush(session, flush_context):
+        for obj in chain(session.new, session.dirty, session.deleted):
+            if not isinstance(obj, models):
+                continue
+            if when is not None and obj not in session.deleted and not when(obj):
+                continue
+            _mark(session, cache, key_for(obj) if key_for else ALL_KEYS)
+
+    @event.listens_for(Session, "do_orm_execute")
+    def _track_bulk(orm_execute_state):
+        if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        if any(mapper.class_ in models for mapper in orm_execute_state.all_mappers):
+            _mark(orm_execute_state.session, cache, ALL_KEYS)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_invalidations(session):
+    pending = session.info.pop(_PENDING_INFO_KEY, None)
+    for cache, keys in (pending or {}).items():
+        if ALL_KEYS in keys:
+            cache.invalidate()
+        else:
+            for key in keys:
+                cache.invalidate(key)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_invalidations(session):
+    session.info.pop(_PENDING_INFO_KEY, None)
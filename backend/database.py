@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, inspect, text, MetaData
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -38,9 +38,64 @@ def get_db():
     finally:
         db.close()
 
+# Columns added to existing tables after their first release; create_all does not
+# alter tables that already exist, so these are added in place on startup
+ADDED_COLUMNS = {
+    "users": ["token_version"],
+    "purchase_invoices": ["idempotency_key"],
+    "supplier_products": ["supplier_ref"],
+}
+
+# Indexes (by name) added to existing tables after their first release
+ADDED_INDEXES = {
+    "purchase_invoices": ["ix_purchase_invoices_cufe", "ix_purchase_invoices_idempotency_key"],
+    "sales": ["ix_sales_created_at"],
+    "inventory_movements": ["ix_inventory_movements_created_at"],
+    "supplier_products": ["ix_supplier_products_supplier_ref"],
+}
+
+def add_missing_columns(bind=engine):
+    """Add ADDED_COLUMNS missing from existing tables (NOT NULL ones must have a server default)"""
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table_name, column_names in ADDED_COLUMNS.items():
+            if not inspector.has_table(table_name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table_name)}
+            table = Base.metadata.tables[table_name]
+            for name in column_names:
+                if name in existing:
+                    continue
+                column = table.c[name]
+                column_type = column.type.compile(dialect=bind.dialect)
+                default = f" DEFAULT {column.server_default.arg}" if column.server_default is not None else ""
+                nullability = "" if column.nullable else " NOT NULL"
+                conn.execute(text(
+                    f"ALTER TABLE {table_name} ADD COLUMN {name} {column_type}{default}{nullability}"
+                ))
+    add_missing_indexes(bind)
+
+def add_missing_indexes(bind=engine):
+    """Create ADDED_INDEXES missing from existing tables"""
+    inspector = inspect(bind)
+    for table_name, index_names in ADDED_INDEXES.items():
+        if not inspector.has_table(table_name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table_name)}
+        for index in Base.metadata.tables[table_name].indexes:
+            if index.name not in index_names or index.name in existing:
+                continue
+            try:
+                with bind.begin() as conn:
+                    index.create(conn)
+            except Exception as e:
+                # e.g. duplicated CUFEs stored before the unique index existed
+                print(f"⚠️ No se pudo crear el índice {index.name}: {e}")
+
 # Create all tables
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
 
 # Drop all tables (for development)
 def drop_tables():
@@ -0,0 +1,138 @@
+"""
+Export Module
+Streams sales, sale items and inventory movements as CSV or NDJSON
+without materializing the result set in memory
+"""
+import csv
+import enum
+import io
+import json
+import zlib
+from datetime import date, datetime, timedelta
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import (
+    Sale as SaleModel,
+    SaleItem as SaleItemModel,
+    InventoryMovement as InventoryMovementModel,
+    Product as ProductModel
+)
+
+# Rows fetched per round trip from the (server-side) cursor
+EXPORT_BATCH_SIZE = 1000
+
+
+class ExportDataset(str, enum.Enum):
+    SALES = "sales"
+    SALE_ITEMS = "sale-items"
+    INVENTORY_MOVEMENTS = "inventory-movements"
+
+
+class ExportFormat(str, enum.Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
+MEDIA_TYPES = {
+    ExportFormat.CSV: "text/csv",
+    ExportFormat.NDJSON: "application/x-ndjson",
+}
+
+
+def build_export_query(dataset: ExportDataset, desde: Optional[date] = None, hasta: Optional[date] = None):
+    """Column-only SELECT for a dataset, filtered by an inclusive date range"""
+    if dataset == ExportDataset.SALES:
+        stmt = select(
+            SaleModel.id, SaleModel.numero_venta, SaleModel.created_at, SaleModel.client_id,
+            SaleModel.user_id, SaleModel.subtotal, SaleModel.descuento, SaleModel.impuestos,
+            SaleModel.total, SaleModel.metodo_pago, SaleModel.status
+        )
+        date_column, id_column = SaleModel.created_at, SaleModel.id
+    elif dataset == ExportDataset.SALE_ITEMS:
+        stmt = select(
+            SaleItemModel.id, SaleModel.numero_venta, SaleModel.created_at,
+            ProductModel.codigo.label("producto_codigo"), SaleItemModel.product_id,
+            SaleItemModel.cantidad, SaleItemModel.precio_unitario, SaleItemModel.descuento,
+            SaleItemModel.subtotal
+        ).join(SaleModel, SaleItemModel.sale_id == SaleModel.id).join(
+            ProductModel, SaleItemModel.product_id == ProductModel.id
+        )
+        date_column, id_column = SaleModel.created_at, SaleItemModel.id
+    else:
+        stmt = select(
+            InventoryMovementModel.id, InventoryMovementModel.created_at,
+            ProductModel.codigo.label("producto_codigo"), InventoryMovementModel.product_id,
+            InventoryMovementModel.user_id, InventoryMovementModel.tipo, InventoryMovementModel.cantidad,
+            InventoryMovementModel.stock_anterior, InventoryMovementModel.stock_nuevo,
+            InventoryMovementModel.motivo, InventoryMovementModel.referencia
+        ).join(ProductModel, InventoryMovementModel.product_id == ProductModel.id)
+        date_column, id_column = InventoryMovementModel.created_at, InventoryMovementModel.id
+
+    if desde:
+        stmt = stmt.where(date_column >= datetime.combine(desde, datetime.min.time()))
+    if hasta:
+        stmt = stmt.where(date_column < datetime.combine(hasta + timedelta(days=1), datetime.min.time()))
+    return stmt.order_by(id_column)
+
+
+def _plain(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _encode_csv(columns, rows, include_header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if include_header:
+        writer.writerow(columns)
+    writer.writerows([["" if v is None else _plain(v) for v in row] for row in rows])
+    return buffer.getvalue().encode("utf-8")
+
+
+def _encode_ndjson(columns, rows) -> bytes:
+    return "".join(
+        json.dumps({c: _plain(v) for c, v in zip(columns, row)}, ensure_ascii=False) + "\n"
+        for row in rows
+    ).encode("utf-8")
+
+
+def stream_export(db: Session, stmt, export_format: ExportFormat, compress: bool = False) -> Iterator[bytes]:
+    """
+    Yield the encoded export chunk by chunk.
+    Rows are fetched EXPORT_BATCH_SIZE at a time (yield_per uses a server-side
+    cursor where the driver supports it), so memory stays flat.
+    """
+    result = db.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    columns = list(result.keys())
+    compressor = zlib.compressobj(wbits=31) if compress else None  # gzip container
+
+    def emit(chunk: bytes) -> bytes:
+        return compressor.compress(chunk) if compressor else chunk
+
+    if export_format == ExportFormat.CSV:
+        yield emit(_encode_csv(columns, [], include_header=True))
+    for partition in result.partitions():
+        if export_format == ExportFormat.CSV:
+            chunk = _encode_csv(columns, partition, include_header=False)
+        else:
+            chunk = _encode_ndjson(columns, partition)
+        data = emit(chunk)
+        if data:
+            yield data
+    if compressor:
+        yield compressor.flush()
+
+
+def export_filename(dataset: ExportDataset, export_format: ExportFormat, desde, hasta, compress: bool) -> str:
+    parts = [dataset.value.replace("-", "_")]
+    if desde:
+        parts.append(desde.isoformat())
+    if hasta:
+        parts.append(hasta.isoformat())
+    return "_".join(parts) + f".{export_format.value}" + (".gz" if compress else "")
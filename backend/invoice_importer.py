@@ -0,0 +1,303 @@
+"""
+Bulk Invoice Importer
+Processes a folder or zip of supplier invoice JSON files (same format as
+extracted_invoice_data.json) or DIAN XML invoices, optionally with a PDF of
+the same name, through
+InvoiceProcessor on a worker pool, one transaction per invoice
+"""
+import asyncio
+import io
+import json
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, UploadFile
+from sqlalchemy.orm import Session
+
+from invoice_processor import InvoiceProcessor
+from models import Supplier as SupplierModel
+from product_matching import ProductMatchIndex, normalize_name
+from product_reconciliation import RECONCILE_AUTO_APPLY, ProductReconciler
+from schemas import InvoiceImportResult, InvoiceImportSummary
+from supplier_aliases import get_aliases
+from ubl_parser import UBLParseError, parse_ubl_invoice
+
+load_dotenv()
+
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "4"))
+
+INVOICE_EXTENSIONS = (".json", ".xml")
+
+
+@dataclass
+class ImportSource:
+    """One invoice to import: parsed JSON plus its optional PDF"""
+    name: str
+    data: Optional[Dict] = None
+    pdf: Optional[bytes] = None
+    error: Optional[str] = None
+
+    @property
+    def numero_factura(self) -> Optional[str]:
+        try:
+            return str(self.data["factura"]["numero"]).strip()
+        except (KeyError, TypeError):
+            return None
+
+    def sort_key(self):
+        factura = (self.data or {}).get("factura")
+        fecha = str(factura.get("fecha", "")) if isinstance(factura, dict) else ""
+        return (fecha, self.numero_factura or "", self.name)
+
+
+def _source(name: str, raw: bytes, pdf: Optional[bytes]) -> ImportSource:
+    if name.lower().endswith(".xml"):
+        try:
+            return ImportSource(name=name, data=parse_ubl_invoice(raw), pdf=pdf)
+        except UBLParseError as e:
+            return ImportSource(name=name, error=str(e))
+    try:
+        data = json.loads(raw)
+        if not isinstance(data, dict) or not {"proveedor", "factura", "productos", "totales"} <= data.keys():
+            return ImportSource(name=name, error="JSON sin las secciones proveedor/factura/productos/totales")
+        return ImportSource(name=name, data=data, pdf=pdf)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        return ImportSource(name=name, error=f"JSON inválido: {e}")
+
+
+def load_zip(fileobj) -> List[ImportSource]:
+    """Read invoice JSON/XML files (and PDFs with the same stem) from a zip archive"""
+    with zipfile.ZipFile(fileobj) as archive:
+        members = {info.filename: info for info in archive.infolist() if not info.is_dir()}
+        pdfs = {os.path.splitext(name)[0].lower(): name for name in members if name.lower().endswith(".pdf")}
+        sources = []
+        for name in sorted(members):
+            if not name.lower().endswith(INVOICE_EXTENSIONS):
+                continue
+            pdf_name = pdfs.get(os.path.splitext(name)[0].lower())
+            sources.append(_source(name, archive.read(name), archive.read(pdf_name) if pdf_name else None))
+    return sources
+
+
+def load_sources(path: str) -> List[ImportSource]:
+    """Read invoices from a directory (recursively) or a .zip file"""
+    if zipfile.is_zipfile(path):
+        with open(path, "rb") as fh:
+            return load_zip(fh)
+
+    sources = []
+    for root, _, files in os.walk(path):
+        by_stem = {os.path.splitext(f)[0].lower(): f for f in files if f.lower().endswith(".pdf")}
+        for filename in sorted(files):
+            if not filename.lower().endswith(INVOICE_EXTENSIONS):
+                continue
+            with open(os.path.join(root, filename), "rb") as fh:
+                raw = fh.read()
+            pdf = None
+            pdf_name = by_stem.get(os.path.splitext(filename)[0].lower())
+            if pdf_name:
+                with open(os.path.join(root, pdf_name), "rb") as fh:
+                    pdf = fh.read()
+            sources.append(_source(os.path.relpath(os.path.join(root, filename), path), raw, pdf))
+    return sources
+
+
+def plan_waves(db: Session, sources: List[ImportSource]) -> List[List[ImportSource]]:
+    """
+    Split invoices (in date/number order) into waves that run one after another.
+
+    Lines are resolved with the processor's own precedence (supplier alias,
+    catalog match, then a confident fuzzy match from the reconciliation engine
+    when RECONCILE_AUTO_APPLY is enabled), simulating the products and aliases earlier invoices will create. An
+    invoice goes into the wave after the last one touching any of its products,
+    aliases or invoice number, so invoices running together never share a
+    product and every product's stock movements follow invoice order.
+    """
+    index = ProductMatchIndex.load(db)
+    reconciler = ProductReconciler.load(db) if RECONCILE_AUTO_APPLY else None
+    supplier_ids = dict(db.query(SupplierModel.nit, SupplierModel.id))
+    aliases: Dict[int, Dict[str, int]] = {}
+    next_new_id = -1
+    last_wave: Dict[object, int] = {}
+    waves: List[List[ImportSource]] = []
+
+    for source in sources:
+        keys = {("factura", source.numero_factura)}
+        proveedor = source.data.get("proveedor")
+        supplier_id = supplier_ids.get(str(proveedor.get("nit", "")).strip()) if isinstance(proveedor, dict) else None
+        if supplier_id is not None and supplier_id not in aliases:
+            aliases[supplier_id] = dict(get_aliases(db, supplier_id))
+        supplier_aliases = aliases.get(supplier_id, {})
+        lines = source.data.get("productos")
+        lines = [
+            (str(line.get("referencia") or "").strip(), str(line.get("nombre") or "").strip())
+            for line in (lines if isinstance(lines, list) else []) if isinstance(line, dict)
+        ]
+        # Fuzzy matches are computed up front for the whole invoice, like the processor does
+        suggestions = {}
+        if reconciler is not None:
+            unmatched = [
+                position for position, (referencia, nombre) in enumerate(lines)
+                if nombre and referencia not in supplier_aliases and index.match(referencia, nombre) is None
+            ]
+            suggestions = dict(zip(unmatched, reconciler.best_matches([lines[position][1] for position in unmatched])))
+
+        for position, (referencia, nombre) in enumerate(lines):
+            product_id = supplier_aliases.get(referencia) if referencia else None
+            if product_id is None:
+                product_id = index.match(referencia, nombre)
+            if product_id is None:
+                product_id = suggestions.get(position)
+            if product_id is None:
+                product_id, next_new_id = next_new_id, next_new_id - 1
+                index.add(product_id, referencia or None, nombre)
+                if reconciler is not None:
+                    reconciler.add(product_id, referencia or None, nombre)
+            keys.add(("product", product_id))
+            if referencia and supplier_id is not None and position not in suggestions:
+                # The invoice learns this alias; later invoices resolve through it
+                supplier_aliases[referencia] = product_id
+                keys.add(("alias", supplier_id, referencia))
+            # Lines that would match by name alone still share the normalized name
+            if nombre:
+                keys.add(("nombre", normalize_name(nombre)))
+
+        wave = max((last_wave[key] + 1 for key in keys if key in last_wave), default=0)
+        for key in keys:
+            last_wave[key] = wave
+        if wave == len(waves):
+            waves.append([])
+        waves[wave].append(source)
+    return waves
+
+
+def _sync_suppliers(db: Session, sources: List[ImportSource], current_user):
+    # Create/update each supplier once, up front and in order, so that parallel
+    # invoices of the same supplier neither race to create it nor update it
+    processor = InvoiceProcessor(db, current_user)
+    for source in sources:
+        try:
+            processor.find_or_create_supplier(source.data["proveedor"])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            pass  # Reported by the invoice itself
+    db.commit()
+
+
+def _process_one(source: ImportSource, wave: int, current_user, session_factory) -> InvoiceImportResult:
+    start = time.perf_counter()
+    result = InvoiceImportResult(file=source.name, status="ERROR", numero_factura=source.numero_factura, wave=wave)
+    db = session_factory()
+    try:
+        processor = InvoiceProcessor(db, current_user)
+        archivo_pdf = None
+        if source.pdf is not None:
+            pdf = UploadFile(file=io.BytesIO(source.pdf), filename=os.path.basename(source.name))
+            archivo_pdf = asyncio.run(processor.save_pdf(pdf, source.numero_factura))
+        # Already on a pool thread: the database phase runs here directly
+        invoice = processor.process_invoice_blocking(source.data, archivo_pdf)
+        result.status = "DUPLICADA" if processor.replayed else "PROCESADA"
+        result.invoice_id = invoice.id
+        if processor.replayed:
+            result.detail = "Factura ya registrada (mismo CUFE)"
+    except HTTPException as e:
+        result.status = "DUPLICADA" if e.status_code == 400 else "ERROR"
+        result.detail = str(e.detail)
+    except Exception as e:
+        result.detail = str(e)
+    finally:
+        db.close()
+    result.seconds = round(time.perf_counter() - start, 4)
+    return result
+
+
+def import_invoices(
+    sources: List[ImportSource],
+    current_user,
+    session_factory: Callable[[], Session],
+    workers: int = IMPORT_WORKERS,
+    on_progress: Optional[Callable[[int, int, InvoiceImportResult], None]] = None,
+) -> InvoiceImportSummary:
+    """Import invoices wave by wave; invoices inside a wave run in parallel, each in its own transaction"""
+    start = time.perf_counter()
+    total = len(sources)
+    results: List[InvoiceImportResult] = []
+
+    def report(result: InvoiceImportResult):
+        results.append(result)
+        if on_progress:
+            on_progress(len(results), total, result)
+
+    for source in sources:
+        if source.error:
+            report(InvoiceImportResult(file=source.name, status="ERROR", detail=source.error))
+    valid = sorted((s for s in sources if not s.error), key=ImportSource.sort_key)
+
+    waves = []
+    if valid:
+        db = session_factory()
+        try:
+            _sync_suppliers(db, valid, current_user)
+            waves = plan_waves(db, valid)
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="invoice-import") as pool:
+        for wave_number, wave in enumerate(waves):
+            futures = [pool.submit(_process_one, source, wave_number, current_user, session_factory) for source in wave]
+            for future in futures:
+                report(future.result())
+
+    elapsed = time.perf_counter() - start
+    processed = sum(1 for r in results if r.status == "PROCESADA")
+    return InvoiceImportSummary(
+        total=total,
+        processed=processed,
+        duplicates=sum(1 for r in results if r.status == "DUPLICADA"),
+        failed=sum(1 for r in results if r.status == "ERROR"),
+        workers=max(1, workers),
+        waves=len(waves),
+        elapsed_seconds=round(elapsed, 3),
+        invoices_per_second=round(processed / elapsed, 2) if elapsed > 0 else 0.0,
+        results=results,
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from auth import UserPrincipal
+    from database import SessionLocal, create_tables
+    from models import User
+
+    parser = argparse.ArgumentParser(description="Import a folder or zip of invoice JSON/XML files")
+    parser.add_argument("path", help="Folder or .zip with invoice JSON or DIAN XML files (and optional PDFs)")
+    parser.add_argument("--username", default="admin", help="User recorded on the inventory movements")
+    parser.add_argument("--workers", type=int, default=IMPORT_WORKERS)
+    args = parser.parse_args()
+
+    create_tables()
+    db = SessionLocal()
+    user = db.query(User).filter(User.username == args.username).first()
+    db.close()
+    if user is None:
+        print(f"❌ Usuario '{args.username}' no encontrado")
+        raise SystemExit(1)
+
+    sources = load_sources(args.path)
+    print(f"📦 {len(sources)} facturas encontradas en {args.path}")
+
+    def progress(done, total, result):
+        icon = {"PROCESADA": "✅", "DUPLICADA": "⚠️"}.get(result.status, "❌")
+        print(f"[{done}/{total}] {icon} {result.file} {result.numero_factura or ''} {result.detail or ''}")
+
+    summary = import_invoices(
+        sources, UserPrincipal.from_user(user), SessionLocal, workers=args.workers, on_progress=progress
+    )
+    print(f"\n✅ {summary.processed} procesadas, ⚠️ {summary.duplicates} duplicadas, ❌ {summary.failed} con error")
+    print(f"⏱️ {summary.elapsed_seconds}s en {summary.waves} olas con {summary.workers} workers "
+          f"({summary.invoices_per_second} facturas/s)")
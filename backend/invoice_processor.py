@@ -2,12 +2,14 @@
 Invoice Processing Module
 Handles automatic extraction and processing of purchase invoices
 """
-import os
-import shutil
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import case, insert, or_, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from fastapi import UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
 
 from models import (
     Supplier as SupplierModel,
@@ -20,27 +22,45 @@ from models import (
     PurchaseInvoiceStatus,
     ProductCategory
 )
+from product_matching import ProductMatchIndex
+from product_reconciliation import RECONCILE_AUTO_APPLY, get_reconciler
+from supplier_aliases import get_aliases, learn_aliases
+from storage import ContentStore, invoice_pdf_store
+
+
+class InvoiceConflict(HTTPException):
+    """A concurrent transaction created a row this invoice needed (supplier, product); safe to retry"""
+
+    def __init__(self, numero_factura: str):
+        super().__init__(status_code=409, detail=f"Conflicto al registrar la factura {numero_factura}")
 
 
 class InvoiceProcessor:
     """Process purchase invoices and update inventory"""
     
-    def __init__(self, db: Session, current_user: UserModel):
+    def __init__(self, db: Session, current_user: UserModel, pdf_store: Optional[ContentStore] = None):
         self.db = db
         self.current_user = current_user
-        self.upload_dir = "uploads/invoices"
-        os.makedirs(self.upload_dir, exist_ok=True)
+        self.pdf_store = pdf_store or invoice_pdf_store
+        self._product_index: Optional[ProductMatchIndex] = None
+        # Products the invoice lines resolve to, loaded together (see load_line_products)
+        self._line_products: Dict[int, ProductModel] = {}
+        # True when the last process_invoice returned an invoice stored by an earlier submission
+        self.replayed = False
+
+    @property
+    def product_index(self) -> ProductMatchIndex:
+        """Catalog match index, loaded once per processor (i.e. per invoice)"""
+        if self._product_index is None:
+            self.db.flush()  # The index must see products changed earlier in this invoice
+            self._product_index = ProductMatchIndex.load(self.db)
+        return self._product_index
     
     async def save_pdf(self, file: UploadFile, numero_factura: str) -> str:
-        """Save uploaded PDF file"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{numero_factura}_{timestamp}.pdf"
-        filepath = os.path.join(self.upload_dir, filename)
-        
-        with open(filepath, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        return filepath
+        """Save uploaded PDF file; returns its content key (re-uploads share one copy)"""
+        key = await self.pdf_store.save(file)
+        print(f"📎 PDF de la factura {numero_factura} guardado: {key}")
+        return key
     
     def find_or_create_supplier(self, supplier_data: Dict) -> SupplierModel:
         """Find existing supplier by NIT or create new one"""
@@ -85,7 +105,7 @@ class InvoiceProcessor:
                 updated = True
 
             if updated:
-                self.db.commit()
+                self.db.flush()
                 print(f"📝 Proveedor actualizado: {supplier.razon_social} (NIT: {nit})")
 
             return supplier
@@ -103,37 +123,36 @@ class InvoiceProcessor:
         )
 
         self.db.add(new_supplier)
-        self.db.commit()
-        self.db.refresh(new_supplier)
+        self.db.flush()  # Get supplier ID; committed with the invoice
 
         print(f"✅ Proveedor nuevo creado: {new_supplier.razon_social} (NIT: {nit})")
 
         return new_supplier
     
-    def find_or_create_product(self, product_data: Dict, update_price: bool = True) -> ProductModel:
-        """Find existing product by reference/code or create new one"""
+    def find_or_create_product(
+        self,
+        product_data: Dict,
+        update_price: bool = True,
+        product_id: Optional[int] = None,
+        suggested_id: Optional[int] = None
+    ) -> ProductModel:
+        """
+        Find existing product by reference/code or create new one.
+        ``product_id`` is the product the supplier's reference is known to map to;
+        ``suggested_id`` the closest catalog name, used when nothing matches exactly.
+        """
         referencia = product_data.get("referencia", "").strip()
         nombre = product_data.get("nombre", "").strip()
         precio_compra = product_data.get("precio_unitario", 0)
 
-        # Try to find by reference (exact match)
-        product = None
-        if referencia:
-            product = self.db.query(ProductModel).filter(
-                ProductModel.codigo == referencia
-            ).first()
-
-        # If not found by code, try to find by exact name match
-        if not product and nombre:
-            product = self.db.query(ProductModel).filter(
-                ProductModel.nombre.ilike(nombre)
-            ).first()
-
-        # If not found, try to find by similar name (first 30 chars)
-        if not product and len(nombre) > 10:
-            product = self.db.query(ProductModel).filter(
-                ProductModel.nombre.ilike(f"%{nombre[:30]}%")
-            ).first()
+        product = self.get_product(product_id) if product_id is not None else None
+        if product is None:
+            # Exact reference, then exact name, then similar name (first 30 chars), all in memory
+            product_id = self.product_index.match(referencia, nombre)
+            if product_id is None:
+                product_id = suggested_id
+            if product_id is not None:
+                product = self.get_product(product_id)
 
         if product:
             # Update existing product
@@ -152,10 +171,12 @@ class InvoiceProcessor:
             # Update product code if it was missing
             if not product.codigo or product.codigo.startswith("AUTO-"):
                 if referencia:
+                    if self._product_index is not None:
+                        self._product_index.set_codigo(product.id, product.codigo, referencia)
                     product.codigo = referencia
                     print(f"📝 Código actualizado para '{product.nombre}': {referencia}")
 
-            self.db.commit()
+            # Changes are flushed with the rest of the invoice
             return product
 
         # Create new product
@@ -174,78 +195,185 @@ class InvoiceProcessor:
         )
 
         self.db.add(new_product)
-        self.db.commit()
-        self.db.refresh(new_product)
+        self.db.flush()  # Get product ID; committed with the invoice
+        self.product_index.add(new_product.id, new_product.codigo, new_product.nombre)
 
         print(f"✅ Producto nuevo creado: '{nombre}' (Ref: {new_product.codigo})")
 
         return new_product
     
-    def update_inventory(
-        self, 
-        product: ProductModel, 
-        cantidad: int, 
-        referencia: str
-    ) -> InventoryMovementModel:
-        """Update product inventory and create movement record"""
-        old_stock = product.stock_actual
-        product.stock_actual += cantidad
-        
-        movement = InventoryMovementModel(
-            product_id=product.id,
-            user_id=self.current_user.id,
-            tipo=MovementType.ENTRADA,
-            cantidad=cantidad,
-            stock_anterior=old_stock,
-            stock_nuevo=product.stock_actual,
-            motivo=f"Compra - Factura {referencia}",
-            referencia=referencia
+    def reconcile_unmatched(self, lines: List[Dict], aliases: Dict[str, int]) -> Dict[int, int]:
+        """
+        Confident fuzzy matches (line number -> product id) for the lines that no
+        alias, code or name matches, scored in one batch by the reconciliation engine.
+        Empty unless RECONCILE_AUTO_APPLY is enabled.
+        """
+        if not RECONCILE_AUTO_APPLY:
+            return {}
+        unmatched = {}
+        for line_number, line in enumerate(lines, 1):
+            referencia = str(line.get("referencia") or "").strip()
+            nombre = str(line.get("nombre") or "").strip()
+            if nombre and referencia not in aliases and self.product_index.match(referencia, nombre) is None:
+                unmatched[line_number] = nombre
+        if not unmatched:
+            return {}
+
+        matches = get_reconciler(self.db).best_matches(list(unmatched.values()))
+        suggestions = {
+            line_number: product_id
+            for line_number, product_id in zip(unmatched, matches) if product_id is not None
+        }
+        if suggestions:
+            print(f"  🔎 {len(suggestions)} líneas reconciliadas por similitud de nombre")
+        return suggestions
+
+    def load_line_products(self, lines: List[Dict], aliases: Dict[str, int], suggestions: Dict[int, int]):
+        """
+        Load the existing products the lines resolve to (alias, catalog match or
+        fuzzy suggestion) in one query, so find_or_create_product does not query
+        once per line. They are kept here: the session only holds weak references.
+        """
+        product_ids = set(suggestions.values())
+        for line in lines:
+            referencia = str(line.get("referencia") or "").strip()
+            if referencia in aliases:
+                product_ids.add(aliases[referencia])
+            else:
+                product_id = self.product_index.match(referencia, str(line.get("nombre") or "").strip())
+                if product_id is not None:
+                    product_ids.add(product_id)
+        self._line_products = {
+            product.id: product
+            for product in self.db.query(ProductModel).filter(ProductModel.id.in_(product_ids))
+        } if product_ids else {}
+
+    def add_stock(self, quantities: Dict[int, int]) -> Dict[int, int]:
+        """
+        Add received units to every product in a single UPDATE relative to the
+        stored stock (like sales subtract theirs), so sales committing meanwhile
+        are never overwritten. Returns the new stock by product id.
+        """
+        if not quantities:
+            return {}
+        cantidad = case(quantities, value=ProductModel.id)
+        return dict(self.db.execute(
+            update(ProductModel)
+            .where(ProductModel.id.in_(list(quantities)))
+            .values(stock_actual=ProductModel.stock_actual + cantidad)
+            .returning(ProductModel.id, ProductModel.stock_actual)
+            .execution_options(synchronize_session=False)
+        ).all())
+
+    def get_product(self, product_id: int) -> Optional[ProductModel]:
+        """Product by id, from the loaded line products when possible"""
+        product = self._line_products.get(product_id)
+        return product if product is not None else self.db.get(ProductModel, product_id)
+
+    def rollback(self):
+        """Discard the invoice transaction, including products created for it"""
+        self.db.rollback()
+        self._product_index = None
+
+    def find_existing_invoice(
+        self, numero_factura: str, cufe: Optional[str], idempotency_key: Optional[str]
+    ) -> Optional[PurchaseInvoiceModel]:
+        """Invoice already stored with this number, CUFE or idempotency key (one indexed lookup)"""
+        conditions = [PurchaseInvoiceModel.numero_factura == numero_factura]
+        if cufe:
+            conditions.append(PurchaseInvoiceModel.cufe == cufe)
+        if idempotency_key:
+            conditions.append(PurchaseInvoiceModel.idempotency_key == idempotency_key)
+        matches = self.db.query(PurchaseInvoiceModel).filter(or_(*conditions)).limit(3).all()
+        # Prefer the row the submission identifies itself with over a number clash
+        return min(
+            matches,
+            key=lambda invoice: (
+                not (idempotency_key and invoice.idempotency_key == idempotency_key),
+                not (cufe and invoice.cufe == cufe),
+            ),
+            default=None,
         )
-        
-        self.db.add(movement)
-        return movement
-    
+
+    def _replay_or_reject(
+        self, existing: PurchaseInvoiceModel, numero_factura: str, cufe: Optional[str], idempotency_key: Optional[str]
+    ) -> PurchaseInvoiceModel:
+        # A retry of a stored submission returns the stored invoice untouched
+        if idempotency_key and existing.idempotency_key == idempotency_key:
+            if existing.numero_factura != numero_factura:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"La clave de idempotencia ya se usó para la factura {existing.numero_factura}"
+                )
+            self.replayed = True
+            return existing
+        if cufe and existing.cufe == cufe:
+            self.replayed = True
+            return existing
+        raise HTTPException(
+            status_code=400,
+            detail=f"La factura {numero_factura} ya existe en el sistema. No se pueden registrar facturas duplicadas."
+        )
+
     async def process_invoice(
         self,
         invoice_data: Dict,
-        pdf_file: Optional[UploadFile] = None
+        pdf_file: Optional[UploadFile] = None,
+        idempotency_key: Optional[str] = None,
+        on_progress: Optional[Callable[[int, int], None]] = None
+    ) -> PurchaseInvoiceModel:
+        """
+        Store the PDF (if any), then run process_invoice_blocking in the
+        threadpool so no database work happens on the event loop
+        """
+        archivo_pdf = None
+        if pdf_file:
+            factura = invoice_data.get("factura") if isinstance(invoice_data, dict) else None
+            numero_factura = str(factura.get("numero", "")).strip() if isinstance(factura, dict) else ""
+            archivo_pdf = await self.save_pdf(pdf_file, numero_factura)
+        return await run_in_threadpool(
+            self.process_invoice_blocking, invoice_data, archivo_pdf, idempotency_key, on_progress
+        )
+
+    def process_invoice_blocking(
+        self,
+        invoice_data: Dict,
+        archivo_pdf: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
+        on_progress: Optional[Callable[[int, int], None]] = None
     ) -> PurchaseInvoiceModel:
         """
-        Process complete invoice: create/update supplier, products, and inventory
+        Process complete invoice: create/update supplier, products, and inventory.
+        Everything runs in one transaction (flushes only, a single commit at the end).
+
+        Submitting an invoice whose CUFE or idempotency key is already stored
+        returns the stored invoice (``self.replayed`` is set) without touching
+        suppliers, products or stock; another invoice with the same number is
+        rejected.
 
         Args:
             invoice_data: Dictionary with invoice information
-            pdf_file: Optional PDF file upload
+            archivo_pdf: Content key of the invoice PDF, already in the store
+            idempotency_key: Optional client key identifying the submission
+            on_progress: Optional callback(lines_done, total_lines)
 
         Returns:
-            Created PurchaseInvoiceModel
+            Created (or previously stored) PurchaseInvoiceModel
         """
+        self.replayed = False
         try:
             numero_factura = invoice_data["factura"]["numero"].strip()
+            cufe = (invoice_data["factura"].get("cufe") or "").strip() or None
 
-            # 0. Check for duplicate invoice
-            existing_invoice = self.db.query(PurchaseInvoiceModel).filter(
-                PurchaseInvoiceModel.numero_factura == numero_factura
-            ).first()
-
+            # 0. Check for duplicate invoice or repeated submission
+            existing_invoice = self.find_existing_invoice(numero_factura, cufe, idempotency_key)
             if existing_invoice:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"La factura {numero_factura} ya existe en el sistema. No se pueden registrar facturas duplicadas."
-                )
+                return self._replay_or_reject(existing_invoice, numero_factura, cufe, idempotency_key)
 
             # 1. Find or create supplier
             supplier = self.find_or_create_supplier(invoice_data["proveedor"])
 
-            # 2. Save PDF if provided
-            archivo_pdf = None
-            if pdf_file:
-                archivo_pdf = await self.save_pdf(
-                    pdf_file,
-                    numero_factura
-                )
-
-            # 3. Create purchase invoice
+            # 2. Create purchase invoice
             fecha_emision = datetime.strptime(
                 invoice_data["factura"]["fecha"],
                 "%Y-%m-%d"
@@ -264,7 +392,8 @@ class InvoiceProcessor:
                 numero_factura=numero_factura,
                 supplier_id=supplier.id,
                 fecha_emision=fecha_emision,
-                cufe=invoice_data["factura"].get("cufe"),
+                cufe=cufe,
+                idempotency_key=idempotency_key,
                 fecha_aceptacion=fecha_aceptacion,
                 firma_digital=invoice_data["factura"].get("firma_digital"),
                 subtotal=invoice_data["totales"]["subtotal"],
@@ -279,31 +408,83 @@ class InvoiceProcessor:
 
             print(f"📄 Procesando factura {numero_factura} del proveedor {supplier.razon_social}")
 
-            # 4. Process each product
-            for product_data in invoice_data["productos"]:
-                # Find or create product
-                product = self.find_or_create_product(product_data)
-
-                # Create invoice item
-                invoice_item = PurchaseInvoiceItemModel(
-                    purchase_invoice_id=purchase_invoice.id,
-                    product_id=product.id,
-                    cantidad=product_data["cantidad"],
-                    precio_unitario=product_data["precio_unitario"],
-                    subtotal=product_data["total"]
-                )
-                self.db.add(invoice_item)
+            # 3. Process each product: resolve products and stock in memory,
+            # then bulk insert items and inventory movements
+            items = []
+            movements = []
+            resolved = []
+            products: Dict[int, ProductModel] = {}
+            total_lines = len(invoice_data["productos"])
 
-                # Update inventory
-                self.update_inventory(
-                    product,
-                    product_data["cantidad"],
-                    purchase_invoice.numero_factura
-                )
+            # Lines with a reference this supplier used before resolve through the
+            # alias map, the rest through the catalog index
+            aliases = get_aliases(self.db, supplier.id)
 
-                print(f"  ➕ {product.nombre}: +{product_data['cantidad']} unidades (Stock: {product.stock_actual})")
+            # Lines nothing matches exactly are reconciled against the catalog in one batch
+            suggestions = self.reconcile_unmatched(invoice_data["productos"], aliases)
+            self.load_line_products(invoice_data["productos"], aliases, suggestions)
 
-            # 5. Commit all changes
+            for line_number, product_data in enumerate(invoice_data["productos"], 1):
+                # Find or create product
+                referencia = str(product_data.get("referencia") or "").strip()
+                product = self.find_or_create_product(
+                    product_data, product_id=aliases.get(referencia), suggested_id=suggestions.get(line_number)
+                )
+                cantidad = product_data["cantidad"]
+                if line_number not in suggestions:
+                    # Fuzzy matches are never learned as aliases: a wrong one would stick
+                    resolved.append((referencia, product.id, product_data.get("precio_unitario", 0)))
+
+                items.append({
+                    "purchase_invoice_id": purchase_invoice.id,
+                    "product_id": product.id,
+                    "cantidad": cantidad,
+                    "precio_unitario": product_data["precio_unitario"],
+                    "subtotal": product_data["total"]
+                })
+
+                # Stock is added below in one atomic UPDATE; the movement's stock comes from it
+                movements.append({
+                    "product_id": product.id,
+                    "user_id": self.current_user.id,
+                    "tipo": MovementType.ENTRADA,
+                    "cantidad": cantidad,
+                    "motivo": f"Compra - Factura {numero_factura}",
+                    "referencia": numero_factura
+                })
+                products[product.id] = product
+
+                if on_progress:
+                    on_progress(line_number, total_lines)
+
+            # Running stock per line (a product may appear in several lines), starting
+            # from the stock each product had when the UPDATE applied this invoice
+            quantities = {}
+            for movement in movements:
+                quantities[movement["product_id"]] = quantities.get(movement["product_id"], 0) + movement["cantidad"]
+            running = {
+                product_id: stock - quantities[product_id]
+                for product_id, stock in self.add_stock(quantities).items()
+            }
+            for movement in movements:
+                product_id = movement["product_id"]
+                movement["stock_anterior"] = running[product_id]
+                running[product_id] += movement["cantidad"]
+                movement["stock_nuevo"] = running[product_id]
+                print(f"  ➕ {products[product_id].nombre}: +{movement['cantidad']} unidades "
+                      f"(Stock: {movement['stock_nuevo']})")
+            for product_id, stock in running.items():
+                set_committed_value(products[product_id], "stock_actual", stock)
+
+            if items:
+                self.db.execute(insert(PurchaseInvoiceItemModel), items)
+                self.db.execute(insert(InventoryMovementModel), movements)
+
+            learned = learn_aliases(self.db, supplier.id, aliases, resolved)
+            if learned:
+                print(f"  🔗 {learned} referencias del proveedor aprendidas")
+
+            # 4. Commit all changes (the only commit of the invoice)
             self.db.commit()
             self.db.refresh(purchase_invoice)
 
@@ -312,10 +493,17 @@ class InvoiceProcessor:
             return purchase_invoice
 
         except HTTPException:
-            self.db.rollback()
+            self.rollback()
             raise
+        except IntegrityError:
+            # A concurrent submission of the same invoice committed first
+            self.rollback()
+            existing_invoice = self.find_existing_invoice(numero_factura, cufe, idempotency_key)
+            if existing_invoice is None:
+                raise InvoiceConflict(numero_factura)
+            return self._replay_or_reject(existing_invoice, numero_factura, cufe, idempotency_key)
         except Exception as e:
-            self.db.rollback()
+            self.rollback()
             raise HTTPException(
                 status_code=500,
                 detail=f"Error processing invoice: {str(e)}"
@@ -0,0 +1,230 @@
+"""
+Background Jobs
+Durable job table (jobs) worked by an in-process thread pool, so long invoice
+processing runs outside the request; GET /api/jobs/{id} reports progress
+"""
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy.orm import Session, sessionmaker
+
+from auth import UserPrincipal
+from invoice_processor import InvoiceConflict, InvoiceProcessor
+from models import Job, JobStatus, User
+
+load_dotenv()
+
+# 0 runs each job inline when it is enqueued (tests, debugging)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Jobs left EN_PROCESO for longer than this (a crashed worker) are queued again on startup
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "600"))
+# Retries when a concurrent job created the same supplier/product first
+JOB_CONFLICT_RETRIES = 3
+
+JOB_INVOICE_PROCESS = "invoice.process"
+
+# handler(db, payload, current_user, report) -> (result_id, message)
+JobHandler = Callable[[Session, Dict, UserPrincipal, Callable[[int, str], None]], Tuple[Optional[int], str]]
+
+
+def process_invoice_job(db: Session, payload: Dict, current_user: UserPrincipal, report) -> Tuple[Optional[int], str]:
+    """Run InvoiceProcessor for a queued submission (PDF already in the content store)"""
+    def on_progress(done, total):
+        report(10 + 85 * done // total, f"Línea {done} de {total}")
+
+    for attempt in range(JOB_CONFLICT_RETRIES + 1):
+        processor = InvoiceProcessor(db, current_user)
+        try:
+            invoice = processor.process_invoice_blocking(
+                payload["invoice_data"], payload.get("pdf_key"), payload.get("idempotency_key"),
+                on_progress=on_progress
+            )
+            break
+        except InvoiceConflict:
+            # The retry sees the committed rows and reuses them
+            if attempt == JOB_CONFLICT_RETRIES:
+                raise
+    if processor.replayed:
+        return invoice.id, "Factura ya registrada (mismo CUFE o clave de idempotencia)"
+    return invoice.id, f"Factura {invoice.numero_factura} procesada"
+
+
+HANDLERS: Dict[str, JobHandler] = {
+    JOB_INVOICE_PROCESS: process_invoice_job,
+}
+
+
+class JobQueue:
+    """
+    Jobs are rows first: enqueue commits the row and then hands its id to the
+    pool, and a worker claims it with a conditional UPDATE, so a job is never
+    run twice even when recovery and a live worker race for it. Progress while
+    running is kept in memory; status, result and timings are persisted.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._futures: Set[Future] = set()
+        self._progress: Dict[int, Tuple[int, str]] = {}
+        self.completed = 0
+        self.failed = 0
+        self.queue_seconds = 0.0
+        self.processing_seconds = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Created lazily so importing the module never spawns threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="jobs")
+        return self._executor
+
+    def enqueue(self, db: Session, tipo: str, payload: Dict, user_id: int) -> Job:
+        """Store a job and schedule it; returns the committed row"""
+        if tipo not in HANDLERS:
+            raise ValueError(f"Unknown job type: {tipo}")
+        job = Job(
+            tipo=tipo,
+            status=JobStatus.PENDIENTE,
+            user_id=user_id,
+            payload=json.dumps(payload),
+            progress=0,
+            attempts=0,
+            message="En cola",
+            queued_at=datetime.utcnow(),
+        )
+        db.add(job)
+        db.commit()
+        self.submit(job.id, sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind()))
+        db.refresh(job)
+        return job
+
+    def submit(self, job_id: int, session_factory: Callable[[], Session]):
+        if self.workers <= 0:
+            self.run(job_id, session_factory)
+            return
+        with self._lock:
+            future = self._get_executor().submit(self.run, job_id, session_factory)
+            self._futures.add(future)
+        future.add_done_callback(self._discard)
+
+    def _discard(self, future: Future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def run(self, job_id: int, session_factory: Callable[[], Session]):
+        """Claim and run one job (no-op if another worker already claimed it)"""
+        db = session_factory()
+        try:
+            started_at = datetime.utcnow()
+            claimed = db.query(Job).filter(Job.id == job_id, Job.status == JobStatus.PENDIENTE).update(
+                {
+                    Job.status: JobStatus.EN_PROCESO,
+                    Job.started_at: started_at,
+                    Job.attempts: Job.attempts + 1,
+                    Job.message: "Procesando",
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+            if not claimed:
+                return
+            job = db.get(Job, job_id)
+            tipo, queued_at = job.tipo, job.queued_at
+
+            def report(progress: int, message: str):
+                self._progress[job_id] = (progress, message)
+
+            report(10, "Procesando")
+            values = {}
+            try:
+                user = db.get(User, job.user_id)
+                if user is None:
+                    raise ValueError(f"Usuario {job.user_id} no encontrado")
+                handler = HANDLERS[tipo]
+                result_id, message = handler(db, json.loads(job.payload), UserPrincipal.from_user(user), report)
+                values = {Job.status: JobStatus.COMPLETADO, Job.progress: 100, Job.message: message,
+                          Job.result_id: result_id, Job.error: None}
+            except HTTPException as e:
+                values = {Job.status: JobStatus.FALLIDO, Job.message: "Error", Job.error: str(e.detail)}
+            except Exception as e:
+                values = {Job.status: JobStatus.FALLIDO, Job.message: "Error", Job.error: str(e)}
+            db.rollback()  # Whatever the handler left open
+
+            finished_at = datetime.utcnow()
+            values[Job.finished_at] = finished_at
+            db.query(Job).filter(Job.id == job_id).update(values, synchronize_session=False)
+            db.commit()
+            with self._lock:
+                if values[Job.status] == JobStatus.COMPLETADO:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self.queue_seconds += (started_at - queued_at).total_seconds()
+                self.processing_seconds += (finished_at - started_at).total_seconds()
+                self._progress.pop(job_id, None)
+            status = "✅" if values[Job.status] == JobStatus.COMPLETADO else "❌"
+            print(f"{status} Job {job_id} ({tipo}): {values.get(Job.error) or values[Job.message]}")
+        finally:
+            db.close()
+
+    def progress(self, job_id: int) -> Optional[Tuple[int, str]]:
+        """Live (progress, message) of a running job in this process"""
+        return self._progress.get(job_id)
+
+    def recover(self, session_factory: Callable[[], Session]) -> int:
+        """Queue again pending jobs and jobs stuck EN_PROCESO (on startup)"""
+        db = session_factory()
+        try:
+            stale = datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS)
+            db.query(Job).filter(Job.status == JobStatus.EN_PROCESO, Job.started_at < stale).update(
+                {Job.status: JobStatus.PENDIENTE, Job.message: "Reintentando"}, synchronize_session=False
+            )
+            db.commit()
+            job_ids = [job_id for (job_id,) in
+                       db.query(Job.id).filter(Job.status == JobStatus.PENDIENTE).order_by(Job.id)]
+        finally:
+            db.close()
+        for job_id in job_ids:
+            self.submit(job_id, session_factory)
+        return len(job_ids)
+
+    def drain(self, timeout: Optional[float] = None):
+        """Wait for the jobs submitted so far"""
+        with self._lock:
+            futures = list(self._futures)
+        wait(futures, timeout=timeout)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def reset(self):
+        with self._lock:
+            self._progress.clear()
+            self.completed = self.failed = 0
+            self.queue_seconds = self.processing_seconds = 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "workers": self.workers,
+                "in_flight": len(self._futures),
+                "running": len(self._progress),
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_queue_seconds": round(self.queue_seconds / finished, 3) if finished else 0.0,
+                "avg_processing_seconds": round(self.processing_seconds / finished, 3) if finished else 0.0,
+            }
+
+
+job_queue = JobQueue()
@@ -0,0 +1,202 @@
+"""
+Login Rate Limiter
+Sliding-window limiter with exponential backoff for /auth/login, keyed by
+username and client IP, checked before any bcrypt work is done
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from models import LoginFailure
+
+load_dotenv()
+
+LOGIN_RATE_WINDOW_SECONDS = float(os.getenv("LOGIN_RATE_WINDOW_SECONDS", "300"))
+# Attempts allowed per window before backoff starts; a shared store IP gets more room
+LOGIN_RATE_MAX_PER_USER = int(os.getenv("LOGIN_RATE_MAX_PER_USER", "5"))
+LOGIN_RATE_MAX_PER_IP = int(os.getenv("LOGIN_RATE_MAX_PER_IP", "30"))
+# Lockout after the limit: base, doubled on every further failure, capped
+LOGIN_BACKOFF_BASE_SECONDS = float(os.getenv("LOGIN_BACKOFF_BASE_SECONDS", "30"))
+LOGIN_BACKOFF_MAX_SECONDS = float(os.getenv("LOGIN_BACKOFF_MAX_SECONDS", "900"))
+# Store failures in login_failures so limits survive a worker restart
+LOGIN_LIMITER_PERSIST = os.getenv("LOGIN_LIMITER_PERSIST", "false").lower() == "true"
+# Reverse proxies (comma-separated addresses) whose X-Forwarded-For is trusted for the
+# client IP; without them the per-IP limit keys on the direct peer, i.e. the proxy
+LOGIN_TRUSTED_PROXIES = {
+    address.strip() for address in os.getenv("LOGIN_TRUSTED_PROXIES", "").split(",") if address.strip()
+}
+
+# Keys tracked in memory at most (oldest dropped first)
+MAX_TRACKED_KEYS = 100_000
+
+
+def client_ip(peer: Optional[str], forwarded_for: Optional[str] = None,
+              trusted_proxies=LOGIN_TRUSTED_PROXIES) -> Optional[str]:
+    """
+    Address of the client behind trusted proxies: X-Forwarded-For is read from
+    the right, skipping trusted hops, and only when the peer itself is trusted
+    (anyone else could send the header to pick their own key)
+    """
+    if not peer or peer not in trusted_proxies or not forwarded_for:
+        return peer
+    hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if hop not in trusted_proxies:
+            return hop
+    return hops[0] if hops else peer
+
+
+class LoginRateLimiter:
+    """
+    Attempts are recorded when they are admitted, so a burst of concurrent
+    requests cannot all slip past the check while bcrypt is still running.
+    A successful login removes its attempt and clears the user's failures;
+    attempts that end without a password check (e.g. the hashing pool was
+    busy) are released and do not count.
+    """
+
+    def __init__(
+        self,
+        window: float = LOGIN_RATE_WINDOW_SECONDS,
+        max_per_user: int = LOGIN_RATE_MAX_PER_USER,
+        max_per_ip: int = LOGIN_RATE_MAX_PER_IP,
+        backoff_base: float = LOGIN_BACKOFF_BASE_SECONDS,
+        backoff_max: float = LOGIN_BACKOFF_MAX_SECONDS,
+        persist: bool = LOGIN_LIMITER_PERSIST,
+    ):
+        self.window = window
+        self.limits = {"user": max_per_user, "ip": max_per_ip}
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.persist = persist
+        self._attempts = OrderedDict()  # key -> deque of timestamps
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = {"user": 0, "ip": 0}
+        self.failures = 0
+
+    @staticmethod
+    def keys_for(username: str, client_ip: Optional[str]) -> List[str]:
+        keys = [f"user:{username.strip().lower()}"]
+        if client_ip:
+            keys.append(f"ip:{client_ip}")
+        return keys
+
+    def _window(self, key: str, now: float) -> deque:
+        attempts = self._attempts.get(key)
+        if attempts is None:
+            attempts = self._attempts[key] = deque()
+            while len(self._attempts) > MAX_TRACKED_KEYS:
+                self._attempts.popitem(last=False)
+        else:
+            self._attempts.move_to_end(key)
+        while attempts and attempts[0] <= now - self.window:
+            attempts.popleft()
+        return attempts
+
+    def _retry_after(self, key: str, attempts: deque, now: float) -> float:
+        excess = len(attempts) - self.limits[key.split(":", 1)[0]]
+        if excess < 0:
+            return 0.0
+        backoff = min(self.backoff_max, self.backoff_base * 2 ** excess)
+        return max(0.0, attempts[-1] + backoff - now)
+
+    def acquire(self, keys: List[str]) -> Tuple[float, Optional[float]]:
+        """
+        Admit a login attempt and record it: ``(0.0, attempt)``, where ``attempt``
+        settles it later with record_success, record_failure or release. When
+        any key is locked out, ``(seconds to wait, None)``; rejected attempts
+        are not recorded.
+        """
+        now = time.time()
+        with self._lock:
+            windows = [(key, self._window(key, now)) for key in keys]
+            for key, attempts in windows:
+                retry_after = self._retry_after(key, attempts, now)
+                if retry_after > 0:
+                    self.rejected[key.split(":", 1)[0]] += 1
+                    return retry_after, None
+            for _, attempts in windows:
+                attempts.append(now)
+            self.allowed += 1
+            return 0.0, now
+
+    def _forget(self, key: str, attempt: float):
+        """Remove this attempt's entry (not whichever concurrent attempt came last)"""
+        attempts = self._attempts.get(key)
+        if attempts:
+            try:
+                attempts.remove(attempt)
+            except ValueError:
+                pass  # Already slid out of the window
+
+    def record_success(self, keys: List[str], attempt: float):
+        """Forget the admitted attempt; the user's earlier failures are cleared too"""
+        with self._lock:
+            for key in keys:
+                if key.startswith("user:"):
+                    attempts = self._attempts.get(key)
+                    if attempts:
+                        attempts.clear()
+                else:
+                    self._forget(key, attempt)
+
+    def release(self, keys: List[str], attempt: float):
+        """Forget an admitted attempt that ended without checking the password"""
+        with self._lock:
+            for key in keys:
+                self._forget(key, attempt)
+
+    def record_failure(self, keys: List[str], db: Optional[Session] = None):
+        """Keep the admitted attempt as a failure (and store it when persistence is on)"""
+        with self._lock:
+            self.failures += 1
+        if self.persist and db is not None:
+            failed_at = datetime.utcnow()
+            db.add_all([LoginFailure(key=key, failed_at=failed_at) for key in keys])
+            db.commit()
+
+    def load(self, db: Session):
+        """Restore failures still inside the window (on startup) and purge older ones"""
+        cutoff = datetime.utcfromtimestamp(time.time() - self.window)
+        db.query(LoginFailure).filter(LoginFailure.failed_at <= cutoff).delete(synchronize_session=False)
+        db.commit()
+        rows = db.query(LoginFailure.key, LoginFailure.failed_at).order_by(LoginFailure.failed_at).all()
+        now = time.time()
+        with self._lock:
+            for key, failed_at in rows:
+                self._window(key, now).append(failed_at.replace(tzinfo=timezone.utc).timestamp())
+        return len(rows)
+
+    def reset(self):
+        with self._lock:
+            self._attempts.clear()
+            self.allowed = self.failures = 0
+            self.rejected = {"user": 0, "ip": 0}
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            locked = sum(
+                1 for key in list(self._attempts)
+                if self._retry_after(key, self._window(key, now), now) > 0
+            )
+            return {
+                "allowed": self.allowed,
+                "failures": self.failures,
+                "rejected": sum(self.rejected.values()),
+                "rejected_by_user": self.rejected["user"],
+                "rejected_by_ip": self.rejected["ip"],
+                "locked_keys": locked,
+                "tracked_keys": len(self._attempts),
+                "persistent": self.persist,
+            }
+
+
+login_limiter = LoginRateLimiter()
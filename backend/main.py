@@ -1,10 +1,13 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
-from datetime import datetime, timedelta
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import func, case, insert, select, update
+from typing import List, Optional
+from pydantic import TypeAdapter
+from datetime import date, datetime
 import os
 from dotenv import load_dotenv
 
@@ -21,6 +24,7 @@ from models import (
     SaleItem as SaleItemModel,
     InventoryMovement as InventoryMovementModel,
     Supplier as SupplierModel,
+    DailySalesSummary as DailySalesSummaryModel,
     SaleStatus,
     MovementType
 )
@@ -28,11 +32,26 @@ from schemas import (
     SupplierCreate,
     User as UserSchema, UserCreate, UserUpdate,
     Product as ProductSchema, ProductCreate, ProductUpdate,
-    Client as ClientSchema, ClientCreate, ClientUpdate,
-    Sale as SaleSchema, SaleCreate, SaleItem as SaleItemSchema,
-    Token, LoginRequest, DashboardMetrics
+    Client as ClientSchema, ClientCreate,
+    Sale as SaleSchema, SaleCreate, SaleBatchResult,
+    Token, LoginRequest, RefreshRequest, LogoutRequest, DashboardMetrics,
+    ListView, ProductSummary, ClientSummary, SaleSummary,
+    ReconcileRequest, ReconcileResult
 )
 from auth import *
+from sequences import SequenceAllocator
+from pagination import MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, paginate
+from sales_summary import record_sales
+from cache import TTLCache, invalidate_on_commit
+from supplier_aliases import supplier_aliases
+from product_reconciliation import RECONCILE_AUTO_APPLY, get_reconciler, is_confident, reconciler_cache
+from password_hashing import PasswordHashPoolBusy, password_hasher
+from password_policy import needs_rehash
+from login_limiter import LOGIN_LIMITER_PERSIST, client_ip, login_limiter
+from exports import (
+    ExportDataset, ExportFormat, MEDIA_TYPES,
+    build_export_query, export_filename, stream_export
+)
 
 # Create FastAPI app
 app = FastAPI(
@@ -41,6 +60,11 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Handlers that use the synchronous SQLAlchemy session are declared with plain
+# `def` so FastAPI runs them in its threadpool instead of on the event loop.
+# `async def` handlers (uploads, login) await I/O themselves and hand every
+# database call to run_in_threadpool.
+
 # Configure CORS - Dynamic origins from environment variable
 allowed_origins_env = os.getenv("ALLOWED_ORIGINS", "")
 if allowed_origins_env:
@@ -63,6 +87,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # Create tables and seed data on startup
@@ -99,6 +124,24 @@ def startup_event():
     finally:
         db.close()
 
+    if LOGIN_LIMITER_PERSIST:
+        db = SessionLocal()
+        try:
+            print(f"🔒 Restored {login_limiter.load(db)} recent login failures")
+        finally:
+            db.close()
+
+    # Resume background jobs left queued (or interrupted) by the previous run
+    recovered = job_queue.recover(SessionLocal)
+    if recovered:
+        print(f"⏳ Requeued {recovered} background jobs")
+
+@app.on_event("shutdown")
+def shutdown_event():
+    # Let in-flight bcrypt jobs finish and release the hashing threads
+    password_hasher.shutdown()
+    job_queue.shutdown()
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
@@ -132,41 +175,89 @@ async def api_status():
     }
 
 # Authentication endpoints
+@app.exception_handler(PasswordHashPoolBusy)
+async def password_hash_pool_busy_handler(request, exc: PasswordHashPoolBusy):
+    """Too many logins waiting on bcrypt: ask the client to retry shortly"""
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many login attempts in progress, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
 @app.post("/auth/login", response_model=Token)
-async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
-    """Login endpoint"""
-    user = authenticate_user(db, login_data.username, login_data.password)
-    if not user:
+async def login(login_data: LoginRequest, request: Request, db: Session = Depends(get_db)):
+    """Login endpoint (user lookup in the threadpool, bcrypt on the bounded hashing pool)"""
+    # Rate limit before any bcrypt work so a flood cannot pin the CPU
+    ip = client_ip(request.client.host if request.client else None, request.headers.get("X-Forwarded-For"))
+    limiter_keys = login_limiter.keys_for(login_data.username, ip)
+    retry_after, attempt = login_limiter.acquire(limiter_keys)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Too many login attempts, retry in {int(retry_after) + 1} seconds",
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
+
+    try:
+        user = await run_in_threadpool(get_user_by_username, db, login_data.username)
+        valid = user is not None and await password_hasher.verify(login_data.password, user.password_hash)
+    except BaseException:
+        # No password was checked (e.g. hashing pool busy, 503): the attempt does not count
+        login_limiter.release(limiter_keys, attempt)
+        raise
+    if not valid:
+        await run_in_threadpool(login_limiter.record_failure, limiter_keys, db)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    login_limiter.record_success(limiter_keys, attempt)
+    if needs_rehash(user.password_hash):
+        # Work factor changed since this hash was stored: upgrade it while we have the password
+        user.password_hash = await password_hasher.hash(login_data.password)
+        await run_in_threadpool(db.commit)
+    return create_token_pair(access_token_claims(user))
+
+@app.post("/auth/refresh", response_model=Token)
+def refresh_session(refresh_data: RefreshRequest, db: Session = Depends(get_db)):
+    """Renew a session with a refresh token (rotated on every use, no password check)"""
+    return rotate_refresh_token(db, refresh_data.refresh_token)
+
+@app.post("/auth/logout")
+def logout(
+    logout_data: Optional[LogoutRequest] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_user)
+):
+    """Revoke the current access token (and the refresh token, if given) immediately"""
+    revoke_tokens(db, credentials.credentials, logout_data.refresh_token if logout_data else None)
+    return {"message": "Logged out successfully"}
 
 @app.get("/auth/me", response_model=UserSchema)
-async def read_users_me(current_user: UserModel = Depends(get_current_active_user)):
-    """Get current user info"""
-    return current_user
+def read_users_me(
+    db: Session = Depends(get_db),
+    current_user: UserPrincipal = Depends(get_current_active_user)
+):
+    """Get current user info (the cached principal only carries authorization fields)"""
+    return db.get(UserModel, current_user.id)
 
 # User endpoints
 @app.get("/users", response_model=List[UserSchema])
-async def get_users(
-    skip: int = 0, 
-    limit: int = 100, 
+def get_users(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(require_superuser)
 ):
     """Get all users (superuser only)"""
-    users = db.query(UserModel).offset(skip).limit(limit).all()
-    return users
+    return paginate(db.query(UserModel), UserModel.id, response, cursor, skip, limit)
 
 @app.post("/users", response_model=UserSchema)
-async def create_user(
+def create_user(
     user: UserCreate, 
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(require_superuser)
@@ -183,7 +274,7 @@ async def create_user(
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = password_hasher.hash_blocking(user.password)
     db_user = UserModel(
         username=user.username,
         email=user.email,
@@ -198,20 +289,75 @@ async def create_user(
     db.refresh(db_user)
     return db_user
 
+@app.put("/users/{user_id}", response_model=UserSchema)
+def update_user(
+    user_id: int,
+    user: UserUpdate,
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(require_superuser)
+):
+    """Update user (superuser only); authorization changes revoke the user's tokens"""
+    db_user = db.get(UserModel, user_id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    update_data = user.dict(exclude_unset=True)
+    if "email" in update_data and update_data["email"] != db_user.email:
+        if db.query(UserModel.id).filter(UserModel.email == update_data["email"]).first():
+            raise HTTPException(status_code=400, detail="Email already registered")
+
+    # Tokens carry rol/ubicacion and are checked against is_active via the version map
+    if any(
+        field in update_data and update_data[field] != getattr(db_user, field)
+        for field in ("rol", "ubicacion", "is_active")
+    ):
+        db_user.token_version = (db_user.token_version or 0) + 1
+
+    for field, value in update_data.items():
+        setattr(db_user, field, value)
+
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+# List projection helper
+def summary_response(schema, query, id_column, response: Response, cursor, skip, limit) -> Response:
+    """
+    Serve a page of projected rows (?view=summary) through a lightweight schema.
+    Rows come from a column-only query and are dumped straight to JSON,
+    skipping ORM objects and the endpoint's full response_model.
+    """
+    adapter = TypeAdapter(List[schema])
+    rows = paginate(query, id_column, response, cursor, skip, limit)
+    content = adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+    headers = {}
+    if NEXT_CURSOR_HEADER in response.headers:
+        headers[NEXT_CURSOR_HEADER] = response.headers[NEXT_CURSOR_HEADER]
+    return Response(content=content, media_type="application/json", headers=headers)
+
 # Product endpoints
 @app.get("/products", response_model=List[ProductSchema])
-async def get_products(
-    skip: int = 0, 
-    limit: int = 100, 
+def get_products(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    view: ListView = ListView.FULL,
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user)
 ):
-    """Get all products"""
-    products = db.query(ProductModel).filter(ProductModel.is_active == True).offset(skip).limit(limit).all()
-    return products
+    """Get all products (view=summary returns ProductSummary rows)"""
+    if view == ListView.SUMMARY:
+        query = db.query(
+            ProductModel.id, ProductModel.codigo, ProductModel.nombre,
+            ProductModel.precio_venta, ProductModel.stock_actual
+        ).filter(ProductModel.is_active == True)
+        return summary_response(ProductSummary, query, ProductModel.id, response, cursor, skip, limit)
+    query = db.query(ProductModel).filter(ProductModel.is_active == True)
+    return paginate(query, ProductModel.id, response, cursor, skip, limit)
 
 @app.post("/products", response_model=ProductSchema)
-async def create_product(
+def create_product(
     product: ProductCreate, 
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(require_admin_or_super)
@@ -229,7 +375,7 @@ async def create_product(
     return db_product
 
 @app.get("/products/{product_id}", response_model=ProductSchema)
-async def get_product(
+def get_product(
     product_id: int, 
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user)
@@ -241,7 +387,7 @@ async def get_product(
     return product
 
 @app.put("/products/{product_id}", response_model=ProductSchema)
-async def update_product(
+def update_product(
     product_id: int, 
     product: ProductUpdate, 
     db: Session = Depends(get_db),
@@ -260,20 +406,49 @@ async def update_product(
     db.refresh(db_product)
     return db_product
 
+@app.post("/products/reconcile", response_model=List[ReconcileResult])
+def reconcile_products(
+    request: ReconcileRequest,
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """Rank active products for invoice lines by name similarity (see product_reconciliation.py)"""
+    ranked = get_reconciler(db).rank([line.nombre for line in request.productos], limit=request.limit)
+    return [
+        ReconcileResult(
+            referencia=line.referencia,
+            nombre=line.nombre,
+            auto_match_id=(
+                candidates[0].product_id
+                if RECONCILE_AUTO_APPLY and candidates and is_confident(line.nombre, candidates[0]) else None
+            ),
+            candidates=candidates
+        )
+        for line, candidates in zip(request.productos, ranked)
+    ]
+
 # Client endpoints
 @app.get("/clients", response_model=List[ClientSchema])
-async def get_clients(
-    skip: int = 0, 
-    limit: int = 100, 
+def get_clients(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    view: ListView = ListView.FULL,
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user)
 ):
-    """Get all clients"""
-    clients = db.query(ClientModel).filter(ClientModel.is_active == True).offset(skip).limit(limit).all()
-    return clients
+    """Get all clients (view=summary returns ClientSummary rows)"""
+    if view == ListView.SUMMARY:
+        query = db.query(
+            ClientModel.id, ClientModel.documento, ClientModel.nombre_completo, ClientModel.telefono
+        ).filter(ClientModel.is_active == True)
+        return summary_response(ClientSummary, query, ClientModel.id, response, cursor, skip, limit)
+    query = db.query(ClientModel).filter(ClientModel.is_active == True)
+    return paginate(query, ClientModel.id, response, cursor, skip, limit)
 
 @app.post("/clients", response_model=ClientSchema)
-async def create_client(
+def create_client(
     client: ClientCreate, 
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user)
@@ -290,28 +465,99 @@ async def create_client(
     db.refresh(db_client)
     return db_client
 
+# Sale helpers
+def _initial_sale_number(conn) -> int:
+    """Continue numbering after the sales that existed before the sequence"""
+    return (conn.execute(select(func.max(SaleModel.id))).scalar() or 0) + 1
+
+# Loading profile for the nested Sale response (client, user, items[].product)
+SALE_LOAD_PROFILE = (
+    joinedload(SaleModel.client),
+    joinedload(SaleModel.user),
+    selectinload(SaleModel.items).joinedload(SaleItemModel.product),
+)
+
+# Maximum number of sales accepted by POST /sales/batch
+SALES_BATCH_MAX = int(os.getenv("SALES_BATCH_MAX", "1000"))
+
+sale_numbers = SequenceAllocator("numero_venta", initial_value=_initial_sale_number)
+
+def format_sale_number(value: int) -> str:
+    return f"VTA-{value:06d}"
+
+def _lock_sale_products(db: Session, quantities: dict) -> dict:
+    """Load all products of a basket with one row-locking SELECT, keyed by id"""
+    if not quantities:
+        return {}
+    products = db.query(ProductModel).filter(
+        ProductModel.id.in_(list(quantities))
+    ).with_for_update().all()
+    return {product.id: product for product in products}
+
+def _decrement_stock(db: Session, quantities: dict) -> bool:
+    """
+    Decrement stock for every product in a single conditional UPDATE.
+    Returns False if any product no longer has enough stock.
+    """
+    if not quantities:
+        return True
+    cantidad = case(quantities, value=ProductModel.id)
+    result = db.execute(
+        update(ProductModel)
+        .where(
+            ProductModel.id.in_(list(quantities)),
+            ProductModel.stock_actual >= cantidad
+        )
+        .values(stock_actual=ProductModel.stock_actual - cantidad)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == len(quantities)
+
 # Sale endpoints
 @app.get("/sales", response_model=List[SaleSchema])
-async def get_sales(
-    skip: int = 0, 
-    limit: int = 100, 
+def get_sales(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    view: ListView = ListView.FULL,
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user)
 ):
-    """Get all sales"""
-    sales = db.query(SaleModel).offset(skip).limit(limit).all()
-    return sales
+    """Get all sales (view=summary returns SaleSummary rows)"""
+    if view == ListView.SUMMARY:
+        query = db.query(
+            SaleModel.id, SaleModel.numero_venta, SaleModel.total, SaleModel.status,
+            SaleModel.created_at, ClientModel.nombre_completo.label("client_nombre")
+        ).join(ClientModel, SaleModel.client_id == ClientModel.id)
+        return summary_response(SaleSummary, query, SaleModel.id, response, cursor, skip, limit)
+    query = db.query(SaleModel).options(*SALE_LOAD_PROFILE)
+    return paginate(query, SaleModel.id, response, cursor, skip, limit)
 
 @app.post("/sales", response_model=SaleSchema)
-async def create_sale(
+def create_sale(
     sale: SaleCreate, 
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user)
 ):
     """Create new sale"""
-    # Generate sale number
-    last_sale = db.query(SaleModel).order_by(SaleModel.id.desc()).first()
-    sale_number = f"VTA-{(last_sale.id + 1 if last_sale else 1):06d}"
+    # Aggregate basket quantities per product (the same product may appear in several lines)
+    quantities = {}
+    for item in sale.items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.cantidad
+
+    # Load and lock every product in the basket with a single query
+    products = _lock_sale_products(db, quantities)
+    for item in sale.items:
+        if item.product_id not in products:
+            raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
+    for product_id, cantidad in quantities.items():
+        product = products[product_id]
+        if product.stock_actual < cantidad:
+            raise HTTPException(status_code=400, detail=f"Insufficient stock for product {product.nombre}")
+
+    # Generate sale number from the pre-allocated sequence
+    sale_number = format_sale_number(sale_numbers.next_value(db))
     
     # Create sale
     db_sale = SaleModel(
@@ -328,94 +574,232 @@ async def create_sale(
     )
     db.add(db_sale)
     db.flush()  # Get the sale ID
-    
-    # Create sale items and update stock
+
+    # Decrement stock atomically; fails if a concurrent sale consumed it first
+    if not _decrement_stock(db, quantities):
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Insufficient stock for one or more products")
+
+    # Create sale items and inventory movements
+    running_stock = {product_id: product.stock_actual for product_id, product in products.items()}
     for item in sale.items:
-        # Check product exists and has enough stock
-        product = db.query(ProductModel).filter(ProductModel.id == item.product_id).first()
-        if not product:
-            raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
-        
-        if product.stock_actual < item.cantidad:
-            raise HTTPException(status_code=400, detail=f"Insufficient stock for product {product.nombre}")
-        
-        # Create sale item
         subtotal = item.cantidad * item.precio_unitario - item.descuento
-        db_item = SaleItemModel(
+        db.add(SaleItemModel(
             sale_id=db_sale.id,
             product_id=item.product_id,
             cantidad=item.cantidad,
             precio_unitario=item.precio_unitario,
             descuento=item.descuento,
             subtotal=subtotal
-        )
-        db.add(db_item)
-        
-        # Update product stock
-        old_stock = product.stock_actual
-        product.stock_actual -= item.cantidad
-        
-        # Create inventory movement
-        movement = InventoryMovementModel(
-            product_id=product.id,
+        ))
+
+        old_stock = running_stock[item.product_id]
+        running_stock[item.product_id] = old_stock - item.cantidad
+        db.add(InventoryMovementModel(
+            product_id=item.product_id,
             user_id=current_user.id,
             tipo=MovementType.SALIDA,
             cantidad=item.cantidad,
             stock_anterior=old_stock,
-            stock_nuevo=product.stock_actual,
+            stock_nuevo=running_stock[item.product_id],
             motivo=f"Venta {sale_number}",
             referencia=sale_number
-        )
-        db.add(movement)
+        ))
+
+    # Keep the loaded products in sync with the UPDATE without marking them dirty
+    for product_id, product in products.items():
+        set_committed_value(product, "stock_actual", running_stock[product_id])
     
     db.commit()
-    db.refresh(db_sale)
-    return db_sale
+    return db.query(SaleModel).options(*SALE_LOAD_PROFILE).populate_existing().filter(
+        SaleModel.id == db_sale.id
+    ).one()
 
-# Dashboard endpoint
-@app.get("/dashboard/metrics", response_model=DashboardMetrics)
-async def get_dashboard_metrics(
+@app.post("/sales/batch", response_model=List[SaleBatchResult])
+def create_sales_batch(
+    sales: List[SaleCreate],
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user)
 ):
-    """Get dashboard metrics"""
-    today = datetime.now().date()
+    """
+    Create many sales in one transaction (offline POS terminal sync).
+    Stock is validated for the whole batch in submission order; sales that
+    cannot be fulfilled are rejected individually and reported per index.
+    """
+    if len(sales) > SALES_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Batch too large (max {SALES_BATCH_MAX} sales)")
+
+    # Load and lock every product referenced by the batch with a single query
+    product_ids = {item.product_id: 0 for sale in sales for item in sale.items}
+    products = _lock_sale_products(db, product_ids)
+    available = {product_id: product.stock_actual for product_id, product in products.items()}
+
+    # Validate stock for the whole batch in one pass
+    results = []
+    accepted = []
+    total_quantities = {}
+    for index, sale in enumerate(sales):
+        quantities = {}
+        for item in sale.items:
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.cantidad
+
+        detail = None
+        for product_id, cantidad in quantities.items():
+            if product_id not in products:
+                detail = f"Product {product_id} not found"
+            elif available[product_id] < cantidad:
+                detail = f"Insufficient stock for product {products[product_id].nombre}"
+            if detail:
+                break
+        if detail:
+            results.append(SaleBatchResult(index=index, status="RECHAZADA", detail=detail))
+            continue
+
+        for product_id, cantidad in quantities.items():
+            available[product_id] -= cantidad
+            total_quantities[product_id] = total_quantities.get(product_id, 0) + cantidad
+        result = SaleBatchResult(index=index, status=SaleStatus.COMPLETADA.value)
+        results.append(result)
+        accepted.append((sale, result))
+
+    if not accepted:
+        return results
+
+    # Bulk insert sales, then items and movements with executemany
+    numbers = [format_sale_number(n) for n in sale_numbers.reserve(db, len(accepted))]
+    created_at = datetime.utcnow()
+    db.execute(
+        insert(SaleModel),
+        [
+            {
+                "numero_venta": numero_venta,
+                "client_id": sale.client_id,
+                "user_id": current_user.id,
+                "subtotal": sale.subtotal,
+                "descuento": sale.descuento,
+                "impuestos": sale.impuestos,
+                "total": sale.total,
+                "metodo_pago": sale.metodo_pago,
+                "notas": sale.notas,
+                "status": SaleStatus.COMPLETADA,
+                "created_at": created_at
+            }
+            for (sale, _), numero_venta in zip(accepted, numbers)
+        ]
+    )
+    # Fetch the generated ids in one indexed lookup by their (unique) numbers
+    ids_by_number = dict(db.execute(
+        select(SaleModel.numero_venta, SaleModel.id).where(SaleModel.numero_venta.in_(numbers))
+    ).all())
+    sale_ids = [ids_by_number[numero_venta] for numero_venta in numbers]
+
+    if not _decrement_stock(db, total_quantities):
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Insufficient stock for one or more products")
+
+    item_rows = []
+    movement_rows = []
+    running_stock = {product_id: product.stock_actual for product_id, product in products.items()}
+    for (sale, result), sale_id, numero_venta in zip(accepted, sale_ids, numbers):
+        result.sale_id = sale_id
+        result.numero_venta = numero_venta
+        for item in sale.items:
+            item_rows.append({
+                "sale_id": sale_id,
+                "product_id": item.product_id,
+                "cantidad": item.cantidad,
+                "precio_unitario": item.precio_unitario,
+                "descuento": item.descuento,
+                "subtotal": item.cantidad * item.precio_unitario - item.descuento
+            })
+            old_stock = running_stock[item.product_id]
+            running_stock[item.product_id] = old_stock - item.cantidad
+            movement_rows.append({
+                "product_id": item.product_id,
+                "user_id": current_user.id,
+                "tipo": MovementType.SALIDA,
+                "cantidad": item.cantidad,
+                "stock_anterior": old_stock,
+                "stock_nuevo": running_stock[item.product_id],
+                "motivo": f"Venta {numero_venta}",
+                "referencia": numero_venta
+            })
+
+    if item_rows:
+        db.execute(insert(SaleItemModel), item_rows)
+        db.execute(insert(InventoryMovementModel), movement_rows)
+
+    # Bulk inserts bypass the ORM flush hooks, so add them to the daily summary here
+    record_sales(db, [(created_at, current_user.ubicacion, sale.total) for sale, _ in accepted])
+
+    for product_id, product in products.items():
+        set_committed_value(product, "stock_actual", running_stock[product_id])
+
+    db.commit()
+    return results
+
+# Export endpoints
+@app.get("/export/{dataset}")
+def export_data(
+    dataset: ExportDataset,
+    format: ExportFormat = ExportFormat.CSV,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    gzip: bool = False,
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(require_role(["CONTADOR", "ADMIN", "SUPERUSUARIO"]))
+):
+    """Stream sales, sale items or inventory movements as CSV/NDJSON (optionally gzipped)"""
+    stmt = build_export_query(dataset, desde, hasta)
+    filename = export_filename(dataset, format, desde, hasta, gzip)
+    return StreamingResponse(
+        stream_export(db, stmt, format, compress=gzip),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# Dashboard endpoint
+# Metrics are shared by every user; cached briefly and invalidated when sales,
+# products or clients commit
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "15"))
+dashboard_cache = TTLCache("dashboard", maxsize=1, ttl=DASHBOARD_CACHE_TTL)
+invalidate_on_commit(dashboard_cache, (SaleModel, ProductModel, ClientModel, DailySalesSummaryModel))
+
+def _compute_dashboard_metrics(db: Session) -> DashboardMetrics:
+    """Compute dashboard metrics in two queries"""
+    today = datetime.utcnow().date()  # Summary days are UTC (see sales_summary.py)
     month_start = today.replace(day=1)
-    
-    # Total sales today
-    total_ventas_hoy = db.query(func.sum(SaleModel.total)).filter(
-        func.date(SaleModel.created_at) == today,
-        SaleModel.status == SaleStatus.COMPLETADA
-    ).scalar() or 0
-    
-    # Total products
-    total_productos = db.query(ProductModel).filter(ProductModel.is_active == True).count()
-    
-    # Total clients
-    total_clientes = db.query(ClientModel).filter(ClientModel.is_active == True).count()
-    
-    # Low stock products
-    stock_bajo = db.query(ProductModel).filter(
+
+    # Counters and totals (from the incrementally maintained daily summary) in one round trip
+    totals = db.query(
+        select(func.sum(DailySalesSummaryModel.total_ventas)).where(
+            DailySalesSummaryModel.fecha == today
+        ).scalar_subquery(),
+        select(func.sum(DailySalesSummaryModel.total_ventas)).where(
+            DailySalesSummaryModel.fecha >= month_start,
+            DailySalesSummaryModel.fecha <= today
+        ).scalar_subquery(),
+        select(func.count(ProductModel.id)).where(ProductModel.is_active == True).scalar_subquery(),
+        select(func.count(ClientModel.id)).where(ClientModel.is_active == True).scalar_subquery()
+    ).one()
+    total_ventas_hoy, ventas_mes, total_productos, total_clientes = totals
+
+    # Low stock products: first 5 for alerts plus the total count via a window function
+    low_stock_products = db.query(
+        ProductModel.nombre,
+        ProductModel.stock_actual,
+        func.count().over().label("total")
+    ).filter(
         ProductModel.stock_actual <= ProductModel.stock_minimo,
         ProductModel.is_active == True
-    ).count()
-    
-    # Sales this month
-    ventas_mes = db.query(func.sum(SaleModel.total)).filter(
-        SaleModel.created_at >= month_start,
-        SaleModel.status == SaleStatus.COMPLETADA
-    ).scalar() or 0
-    
+    ).limit(5).all()
+    stock_bajo = low_stock_products[0].total if low_stock_products else 0
+
     # Most sold products (placeholder)
     productos_mas_vendidos = []
-    
+
     # Alerts (low stock)
     alertas = []
-    low_stock_products = db.query(ProductModel).filter(
-        ProductModel.stock_actual <= ProductModel.stock_minimo,
-        ProductModel.is_active == True
-    ).limit(5).all()
-    
     for product in low_stock_products:
         alertas.append({
             "tipo": "stock_bajo",
@@ -423,17 +807,36 @@ async def get_dashboard_metrics(
             "producto": product.nombre,
             "stock": product.stock_actual
         })
-    
+
     return DashboardMetrics(
-        total_ventas_hoy=total_ventas_hoy,
+        total_ventas_hoy=total_ventas_hoy or 0,
         total_productos=total_productos,
         total_clientes=total_clientes,
         stock_bajo=stock_bajo,
-        ventas_mes=ventas_mes,
+        ventas_mes=ventas_mes or 0,
         productos_mas_vendidos=productos_mas_vendidos,
         alertas=alertas
     )
 
+@app.get("/dashboard/metrics", response_model=DashboardMetrics)
+def get_dashboard_metrics(
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """Get dashboard metrics (cached; concurrent refreshes share one computation)"""
+    return dashboard_cache.get_or_compute("metrics", lambda: _compute_dashboard_metrics(db))
+
+@app.get("/api/auth/limiter/stats")
+def get_login_limiter_stats(current_user: UserModel = Depends(require_admin_or_super)):
+    """Admitted, failed and rejected login attempts"""
+    return login_limiter.stats()
+
+@app.get("/api/cache/stats")
+def get_cache_stats(current_user: UserModel = Depends(require_admin_or_super)):
+    """Hit/miss counters of the in-process caches"""
+    caches = (dashboard_cache, user_cache, token_versions, supplier_aliases, reconciler_cache)
+    return {cache.name: cache.stats() for cache in caches}
+
 if __name__ == "__main__":
     import uvicorn
     print("🚀 Iniciando AEJ POS Backend...")
@@ -451,29 +854,51 @@ if __name__ == "__main__":
         log_level="info"
     )
 # Purchase Invoice endpoints
-from fastapi import File, UploadFile, Form
+from fastapi import File, UploadFile, Form, Header
 from invoice_processor import InvoiceProcessor
-from models import PurchaseInvoice as PurchaseInvoiceModel
+from invoice_importer import IMPORT_WORKERS, import_invoices, load_zip
+from ubl_parser import UBLParseError, parse_ubl_invoice
+from storage import invoice_pdf_store
+from jobs import JOB_INVOICE_PROCESS, job_queue
+from models import (
+    PurchaseInvoice as PurchaseInvoiceModel,
+    PurchaseInvoiceItem as PurchaseInvoiceItemModel,
+    Job as JobModel,
+    JobStatus
+)
 from schemas import (
     PurchaseInvoice as PurchaseInvoiceSchema,
-    InvoiceDataExtraction,
-    Supplier as SupplierSchema
+    Supplier as SupplierSchema,
+    PurchaseInvoiceSummary,
+    InvoiceImportSummary,
+    Job as JobSchema
 )
+from sqlalchemy.orm import sessionmaker
+import io
 import json
+import zipfile
+
+# Loading profile for the nested PurchaseInvoice response (supplier, items[].product)
+PURCHASE_INVOICE_LOAD_PROFILE = (
+    joinedload(PurchaseInvoiceModel.supplier),
+    selectinload(PurchaseInvoiceModel.items).joinedload(PurchaseInvoiceItemModel.product),
+)
 
 @app.get("/suppliers", response_model=List[SupplierSchema])
-async def get_suppliers(
+def get_suppliers(
+    response: Response,
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user)
 ):
     """Get all suppliers"""
-    suppliers = db.query(SupplierModel).filter(SupplierModel.is_active == True).offset(skip).limit(limit).all()
-    return suppliers
+    query = db.query(SupplierModel).filter(SupplierModel.is_active == True)
+    return paginate(query, SupplierModel.id, response, cursor, skip, limit)
 
 @app.post("/suppliers", response_model=SupplierSchema)
-async def create_supplier(
+def create_supplier(
     supplier: SupplierCreate,
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(require_admin_or_super)
@@ -497,11 +922,23 @@ async def upload_invoice(
     current_user: UserModel = Depends(get_current_active_user)
 ):
     """
-    Upload invoice PDF and extract data automatically
+    Upload invoice PDF or DIAN XML and extract data automatically
     Returns extracted invoice data for review
     """
+    if file.filename.lower().endswith('.xml'):
+        # DIAN UBL Invoice / AttachedDocument: parsed in a worker thread, streaming from the upload
+        try:
+            invoice_data = await run_in_threadpool(parse_ubl_invoice, file.file)
+        except UBLParseError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {
+            "message": "XML processed successfully",
+            "filename": file.filename,
+            "invoice_data": invoice_data
+        }
+
     if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+        raise HTTPException(status_code=400, detail="Only PDF or XML files are allowed")
     
     # For now, return a template response
     # In production, you would use OCR/PDF parsing here
@@ -513,56 +950,182 @@ async def upload_invoice(
 
 @app.post("/api/invoices/process", response_model=PurchaseInvoiceSchema)
 async def process_invoice(
+    response: Response,
     invoice_data: str = Form(...),
     pdf_file: Optional[UploadFile] = File(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    background: bool = False,
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user)
 ):
     """
-    Process invoice data: create/update supplier, products, and inventory
+    Process invoice data: create/update supplier, products, and inventory.
+    Resubmitting the same CUFE or Idempotency-Key returns the stored invoice
+    (marked with the Idempotent-Replayed header) without processing it again.
+    With ?background=true the invoice is queued and 202 returns the job to
+    poll at GET /api/jobs/{id}.
     """
     try:
         # Parse JSON data
         data = json.loads(invoice_data)
         
+        if background:
+            return await enqueue_invoice_job(data, pdf_file, idempotency_key, db, current_user)
+        
         # Create processor
         processor = InvoiceProcessor(db, current_user)
         
-        # Process invoice
-        purchase_invoice = await processor.process_invoice(data, pdf_file)
+        # Process invoice (only the PDF upload is awaited here, database work runs in the threadpool)
+        purchase_invoice = await processor.process_invoice(data, pdf_file, idempotency_key)
+        if processor.replayed:
+            response.headers["Idempotent-Replayed"] = "true"
         
-        return purchase_invoice
+        return await run_in_threadpool(load_purchase_invoice, db, purchase_invoice.id)
         
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid JSON data")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def enqueue_invoice_job(data, pdf_file, idempotency_key, db, current_user) -> JSONResponse:
+    payload = {"invoice_data": data, "idempotency_key": idempotency_key}
+    if pdf_file:
+        # Stored now; the job reads it back from the content store
+        payload["pdf_key"] = await invoice_pdf_store.save(pdf_file)
+        payload["pdf_name"] = pdf_file.filename
+    job = await run_in_threadpool(job_queue.enqueue, db, JOB_INVOICE_PROCESS, payload, current_user.id)
+    result = await run_in_threadpool(job_response, job, db)
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=result.model_dump(mode="json"),
+        headers={"Location": f"/api/jobs/{job.id}"}
+    )
+
+def load_purchase_invoice(db: Session, invoice_id: int) -> PurchaseInvoiceModel:
+    """Invoice with its items, products and supplier, refreshed from the database"""
+    return db.query(PurchaseInvoiceModel).options(
+        *PURCHASE_INVOICE_LOAD_PROFILE
+    ).populate_existing().filter(PurchaseInvoiceModel.id == invoice_id).one()
+
+def job_response(job: JobModel, db: Session) -> JobSchema:
+    """Job with the live progress of this process and, once completed, the invoice"""
+    result = JobSchema.model_validate(job)
+    live = job_queue.progress(job.id)
+    if live and job.status == JobStatus.EN_PROCESO:
+        result.progress, result.message = live
+    if job.status == JobStatus.COMPLETADO and job.result_id:
+        invoice = db.query(PurchaseInvoiceModel).options(
+            *PURCHASE_INVOICE_LOAD_PROFILE
+        ).filter(PurchaseInvoiceModel.id == job.result_id).first()
+        if invoice:
+            result.result = PurchaseInvoiceSchema.model_validate(invoice)
+    return result
+
+@app.get("/api/jobs/stats")
+def get_job_stats(current_user: UserModel = Depends(require_admin_or_super)):
+    """Job pool counters, with average queue wait and processing time"""
+    return job_queue.stats()
+
+@app.get("/api/jobs/{job_id}", response_model=JobSchema)
+def get_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """Status, progress, timings and result of a background job"""
+    job = db.get(JobModel, job_id)
+    if not job or (
+        job.user_id != current_user.id
+        and current_user.rol not in (UserRole.ADMIN, UserRole.SUPERUSUARIO)
+    ):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_response(job, db)
+
+@app.post("/api/invoices/import", response_model=InvoiceImportSummary)
+async def import_invoices_archive(
+    archive: UploadFile = File(...),
+    workers: Optional[int] = Query(None, ge=1, le=32),
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(require_admin_or_super)
+):
+    """
+    Bulk import a zip of invoice JSON files (PDFs with the same name are attached).
+    Invoices run on a worker pool, each in its own transaction; see invoice_importer.py
+    """
+    try:
+        sources = load_zip(io.BytesIO(await archive.read()))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="The uploaded file is not a zip archive")
+
+    def progress(done, total, result):
+        print(f"📦 [{done}/{total}] {result.file}: {result.status}")
+
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=db.get_bind())
+    return await run_in_threadpool(
+        import_invoices, sources, current_user, session_factory, workers or IMPORT_WORKERS, progress
+    )
+
 @app.get("/api/invoices", response_model=List[PurchaseInvoiceSchema])
-async def get_purchase_invoices(
+def get_purchase_invoices(
+    response: Response,
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    view: ListView = ListView.FULL,
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user)
 ):
-    """Get all purchase invoices"""
-    invoices = db.query(PurchaseInvoiceModel).offset(skip).limit(limit).all()
-    return invoices
+    """Get all purchase invoices (view=summary returns PurchaseInvoiceSummary rows)"""
+    if view == ListView.SUMMARY:
+        query = db.query(
+            PurchaseInvoiceModel.id, PurchaseInvoiceModel.numero_factura, PurchaseInvoiceModel.fecha_emision,
+            PurchaseInvoiceModel.total, PurchaseInvoiceModel.status,
+            SupplierModel.razon_social.label("supplier_razon_social")
+        ).join(SupplierModel, PurchaseInvoiceModel.supplier_id == SupplierModel.id)
+        return summary_response(
+            PurchaseInvoiceSummary, query, PurchaseInvoiceModel.id, response, cursor, skip, limit
+        )
+    query = db.query(PurchaseInvoiceModel).options(*PURCHASE_INVOICE_LOAD_PROFILE)
+    return paginate(query, PurchaseInvoiceModel.id, response, cursor, skip, limit)
 
 @app.get("/api/invoices/{invoice_id}", response_model=PurchaseInvoiceSchema)
-async def get_purchase_invoice(
+def get_purchase_invoice(
     invoice_id: int,
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(get_current_active_user)
 ):
     """Get purchase invoice by ID"""
-    invoice = db.query(PurchaseInvoiceModel).filter(PurchaseInvoiceModel.id == invoice_id).first()
+    invoice = db.query(PurchaseInvoiceModel).options(
+        *PURCHASE_INVOICE_LOAD_PROFILE
+    ).filter(PurchaseInvoiceModel.id == invoice_id).first()
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
     return invoice
 
+@app.get("/api/invoices/{invoice_id}/pdf")
+def download_purchase_invoice_pdf(
+    invoice_id: int,
+    db: Session = Depends(get_db),
+    current_user: UserModel = Depends(get_current_active_user)
+):
+    """Download the PDF stored for a purchase invoice"""
+    row = db.query(PurchaseInvoiceModel.numero_factura, PurchaseInvoiceModel.archivo_pdf).filter(
+        PurchaseInvoiceModel.id == invoice_id
+    ).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    if not invoice_pdf_store.exists(row.archivo_pdf):
+        raise HTTPException(status_code=404, detail="Invoice has no PDF")
+    return FileResponse(
+        invoice_pdf_store.path_for(row.archivo_pdf),
+        media_type="application/pdf",
+        filename=f"{row.numero_factura}.pdf"
+    )
+
 @app.delete("/api/invoices/{invoice_id}")
-async def delete_purchase_invoice(
+def delete_purchase_invoice(
     invoice_id: int,
     db: Session = Depends(get_db),
     current_user: UserModel = Depends(require_admin_or_super)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Float, Boolean, Date, DateTime, Text, ForeignKey, Enum, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -43,6 +43,12 @@ class PurchaseInvoiceStatus(str, enum.Enum):
     PROCESADA = "PROCESADA"
     CANCELADA = "CANCELADA"
 
+class JobStatus(str, enum.Enum):
+    PENDIENTE = "PENDIENTE"
+    EN_PROCESO = "EN_PROCESO"
+    COMPLETADO = "COMPLETADO"
+    FALLIDO = "FALLIDO"
+
 # Models
 class User(Base):
     __tablename__ = "users"
@@ -55,6 +61,8 @@ class User(Base):
     rol = Column(Enum(UserRole), nullable=False)
     ubicacion = Column(Enum(UserLocation), nullable=False)
     is_active = Column(Boolean, default=True)
+    # Bumped to revoke every access token issued before (role/location/status changes)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -133,10 +141,15 @@ class Supplier(Base):
 
 class SupplierProduct(Base):
     __tablename__ = "supplier_products"
+    __table_args__ = (
+        # Alias map (supplier, supplier reference) -> product, learned from invoices
+        Index("ix_supplier_products_supplier_ref", "supplier_id", "supplier_ref", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=False)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    supplier_ref = Column(String(100))  # Referencia del producto en las facturas del proveedor
     precio_compra = Column(Float, nullable=False)
     tiempo_entrega = Column(Integer)  # días
     cantidad_minima = Column(Integer, default=1)
@@ -160,7 +173,7 @@ class Sale(Base):
     metodo_pago = Column(String(50), nullable=False)
     status = Column(Enum(SaleStatus), default=SaleStatus.PENDIENTE)
     notas = Column(Text)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     
     # Relationships
     client = relationship("Client", back_populates="sales")
@@ -208,13 +221,15 @@ class PurchaseInvoice(Base):
     numero_factura = Column(String(50), unique=True, index=True, nullable=False)
     supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=False)
     fecha_emision = Column(DateTime, nullable=False)
-    cufe = Column(String(200))
+    cufe = Column(String(200), unique=True, index=True)
     fecha_aceptacion = Column(DateTime)
     firma_digital = Column(Text)
     subtotal = Column(Float, nullable=False)
     iva = Column(Float, nullable=False)
     total = Column(Float, nullable=False)
     archivo_pdf = Column(String(500))
+    # Client key of the submission that created the invoice (Idempotency-Key header)
+    idempotency_key = Column(String(255), unique=True, index=True)
     status = Column(Enum(PurchaseInvoiceStatus), default=PurchaseInvoiceStatus.PENDIENTE)
     notas = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -250,12 +265,48 @@ class InventoryMovement(Base):
     stock_nuevo = Column(Integer, nullable=False)
     motivo = Column(String(200), nullable=False)
     referencia = Column(String(100))  # Número de venta, compra, etc.
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     
     # Relationships
     product = relationship("Product", back_populates="inventory_movements")
     user = relationship("User", back_populates="inventory_movements")
 
+class DailySalesSummary(Base):
+    __tablename__ = "daily_sales_summary"
+    __table_args__ = (
+        UniqueConstraint("fecha", "ubicacion", name="uq_daily_sales_summary_fecha_ubicacion"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    fecha = Column(Date, nullable=False, index=True)
+    ubicacion = Column(Enum(UserLocation), nullable=False)  # Ubicación del vendedor
+    num_ventas = Column(Integer, nullable=False, default=0)
+    total_ventas = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class SequenceCounter(Base):
+    __tablename__ = "sequence_counters"
+    
+    name = Column(String(50), primary_key=True)
+    next_value = Column(Integer, nullable=False)  # Primer valor aún no reservado
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+    
+    id = Column(Integer, primary_key=True, index=True)  # Orden de revocación (sync incremental)
+    jti = Column(String(64), unique=True, index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    expires_at = Column(DateTime, nullable=False, index=True)  # Expiración del token (UTC)
+    revoked_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class LoginFailure(Base):
+    __tablename__ = "login_failures"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String(200), nullable=False, index=True)  # "user:<username>" o "ip:<dirección>"
+    failed_at = Column(DateTime, nullable=False, index=True)  # UTC
+
 class Configuration(Base):
     __tablename__ = "configurations"
     
@@ -264,4 +315,34 @@ class Configuration(Base):
     value = Column(Text, nullable=False)
     description = Column(String(200))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    tipo = Column(String(50), nullable=False)  # Handler en jobs.py, p. ej. "invoice.process"
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.PENDIENTE, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    progress = Column(Integer, nullable=False, default=0)  # 0-100
+    message = Column(String(200))
+    result_id = Column(Integer)  # PurchaseInvoice creada (o ya existente)
+    error = Column(Text)
+    attempts = Column(Integer, nullable=False, default=0)
+    # UTC; queue wait = started_at - queued_at, processing = finished_at - started_at
+    queued_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    @property
+    def queue_seconds(self):
+        if self.started_at is None:
+            return None
+        return round((self.started_at - self.queued_at).total_seconds(), 3)
+
+    @property
+    def processing_seconds(self):
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return round((self.finished_at - self.started_at).total_seconds(), 3)
@@ -0,0 +1,65 @@
+"""
+Pagination Module
+Keyset (cursor) pagination for list endpoints
+"""
+import base64
+import binascii
+import json
+import os
+from typing import Optional
+
+from fastapi import HTTPException, Response
+from sqlalchemy.orm import Query
+
+# Largest page a list endpoint will return
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
+
+# Response header carrying the cursor of the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(last_id: int) -> str:
+    """Build an opaque cursor pointing after the given id"""
+    payload = json.dumps({"id": last_id}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Return the id encoded in a cursor, or raise 400 if it is malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        last_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))["id"]
+        if not isinstance(last_id, int):
+            raise ValueError
+        return last_id
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(
+    query: Query,
+    id_column,
+    response: Response,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100
+) -> list:
+    """
+    Return one page of ``query`` ordered by ``id_column``.
+
+    With a cursor the page starts after the encoded id (an indexed range scan,
+    stable while new rows are inserted); otherwise the legacy ``skip`` offset
+    is applied. When more rows exist, the next cursor is set in the
+    ``X-Next-Cursor`` response header.
+    """
+    if cursor:
+        query = query.filter(id_column > decode_cursor(cursor))
+    query = query.order_by(id_column)
+    if skip and not cursor:
+        query = query.offset(skip)
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1].id)
+    return rows
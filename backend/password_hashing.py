@@ -0,0 +1,95 @@
+"""
+Password Hashing Pool
+Runs bcrypt hashing and verification on a small dedicated thread pool so that
+logins never block the event loop nor exhaust the request threadpool
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from dotenv import load_dotenv
+
+from auth import get_password_hash, verify_password
+
+load_dotenv()
+
+# bcrypt releases the GIL while hashing, so threads give real parallelism; the
+# worker count bounds the CPU spent on hashing, the queue bounds waiting requests
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "64"))
+
+
+class PasswordHashPoolBusy(Exception):
+    """Raised when the hashing queue is full; callers should answer 503"""
+
+
+class PasswordHashPool:
+    """Bounded executor for bcrypt operations with a limited waiting queue"""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_QUEUE_SIZE):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Created lazily so importing the module never spawns threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def _run(self, fn: Callable, args: tuple):
+        try:
+            return fn(*args)
+        finally:
+            # Accounted before the result is published, so waiters see consistent stats
+            with self._lock:
+                self._pending -= 1
+                self.completed += 1
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Queue ``fn(*args)`` on the pool, or raise PasswordHashPoolBusy when the queue is full"""
+        with self._lock:
+            # running + queued jobs
+            if self._pending >= self.workers + self.max_pending:
+                self.rejected += 1
+                raise PasswordHashPoolBusy("Password hashing queue is full")
+            self._pending += 1
+            executor = self._get_executor()
+        return executor.submit(self._run, fn, args)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """Verify a password without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(verify_password, plain_password, hashed_password))
+
+    async def hash(self, password: str) -> str:
+        """Hash a password without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(get_password_hash, password))
+
+    def hash_blocking(self, password: str) -> str:
+        """Hash a password from synchronous code (sync handlers, scripts) within the pool limits"""
+        return self.submit(get_password_hash, password).result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "in_flight": self._pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+password_hasher = PasswordHashPool()
@@ -0,0 +1,56 @@
+"""
+Password Hashing Policy
+bcrypt work factor per environment and detection of stored hashes weaker
+than the policy (rehashed on the next successful login)
+"""
+import os
+import re
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Unset or unknown environments get the production work factor
+ENVIRONMENT = os.getenv("ENVIRONMENT", "production")
+
+# Default work factor per environment; BCRYPT_ROUNDS overrides it
+DEFAULT_ROUNDS = {
+    "production": 12,
+    "development": 10,
+    "test": 4,
+}
+# Production never goes below this, whatever BCRYPT_ROUNDS says
+PRODUCTION_MIN_ROUNDS = 12
+
+_BCRYPT_HASH = re.compile(r"^\$2[aby]\$(\d{2})\$")
+
+
+def configured_rounds(environment: str = ENVIRONMENT, override: Optional[str] = None) -> int:
+    """Work factor for ``environment``, validated against bcrypt and production limits"""
+    rounds = int(override) if override else DEFAULT_ROUNDS.get(environment, PRODUCTION_MIN_ROUNDS)
+    if not 4 <= rounds <= 31:
+        raise ValueError(f"BCRYPT_ROUNDS must be between 4 and 31, got {rounds}")
+    if environment == "production" and rounds < PRODUCTION_MIN_ROUNDS:
+        raise ValueError(
+            f"BCRYPT_ROUNDS={rounds} is below the production minimum of {PRODUCTION_MIN_ROUNDS}"
+        )
+    return rounds
+
+
+BCRYPT_ROUNDS = configured_rounds(override=os.getenv("BCRYPT_ROUNDS"))
+
+
+def hash_rounds(hashed_password: str) -> Optional[int]:
+    """Work factor stored in a bcrypt hash, or None if it is not a bcrypt hash"""
+    match = _BCRYPT_HASH.match(hashed_password or "")
+    return int(match.group(1)) if match else None
+
+
+def needs_rehash(hashed_password: str, rounds: Optional[int] = None) -> bool:
+    """
+    True when a stored hash is weaker than the policy (or not bcrypt at all).
+    Stronger hashes are kept, so lowering the work factor never downgrades them.
+    """
+    stored = hash_rounds(hashed_password)
+    return stored is None or stored < (rounds or BCRYPT_ROUNDS)
@@ -0,0 +1,115 @@
+"""
+Product Matching Index
+In-memory lookup of catalog products for invoice lines: exact code, normalized
+name and substring matches (accelerated with a trigram index), resolved with
+the same precedence as the original per-line queries
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import Product as ProductModel
+
+# Lines whose name is longer than this may match a product containing its prefix
+SUBSTRING_MIN_LENGTH = 10
+SUBSTRING_PREFIX_LENGTH = 30
+NGRAM_SIZE = 3
+
+
+def normalize_name(nombre: str) -> str:
+    """Case-insensitive form of a product name with collapsed whitespace"""
+    return " ".join((nombre or "").split()).casefold()
+
+
+def ngrams(text: str, size: int = NGRAM_SIZE) -> Set[str]:
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class ProductMatchIndex:
+    """
+    Product ids by ``codigo`` and by normalized ``nombre``, plus a trigram index
+    over names for substring lookups. When several products match, the lowest
+    id wins, as the database returned them for ``.first()``.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[int, Optional[str], Optional[str]]] = ()):
+        self._by_codigo: Dict[str, int] = {}
+        self._by_name: Dict[str, int] = {}
+        self._names: Dict[int, str] = {}
+        self._trigrams: Optional[Dict[str, Set[int]]] = None
+        for product_id, codigo, nombre in sorted(rows, key=lambda row: row[0]):
+            self.add(product_id, codigo, nombre)
+
+    @classmethod
+    def load(cls, db: Session) -> "ProductMatchIndex":
+        """Build the index from a single narrow query over the catalog"""
+        return cls(db.query(ProductModel.id, ProductModel.codigo, ProductModel.nombre))
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, product_id: int, codigo: Optional[str], nombre: Optional[str]):
+        """Register a product (e.g. one created while processing the current invoice)"""
+        if codigo:
+            self._by_codigo.setdefault(codigo, product_id)
+        name = normalize_name(nombre)
+        self._names[product_id] = name
+        if name:
+            current = self._by_name.get(name)
+            if current is None or product_id < current:
+                self._by_name[name] = product_id
+        if self._trigrams is not None:
+            for gram in ngrams(name):
+                self._trigrams.setdefault(gram, set()).add(product_id)
+
+    def set_codigo(self, product_id: int, old_codigo: Optional[str], new_codigo: str):
+        """Reflect a code assigned to an existing product"""
+        if old_codigo and self._by_codigo.get(old_codigo) == product_id:
+            del self._by_codigo[old_codigo]
+        current = self._by_codigo.get(new_codigo)
+        if current is None or product_id < current:
+            self._by_codigo[new_codigo] = product_id
+
+    def _build_trigrams(self):
+        # Built on the first substring lookup only; most lines match by code or name
+        self._trigrams = {}
+        for product_id, name in self._names.items():
+            for gram in ngrams(name):
+                self._trigrams.setdefault(gram, set()).add(product_id)
+
+    def find_containing(self, fragment: str) -> Optional[int]:
+        """Lowest id whose normalized name contains ``fragment`` (normalized)"""
+        fragment = normalize_name(fragment)
+        if not fragment:
+            return None
+        grams = ngrams(fragment)
+        if not grams:
+            candidates: Iterable[int] = self._names
+        else:
+            if self._trigrams is None:
+                self._build_trigrams()
+            postings: List[Set[int]] = sorted(
+                (self._trigrams.get(gram, set()) for gram in grams), key=len
+            )
+            candidates = set(postings[0]).intersection(*postings[1:])
+        matches = [product_id for product_id in candidates if fragment in self._names[product_id]]
+        return min(matches) if matches else None
+
+    def match(self, referencia: str, nombre: str) -> Optional[int]:
+        """
+        Resolve an invoice line to a product id: exact code, then exact name
+        (case-insensitive), then a product whose name contains the first
+        30 characters of a name longer than 10 characters.
+        """
+        referencia = (referencia or "").strip()
+        nombre = (nombre or "").strip()
+
+        if referencia and referencia in self._by_codigo:
+            return self._by_codigo[referencia]
+        if nombre:
+            product_id = self._by_name.get(normalize_name(nombre))
+            if product_id is not None:
+                return product_id
+        if len(nombre) > SUBSTRING_MIN_LENGTH:
+            return self.find_containing(nombre[:SUBSTRING_PREFIX_LENGTH])
+        return None
@@ -0,0 +1,293 @@
+"""
+Product Reconciliation Engine
+Ranks catalog products for invoice lines by the cosine similarity of their
+character-trigram vectors; a whole invoice is scored against the catalog in
+one batch of NumPy array operations
+"""
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+from cache import TTLCache, invalidate_on_commit
+from models import Product as ProductModel
+from product_matching import normalize_name
+
+load_dotenv()
+
+# Fuzzy matches are only suggestions (POST /products/reconcile) unless this is
+# enabled; then invoice lines take their best candidate at or above the score
+RECONCILE_AUTO_APPLY = os.getenv("RECONCILE_AUTO_APPLY", "false").lower() == "true"
+RECONCILE_AUTO_MATCH_SCORE = float(os.getenv("RECONCILE_AUTO_MATCH_SCORE", "0.85"))
+RECONCILE_CACHE_TTL = float(os.getenv("RECONCILE_CACHE_TTL", "600"))
+# Candidates below this score are not worth suggesting
+RECONCILE_MIN_SCORE = 0.3
+
+# Candidate generation: every line nominates the products sharing its rarest
+# trigrams, which are then scored exactly against all of the line's trigrams.
+# Batches touching fewer postings than EXHAUSTIVE_POSTINGS use every trigram,
+# which makes the ranking exact
+RARE_TRIGRAMS_PER_LINE = 6
+CANDIDATES_PER_LINE = 20
+EXHAUSTIVE_POSTINGS = 200_000
+
+_NUMBERS = re.compile(r"\d+")
+_EMPTY = np.zeros(0, dtype=np.int64)
+
+
+@dataclass
+class Candidate:
+    """A catalog product proposed for an invoice line"""
+    product_id: int
+    codigo: Optional[str]
+    nombre: str
+    score: float
+
+
+def _trigrams(names: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    ``(row, trigram)`` pairs of normalized names padded like pg_trgm (two spaces
+    before, one after), repeats included. Trigrams are packed into int64 codes
+    of three 21-bit code points, so no Python loop runs over characters.
+    """
+    if not names:
+        return _EMPTY, _EMPTY
+    padded = [f"  {name} " for name in names]
+    chars = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    lengths = np.fromiter((len(text) for text in padded), dtype=np.int64, count=len(padded))
+    owner = np.repeat(np.arange(len(padded), dtype=np.int64), lengths)
+
+    # A trigram starting at i is valid when its three characters belong to the same name
+    valid = owner[:-2] == owner[2:]
+    codes = (chars[:-2] << 42) | (chars[1:-1] << 21) | chars[2:]
+    return owner[:-2][valid], codes[valid]
+
+
+def _distinct(values: np.ndarray) -> np.ndarray:
+    """Sorted distinct values (np.unique without its hash table, which is slower on large arrays)"""
+    values = np.sort(values)
+    keep = np.ones(len(values), dtype=bool)
+    keep[1:] = values[1:] != values[:-1]
+    return values[keep]
+
+
+def _gather(ptr: np.ndarray, selected: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Positions of the concatenated segments ``ptr[s]:ptr[s + 1]`` and their lengths"""
+    starts = ptr[selected]
+    counts = ptr[selected + 1] - starts
+    total = int(counts.sum())
+    return np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(total), counts
+
+
+class _TrigramMatrix:
+    """
+    Sparse (products x trigrams) matrix of L2-normalized binary TF-IDF weights,
+    stored both by column (the products of every trigram, to find candidates)
+    and by row (the trigrams of every product, to score them exactly).
+    ``vocab`` holds the sorted trigram codes; a trigram's column is its index.
+    """
+
+    def __init__(self, names: Sequence[str], idf_of: Optional[Callable[[np.ndarray], np.ndarray]] = None):
+        size = self.size = len(names)
+        rows, codes = _trigrams(names)
+        self.vocab = _distinct(codes)
+        width = max(len(self.vocab), 1)
+        # Distinct (trigram, row) pairs in both layouts, from plain sorts of packed keys
+        by_column = _distinct(np.searchsorted(self.vocab, codes) * max(size, 1) + rows)
+        col_grams, col_rows = np.divmod(by_column, max(size, 1))
+        by_row = np.sort(col_rows * width + col_grams)
+        row_rows, row_grams = np.divmod(by_row, width)
+
+        self.df = np.bincount(col_grams, minlength=len(self.vocab))
+        if idf_of is None:
+            self.idf = np.log((1 + size) / (1 + self.df)) + 1
+        else:
+            self.idf = idf_of(self.vocab)
+        norms = np.sqrt(np.bincount(col_rows, weights=self.idf[col_grams] ** 2, minlength=size))
+
+        self.col_ptr = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(self.df, out=self.col_ptr[1:])
+        self.col_rows = col_rows
+        self.col_weights = (self.idf[col_grams] / norms[col_rows]).astype(np.float32)
+
+        self.row_ptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(row_rows, minlength=size), out=self.row_ptr[1:])
+        self.row_grams = row_grams
+        self.row_weights = (self.idf[row_grams] / norms[row_rows]).astype(np.float32)
+
+    def lookup(self, codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Column of every code and whether the matrix has it"""
+        if not len(self.vocab):
+            return np.zeros(len(codes), dtype=np.int64), np.zeros(len(codes), dtype=bool)
+        columns = np.minimum(np.searchsorted(self.vocab, codes), len(self.vocab) - 1)
+        return columns, self.vocab[columns] == codes
+
+    def candidates(
+        self, lines: np.ndarray, codes: np.ndarray, weights: np.ndarray, per_line: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        ``(line, row, score)`` of the best candidates of every query line.
+        Query pairs are distinct per line and sorted by line; weights are the
+        line's normalized vector, so scores are exact cosine similarities.
+        """
+        columns, found = self.lookup(codes)
+        lines, columns, weights = lines[found], columns[found], weights[found]
+        if not len(lines) or not self.size:
+            return _EMPTY, _EMPTY, np.zeros(0)
+
+        # 1. Nominate products sharing a line's rarest trigrams (or any of them)
+        df = self.df[columns]
+        if df.sum() <= EXHAUSTIVE_POSTINGS:
+            nominating = np.arange(len(lines))
+        else:
+            order = np.lexsort((df, lines))
+            rarity = np.arange(len(order)) - np.searchsorted(lines[order], lines[order])
+            nominating = order[rarity < RARE_TRIGRAMS_PER_LINE]
+        positions, counts = _gather(self.col_ptr, columns[nominating])
+        cells = np.repeat(lines[nominating], counts) * self.size + self.col_rows[positions]
+        contributions = self.col_weights[positions] * np.repeat(weights[nominating], counts)
+        if not len(cells):
+            return _EMPTY, _EMPTY, np.zeros(0)
+        order = np.argsort(cells, kind="stable")
+        cells, contributions = cells[order], contributions[order]
+        starts = np.flatnonzero(np.concatenate(([True], cells[1:] != cells[:-1])))
+        cells, partial = cells[starts], np.add.reduceat(contributions, starts)
+
+        cand_lines, cand_rows = cells // self.size, cells % self.size
+        # Best partial scores first within each line (partial scores are at most 1)
+        order = np.argsort(cand_lines * 4.0 - partial, kind="stable")
+        rank = np.arange(len(order)) - np.searchsorted(cand_lines[order], cand_lines[order])
+        keep = order[rank < per_line]
+        cand_lines, cand_rows = cand_lines[keep], cand_rows[keep]
+
+        # 2. Exact cosine: each candidate's trigrams against the full line vector
+        query_keys = lines * len(self.vocab) + columns
+        key_order = np.argsort(query_keys)
+        query_keys, query_weights = query_keys[key_order], weights[key_order]
+        positions, counts = _gather(self.row_ptr, cand_rows)
+        keys = np.repeat(cand_lines, counts) * len(self.vocab) + self.row_grams[positions]
+        hits = np.minimum(np.searchsorted(query_keys, keys), len(query_keys) - 1)
+        products = np.where(query_keys[hits] == keys, query_weights[hits] * self.row_weights[positions], 0.0)
+        scores = np.bincount(np.repeat(np.arange(len(cand_rows)), counts), weights=products, minlength=len(cand_rows))
+        return cand_lines, cand_rows, scores
+
+
+class ProductReconciler:
+    """
+    Trigram vectors of the active catalog, built once and queried in batches.
+    Scores are cosine similarities in [0, 1] with smoothed IDF weights, so
+    shared rare fragments (brand, line, shade) count more than common ones.
+    Products added after loading (e.g. the ones an import will create) are
+    kept in a second, small matrix weighted with the catalog's IDF.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[int, Optional[str], Optional[str]]] = ()):
+        rows = [row for row in sorted(
+            (product_id, codigo, nombre, normalize_name(nombre)) for product_id, codigo, nombre in rows
+        ) if row[3]]
+        self._ids = [row[0] for row in rows]
+        self._codigos = [row[1] for row in rows]
+        self._nombres = [row[2] for row in rows]
+        self._matrix = _TrigramMatrix([row[3] for row in rows])
+        self._unseen_idf = np.log(1 + len(rows)) + 1
+        self._added: List[Tuple[int, Optional[str], str]] = []
+        self._added_matrix: Optional[_TrigramMatrix] = None
+
+    @classmethod
+    def load(cls, db: Session) -> "ProductReconciler":
+        """Build the matrix from a single narrow query over the active catalog"""
+        return cls(
+            db.query(ProductModel.id, ProductModel.codigo, ProductModel.nombre)
+            .filter(ProductModel.is_active == True)
+        )
+
+    def __len__(self):
+        return len(self._ids) + len(self._added)
+
+    def _idf_of(self, codes: np.ndarray) -> np.ndarray:
+        """Catalog IDF of trigram codes (the highest for trigrams no product has)"""
+        columns, found = self._matrix.lookup(codes)
+        if not len(self._matrix.vocab):
+            return np.full(len(codes), self._unseen_idf)
+        return np.where(found, self._matrix.idf[columns], self._unseen_idf)
+
+    def add(self, product_id: int, codigo: Optional[str], nombre: Optional[str]):
+        """Register a product created after loading"""
+        if normalize_name(nombre):
+            self._added.append((product_id, codigo, nombre))
+            self._added_matrix = None
+
+    def _segments(self):
+        """(matrix, ids, codigos, nombres) of the catalog and of the added products"""
+        yield self._matrix, self._ids, self._codigos, self._nombres
+        if self._added:
+            if self._added_matrix is None:
+                self._added_matrix = _TrigramMatrix(
+                    [normalize_name(nombre) for _, _, nombre in self._added], idf_of=self._idf_of
+                )
+            yield (self._added_matrix, [row[0] for row in self._added],
+                   [row[1] for row in self._added], [row[2] for row in self._added])
+
+    def rank(self, nombres: Sequence[str], limit: int = 5, min_score: float = RECONCILE_MIN_SCORE) -> List[List[Candidate]]:
+        """Best ``limit`` candidates of every line, highest score first (lowest id on ties)"""
+        names = [normalize_name(nombre) for nombre in nombres]
+        results: List[List[Candidate]] = [[] for _ in names]
+        if not len(self) or not any(names):
+            return results
+
+        # The query matrix: distinct trigrams of every line with normalized TF-IDF weights
+        lines, codes = _trigrams(names)
+        vocab = _distinct(codes)
+        lines, columns = np.divmod(_distinct(lines * len(vocab) + np.searchsorted(vocab, codes)), len(vocab))
+        codes = vocab[columns]
+        weights = self._idf_of(codes)
+        weights = weights / np.sqrt(np.bincount(lines, weights=weights * weights, minlength=len(names)))[lines]
+
+        per_line = max(CANDIDATES_PER_LINE, limit)
+        for matrix, ids, codigos, catalog_nombres in self._segments():
+            cand_lines, cand_rows, scores = matrix.candidates(lines, codes, weights, per_line)
+            for line, row, score in zip(cand_lines.tolist(), cand_rows.tolist(), scores.tolist()):
+                if score >= min_score and names[line]:
+                    results[line].append(Candidate(ids[row], codigos[row], catalog_nombres[row], round(score, 4)))
+
+        for candidates in results:
+            candidates.sort(key=lambda candidate: (-candidate.score, candidate.product_id))
+            del candidates[limit:]
+        return results
+
+    def best_matches(self, nombres: Sequence[str], min_score: float = RECONCILE_AUTO_MATCH_SCORE) -> List[Optional[int]]:
+        """
+        Product id of every line whose top candidate scores at least ``min_score``
+        and carries the same numbers (sizes, shades, references) in its name;
+        ``None`` for the rest, which should become new products.
+        """
+        return [
+            candidates[0].product_id if candidates and is_confident(nombre, candidates[0], min_score) else None
+            for nombre, candidates in zip(nombres, self.rank(nombres, limit=1, min_score=min_score))
+        ]
+
+
+def is_confident(nombre: str, candidate: Candidate, min_score: float = RECONCILE_AUTO_MATCH_SCORE) -> bool:
+    """Whether ``candidate`` is close enough to take the line without review"""
+    return candidate.score >= min_score and \
+        _NUMBERS.findall(normalize_name(nombre)) == _NUMBERS.findall(normalize_name(candidate.nombre))
+
+
+def _changes_catalog(product: ProductModel) -> bool:
+    """Only codes, names and the active flag feed the matrix; stock and price updates do not"""
+    state = inspect(product)
+    return any(state.attrs[name].history.has_changes() for name in ("codigo", "nombre", "is_active"))
+
+
+reconciler_cache = TTLCache("product_reconciler", maxsize=1, ttl=RECONCILE_CACHE_TTL)
+invalidate_on_commit(reconciler_cache, (ProductModel,), when=_changes_catalog)
+
+
+def get_reconciler(db: Session) -> ProductReconciler:
+    """Shared reconciler of the committed catalog (rebuilt after catalog changes); never ``add`` to it"""
+    return reconciler_cache.get_or_compute("catalog", lambda: ProductReconciler.load(db))
@@ -0,0 +1,196 @@
+"""
+Daily Sales Summary Module
+Keeps the daily_sales_summary table (completed sales per day and seller
+location) up to date in the same transaction as the sales it aggregates.
+Days are UTC dates, like the database clock that fills created_at by default
+and that the rebuild groups by
+"""
+from datetime import date, datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event, func, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import SessionLocal
+from models import (
+    DailySalesSummary,
+    Sale as SaleModel,
+    User as UserModel,
+    SaleStatus
+)
+
+# (fecha, ubicacion) -> (num_ventas delta, total_ventas delta)
+SummaryDeltas = Dict[Tuple[date, str], Tuple[int, float]]
+
+
+def add_delta(deltas: SummaryDeltas, fecha: date, ubicacion, count: int, total: float):
+    """Accumulate a change for one summary row"""
+    key = (fecha, ubicacion)
+    old_count, old_total = deltas.get(key, (0, 0.0))
+    deltas[key] = (old_count + count, old_total + total)
+
+
+def apply_deltas(connection, deltas: SummaryDeltas):
+    """Upsert accumulated deltas into daily_sales_summary"""
+    table = DailySalesSummary.__table__
+    rows = [
+        {"fecha": fecha, "ubicacion": ubicacion, "num_ventas": count, "total_ventas": total}
+        for (fecha, ubicacion), (count, total) in deltas.items()
+        if count or total
+    ]
+    if not rows:
+        return
+
+    dialect = connection.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        for row in rows:
+            stmt = insert(table).values(**row)
+            connection.execute(stmt.on_conflict_do_update(
+                index_elements=[table.c.fecha, table.c.ubicacion],
+                set_={
+                    "num_ventas": table.c.num_ventas + stmt.excluded.num_ventas,
+                    "total_ventas": table.c.total_ventas + stmt.excluded.total_ventas,
+                    "updated_at": func.now(),
+                }
+            ))
+        return
+
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(table.c.fecha == row["fecha"], table.c.ubicacion == row["ubicacion"])
+            .values(
+                num_ventas=table.c.num_ventas + row["num_ventas"],
+                total_ventas=table.c.total_ventas + row["total_ventas"]
+            )
+        )
+        if not result.rowcount:
+            connection.execute(table.insert().values(**row))
+
+
+def record_sales(db: Session, sales: Iterable[Tuple[Optional[datetime], str, float]]):
+    """
+    Add sales written outside the ORM unit of work (bulk inserts) to the summary.
+    Each entry is (created_at or None for now, seller ubicacion, total).
+    """
+    deltas: SummaryDeltas = {}
+    for created_at, ubicacion, total in sales:
+        add_delta(deltas, _sale_date(created_at), ubicacion, 1, total)
+    apply_deltas(db.connection(), deltas)
+
+
+def _sale_date(created_at: Optional[datetime]) -> date:
+    return created_at.date() if created_at else datetime.utcnow().date()
+
+
+def _contribution(status, total) -> Tuple[int, float]:
+    if status == SaleStatus.COMPLETADA:
+        return 1, total or 0.0
+    return 0, 0.0
+
+
+def _previous_values(connection, sale) -> Tuple:
+    """(status, total) as stored before this flush"""
+    status_history = get_history(sale, "status")
+    total_history = get_history(sale, "total")
+    unknown = any(h.added and not h.deleted for h in (status_history, total_history))
+    if unknown:
+        # The attribute was expired when assigned, so the old value was never loaded
+        return connection.execute(
+            select(SaleModel.status, SaleModel.total).where(SaleModel.id == sale.id)
+        ).one()
+    status = status_history.deleted[0] if status_history.deleted else sale.status
+    total = total_history.deleted[0] if total_history.deleted else sale.total
+    return status, total
+
+
+@event.listens_for(Session, "before_flush")
+def _track_sale_changes(session: Session, flush_context, instances):
+    """Fold new, cancelled, edited and deleted sales into the daily summary"""
+    changes = []  # (sale, count delta, total delta)
+    connection = None
+    for obj in session.new:
+        if isinstance(obj, SaleModel):
+            if obj.created_at is None:
+                # Stored with the same timestamp its summary day comes from
+                obj.created_at = datetime.utcnow()
+            changes.append((obj, *_contribution(obj.status, obj.total)))
+    for obj in session.dirty:
+        if isinstance(obj, SaleModel) and session.is_modified(obj):
+            connection = connection or session.connection()
+            old_count, old_total = _contribution(*_previous_values(connection, obj))
+            new_count, new_total = _contribution(obj.status, obj.total)
+            changes.append((obj, new_count - old_count, new_total - old_total))
+    for obj in session.deleted:
+        if isinstance(obj, SaleModel):
+            count, total = _contribution(obj.status, obj.total)
+            changes.append((obj, -count, -total))
+
+    changes = [change for change in changes if change[1] or change[2]]
+    if not changes:
+        return
+
+    connection = connection or session.connection()
+    user_ids = {sale.user_id for sale, _, _ in changes}
+    locations = dict(connection.execute(
+        select(UserModel.id, UserModel.ubicacion).where(UserModel.id.in_(user_ids))
+    ).all())
+
+    deltas: SummaryDeltas = {}
+    for sale, count, total in changes:
+        ubicacion = locations.get(sale.user_id)
+        if ubicacion is not None:
+            add_delta(deltas, _sale_date(sale.created_at), ubicacion, count, total)
+    apply_deltas(connection, deltas)
+
+
+def rebuild_daily_sales_summary(db: Session) -> int:
+    """Recompute daily_sales_summary from the sales table. Returns the number of rows written"""
+    fecha = func.date(SaleModel.created_at)
+    rows = db.execute(
+        select(
+            fecha.label("fecha"),
+            UserModel.ubicacion,
+            func.count(SaleModel.id),
+            func.coalesce(func.sum(SaleModel.total), 0.0)
+        )
+        .join(UserModel, SaleModel.user_id == UserModel.id)
+        .where(SaleModel.status == SaleStatus.COMPLETADA)
+        .group_by(fecha, UserModel.ubicacion)
+    ).all()
+
+    db.query(DailySalesSummary).delete(synchronize_session=False)
+    db.add_all([
+        DailySalesSummary(
+            fecha=day if isinstance(day, date) else date.fromisoformat(day),
+            ubicacion=ubicacion,
+            num_ventas=count,
+            total_ventas=total
+        )
+        for day, ubicacion, count, total in rows
+        if day is not None
+    ])
+    db.commit()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if "--rebuild" not in sys.argv:
+        print("Usage: python sales_summary.py --rebuild")
+        sys.exit(1)
+
+    db = SessionLocal()
+    try:
+        print("🔄 Rebuilding daily sales summary...")
+        written = rebuild_daily_sales_summary(db)
+        print(f"✅ {written} summary rows written")
+    except Exception as e:
+        print(f"❌ Error rebuilding summary: {e}")
+        db.rollback()
+    finally:
+        db.close()
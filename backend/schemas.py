@@ -1,15 +1,30 @@
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
 from datetime import datetime
-from models import UserRole, UserLocation, ProductCategory, SaleStatus, PurchaseInvoiceStatus
+import enum
+from models import UserRole, UserLocation, ProductCategory, SaleStatus, PurchaseInvoiceStatus, JobStatus
 
 # Auth schemas
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
 
 class TokenData(BaseModel):
     username: Optional[str] = None
+    # Claims of role-bearing tokens (absent in tokens that only carry "sub")
+    user_id: Optional[int] = None
+    rol: Optional[UserRole] = None
+    ubicacion: Optional[UserLocation] = None
+    token_version: Optional[int] = None
+    jti: Optional[str] = None
+    expires_at: Optional[datetime] = None
 
 class LoginRequest(BaseModel):
     username: str
@@ -176,6 +191,13 @@ class Sale(SaleBase):
     class Config:
         from_attributes = True
 
+class SaleBatchResult(BaseModel):
+    index: int  # Position of the sale in the submitted batch
+    status: str  # COMPLETADA or RECHAZADA
+    sale_id: Optional[int] = None
+    numero_venta: Optional[str] = None
+    detail: Optional[str] = None
+
 # Purchase Invoice schemas
 class PurchaseInvoiceItemBase(BaseModel):
     product_id: int
@@ -227,6 +249,117 @@ class InvoiceDataExtraction(BaseModel):
     productos: List[dict]
     totales: dict
 
+# Bulk invoice import
+class InvoiceImportResult(BaseModel):
+    file: str
+    status: str  # PROCESADA, DUPLICADA or ERROR
+    numero_factura: Optional[str] = None
+    invoice_id: Optional[int] = None
+    wave: Optional[int] = None  # Import wave the invoice ran in (waves run in order)
+    seconds: float = 0.0
+    detail: Optional[str] = None
+
+class InvoiceImportSummary(BaseModel):
+    total: int
+    processed: int
+    duplicates: int
+    failed: int
+    workers: int
+    waves: int
+    elapsed_seconds: float
+    invoices_per_second: float
+    results: List[InvoiceImportResult]
+
+# Product reconciliation (fuzzy name matching of invoice lines)
+class ReconcileLine(BaseModel):
+    referencia: Optional[str] = None
+    nombre: str
+
+class ReconcileRequest(BaseModel):
+    productos: List[ReconcileLine]
+    limit: int = Field(5, ge=1, le=20)
+
+class ReconcileCandidate(BaseModel):
+    product_id: int
+    codigo: Optional[str] = None
+    nombre: str
+    score: float  # Cosine similarity of the names' trigrams, 0 to 1
+
+    class Config:
+        from_attributes = True
+
+class ReconcileResult(BaseModel):
+    referencia: Optional[str] = None
+    nombre: str
+    auto_match_id: Optional[int] = None  # Product invoice processing would take for this line
+    candidates: List[ReconcileCandidate]
+
+# Background jobs
+class Job(BaseModel):
+    id: int
+    tipo: str
+    status: JobStatus
+    progress: int
+    message: Optional[str] = None
+    error: Optional[str] = None
+    result_id: Optional[int] = None
+    attempts: int
+    queued_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    queue_seconds: Optional[float] = None
+    processing_seconds: Optional[float] = None
+    result: Optional[PurchaseInvoice] = None  # Set once an invoice job is completed
+
+    class Config:
+        from_attributes = True
+
+# List projection schemas (?view=summary): built from selected columns, not ORM objects
+class ListView(str, enum.Enum):
+    FULL = "full"
+    SUMMARY = "summary"
+
+class ProductSummary(BaseModel):
+    id: int
+    codigo: str
+    nombre: str
+    precio_venta: float
+    stock_actual: int
+
+    class Config:
+        from_attributes = True
+
+class ClientSummary(BaseModel):
+    id: int
+    documento: str
+    nombre_completo: str
+    telefono: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class SaleSummary(BaseModel):
+    id: int
+    numero_venta: str
+    total: float
+    status: SaleStatus
+    created_at: datetime
+    client_nombre: str
+
+    class Config:
+        from_attributes = True
+
+class PurchaseInvoiceSummary(BaseModel):
+    id: int
+    numero_factura: str
+    fecha_emision: datetime
+    total: float
+    status: PurchaseInvoiceStatus
+    supplier_razon_social: str
+
+    class Config:
+        from_attributes = True
+
 # Dashboard schemas
 class DashboardAlert(BaseModel):
     tipo: str
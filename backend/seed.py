@@ -2,6 +2,7 @@ from sqlalchemy.orm import Session
 from database import SessionLocal, create_tables
 from models import User, Product, Client, Supplier, Configuration
 from auth import get_password_hash
+from password_hashing import password_hasher
 from datetime import datetime
 
 def create_initial_users(db: Session):
@@ -49,19 +50,24 @@ def create_initial_users(db: Session):
         }
     ]
     
-    for user_data in users_data:
-        # Check if user already exists
-        existing_user = db.query(User).filter(User.username == user_data["username"]).first()
-        if not existing_user:
-            user = User(
-                username=user_data["username"],
-                email=user_data["email"],
-                nombre_completo=user_data["nombre_completo"],
-                password_hash=get_password_hash(user_data["password"]),
-                rol=user_data["rol"],
-                ubicacion=user_data["ubicacion"]
-            )
-            db.add(user)
+    existing = {username for (username,) in db.query(User.username).filter(
+        User.username.in_([user_data["username"] for user_data in users_data])
+    )}
+    new_users = [user_data for user_data in users_data if user_data["username"] not in existing]
+
+    # Hash all passwords in parallel on the hashing pool instead of one after another
+    hashes = [password_hasher.submit(get_password_hash, user_data["password"]) for user_data in new_users]
+
+    for user_data, password_hash in zip(new_users, hashes):
+        user = User(
+            username=user_data["username"],
+            email=user_data["email"],
+            nombre_completo=user_data["nombre_completo"],
+            password_hash=password_hash.result(),
+            rol=user_data["rol"],
+            ubicacion=user_data["ubicacion"]
+        )
+        db.add(user)
     
     db.commit()
 
@@ -0,0 +1,127 @@
+"""
+Sequence Allocation Module
+Hands out unique document numbers (e.g. sale numbers) reserved in blocks,
+so allocating a number does not cost a query on the hot path
+"""
+import os
+import threading
+from collections import deque
+from typing import Callable, List, Optional
+
+from sqlalchemy import select, update, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import SequenceCounter
+
+# Numbers reserved per round trip; unused numbers of a block are lost on restart
+SEQUENCE_BLOCK_SIZE = int(os.getenv("SEQUENCE_BLOCK_SIZE", "20"))
+
+
+class SequenceAllocator:
+    """
+    Allocate unique numbers for a named sequence.
+
+    Each process reserves a block of numbers at a time, either from the
+    ``sequence_counters`` table or from a native sequence on PostgreSQL.
+    Reservations run on their own connection and commit immediately, so a
+    block is never handed out twice even if the caller's transaction rolls back.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        block_size: int = SEQUENCE_BLOCK_SIZE,
+        initial_value: Optional[Callable[[Connection], int]] = None
+    ):
+        self.name = name
+        self.block_size = max(1, block_size)
+        self.initial_value = initial_value
+        self._lock = threading.Lock()
+        self._ranges = deque()  # [start, stop) pairs reserved but not yet handed out
+        self._pg_increment = None
+
+    def next_value(self, db: Session) -> int:
+        """Return the next number of the sequence"""
+        return self.reserve(db, 1)[0]
+
+    def reserve(self, db: Session, count: int) -> List[int]:
+        """Return ``count`` unique numbers, reserving new blocks as needed"""
+        values = []
+        with self._lock:
+            while len(values) < count:
+                if not self._ranges:
+                    self._ranges.extend(self._reserve_blocks(db.get_bind(), count - len(values)))
+                start, stop = self._ranges.popleft()
+                take = min(stop - start, count - len(values))
+                values.extend(range(start, start + take))
+                if start + take < stop:
+                    self._ranges.appendleft((start + take, stop))
+        return values
+
+    def reset(self):
+        """Forget reserved blocks (the numbers in them are skipped)"""
+        with self._lock:
+            self._ranges.clear()
+            self._pg_increment = None
+
+    def _reserve_blocks(self, bind, needed: int) -> List[tuple]:
+        with bind.connect() as conn:
+            if conn.dialect.name == "postgresql":
+                blocks = self._reserve_native(conn, needed)
+            else:
+                blocks = [self._reserve_counter(conn, max(self.block_size, needed))]
+            conn.commit()
+        return blocks
+
+    def _start_value(self, conn: Connection) -> int:
+        return self.initial_value(conn) if self.initial_value else 1
+
+    def _reserve_counter(self, conn: Connection, size: int) -> tuple:
+        """Advance the counter row by ``size`` and return the reserved range"""
+        for _ in range(2):
+            result = conn.execute(
+                update(SequenceCounter)
+                .where(SequenceCounter.name == self.name)
+                .values(next_value=SequenceCounter.next_value + size)
+            )
+            if result.rowcount:
+                # The UPDATE holds the row lock, so this read sees our own increment
+                stop = conn.execute(
+                    select(SequenceCounter.next_value).where(SequenceCounter.name == self.name)
+                ).scalar_one()
+                return stop - size, stop
+
+            # First use: create the counter row, continuing from existing data
+            start = self._start_value(conn)
+            try:
+                conn.execute(SequenceCounter.__table__.insert().values(
+                    name=self.name, next_value=start + size
+                ))
+                return start, start + size
+            except IntegrityError:
+                # Another worker created the row first; retry the UPDATE
+                conn.rollback()
+        raise RuntimeError(f"Could not reserve numbers for sequence {self.name}")
+
+    def _reserve_native(self, conn: Connection, needed: int) -> List[tuple]:
+        """Reserve blocks from a native PostgreSQL sequence (INCREMENT BY block size)"""
+        seq_name = f"{self.name}_seq"
+        if self._pg_increment is None:
+            conn.execute(text(
+                f"CREATE SEQUENCE IF NOT EXISTS {seq_name} "
+                f"START WITH {self._start_value(conn)} INCREMENT BY {self.block_size}"
+            ))
+            # Honour the increment the sequence was created with, even if config changed since
+            self._pg_increment = conn.execute(
+                text("SELECT increment_by FROM pg_sequences WHERE sequencename = :name"),
+                {"name": seq_name}
+            ).scalar_one()
+        increment = self._pg_increment
+        blocks = -(-needed // increment)
+        starts = conn.execute(
+            text(f"SELECT nextval('{seq_name}') FROM generate_series(1, :n)"),
+            {"n": blocks}
+        ).scalars().all()
+        return [(start, start + increment) for start in sorted(starts)]
@@ -0,0 +1,110 @@
+"""
+Content-Addressed File Storage
+Streams uploads to disk in chunks off the event loop, hashing them with SHA-256
+on the way, and keeps one copy per content in a sharded directory tree
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from typing import BinaryIO, Optional
+
+from dotenv import load_dotenv
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+load_dotenv()
+
+INVOICE_STORAGE_DIR = os.getenv("INVOICE_STORAGE_DIR", "uploads/invoices")
+STORAGE_CHUNK_SIZE = int(os.getenv("STORAGE_CHUNK_SIZE", str(1024 * 1024)))
+
+_CONTENT_KEY = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ContentStore:
+    """
+    Files are stored as ``<root>/<ab>/<cd>/<sha256><suffix>``, where ``ab`` and
+    ``cd`` are the first hex digits of the hash; the hex digest is the key.
+    Saving content that is already stored only costs the read and the hash.
+    """
+
+    def __init__(self, root: str, suffix: str = "", chunk_size: int = STORAGE_CHUNK_SIZE):
+        self.root = root
+        self.suffix = suffix
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self.saved = 0
+        self.deduplicated = 0
+        self.bytes_written = 0
+
+    @staticmethod
+    def is_key(value: Optional[str]) -> bool:
+        return bool(value and _CONTENT_KEY.match(value))
+
+    def path_for(self, key: str) -> str:
+        """Location of a key; values stored before content keys (plain paths) are returned as they are"""
+        if not self.is_key(key):
+            return key
+        return os.path.join(self.root, key[:2], key[2:4], key + self.suffix)
+
+    def exists(self, key: Optional[str]) -> bool:
+        return bool(key) and os.path.isfile(self.path_for(key))
+
+    def save_fileobj(self, fileobj: BinaryIO) -> str:
+        """Copy a binary file object into the store (blocking) and return its key"""
+        tmp_dir = os.path.join(self.root, ".tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = fileobj.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+
+            key = digest.hexdigest()
+            path = self.path_for(key)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                with self._lock:
+                    self.deduplicated += 1
+                return key
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Atomic: a concurrent save of the same content just replaces identical bytes
+            os.replace(tmp_path, path)
+            with self._lock:
+                self.saved += 1
+                self.bytes_written += size
+            return key
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    async def save(self, upload: UploadFile) -> str:
+        """Store an upload without blocking the event loop; returns its content key"""
+        await upload.seek(0)
+        return await run_in_threadpool(self.save_fileobj, upload.file)
+
+    def reset(self):
+        with self._lock:
+            self.saved = self.deduplicated = self.bytes_written = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "root": self.root,
+                "saved": self.saved,
+                "deduplicated": self.deduplicated,
+                "bytes_written": self.bytes_written,
+            }
+
+
+invoice_pdf_store = ContentStore(INVOICE_STORAGE_DIR, suffix=".pdf")
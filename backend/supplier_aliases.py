@@ -0,0 +1,74 @@
+"""
+Supplier Reference Aliases
+(supplier_id, supplier_ref) -> product_id map learned from processed invoices
+and cached in memory per supplier, so repeat invoices skip catalog matching
+"""
+import os
+from typing import Dict, Iterable, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from cache import TTLCache, invalidate_on_commit
+from models import SupplierProduct
+
+load_dotenv()
+
+SUPPLIER_ALIAS_CACHE_TTL = float(os.getenv("SUPPLIER_ALIAS_CACHE_TTL", "3600"))
+SUPPLIER_ALIAS_CACHE_MAXSIZE = int(os.getenv("SUPPLIER_ALIAS_CACHE_MAXSIZE", "256"))
+
+# {supplier_ref: product_id} per supplier id; a committed write to a supplier's
+# aliases drops that supplier's entry. Cached dicts are shared: never mutate them.
+supplier_aliases = TTLCache("supplier_aliases", maxsize=SUPPLIER_ALIAS_CACHE_MAXSIZE, ttl=SUPPLIER_ALIAS_CACHE_TTL)
+invalidate_on_commit(supplier_aliases, (SupplierProduct,), key_for=lambda alias: alias.supplier_id)
+
+
+def load_aliases(db: Session, supplier_id: int) -> Dict[str, int]:
+    rows = db.query(SupplierProduct.supplier_ref, SupplierProduct.product_id).filter(
+        SupplierProduct.supplier_id == supplier_id,
+        SupplierProduct.supplier_ref.isnot(None),
+    )
+    return {supplier_ref: product_id for supplier_ref, product_id in rows}
+
+
+def get_aliases(db: Session, supplier_id: int) -> Dict[str, int]:
+    """Alias map of a supplier (one query on a cache miss)"""
+    return supplier_aliases.get_or_compute(supplier_id, lambda: load_aliases(db, supplier_id))
+
+
+def learn_aliases(
+    db: Session, supplier_id: int, known: Dict[str, int], resolved: Iterable[Tuple[str, int, float]]
+) -> int:
+    """
+    Record ``(supplier_ref, product_id, precio_compra)`` lines whose reference is
+    new or now points to another product; written with the caller's transaction.
+    Returns the number of aliases added or changed.
+    """
+    changed = {}
+    for supplier_ref, product_id, precio_compra in resolved:
+        if supplier_ref and known.get(supplier_ref) != product_id:
+            changed[supplier_ref] = (product_id, precio_compra)
+    if not changed:
+        return 0
+
+    existing = {
+        alias.supplier_ref: alias
+        for alias in db.query(SupplierProduct).filter(
+            SupplierProduct.supplier_id == supplier_id,
+            SupplierProduct.supplier_ref.in_(list(changed)),
+        )
+    }
+    for supplier_ref, (product_id, precio_compra) in changed.items():
+        alias = existing.get(supplier_ref)
+        if alias is None:
+            db.add(SupplierProduct(
+                supplier_id=supplier_id,
+                supplier_ref=supplier_ref,
+                product_id=product_id,
+                precio_compra=precio_compra,
+                is_active=True,
+            ))
+        else:
+            alias.product_id = product_id
+            alias.precio_compra = precio_compra
+    return len(changed)
@@ -1,8 +1,15 @@
 """
 Pytest configuration and shared fixtures
 """
+import os
+
+# Cheap bcrypt work factor (see password_policy.py); must be set before the app is imported
+os.environ["ENVIRONMENT"] = "test"
+# Background jobs run inline when enqueued (see jobs.py)
+os.environ["JOB_WORKERS"] = "0"
+
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 from fastapi.testclient import TestClient
@@ -24,6 +31,24 @@ engine = create_engine(
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+@pytest.fixture(autouse=True)
+def reset_process_state():
+    """Discard in-process state tied to the previous test database"""
+    from main import sale_numbers, dashboard_cache, user_cache, token_versions, revocation_store, login_limiter, job_queue
+    from supplier_aliases import supplier_aliases
+    from product_reconciliation import reconciler_cache
+    sale_numbers.reset()
+    dashboard_cache.reset()
+    user_cache.reset()
+    token_versions.reset()
+    revocation_store.reset()
+    login_limiter.reset()
+    job_queue.reset()
+    supplier_aliases.reset()
+    reconciler_cache.reset()
+    yield
+
+
 @pytest.fixture(scope="function")
 def db_session():
     """Create a fresh database session for each test"""
@@ -36,6 +61,21 @@ def db_session():
         Base.metadata.drop_all(bind=engine)
 
 
+@pytest.fixture
+def query_counter():
+    """Record every SQL statement executed against the test engine"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
 @pytest.fixture(scope="function")
 def client(db_session):
     """Create a test client with database override"""
@@ -366,3 +366,139 @@ class TestUserDeletionEdgeCases:
         # Clean up
         db_session.delete(inactive_user)
         db_session.commit()
+
+
+@pytest.mark.unit
+@pytest.mark.auth
+class TestUserPrincipalCache:
+    """Test the authenticated-user cache used by get_current_user"""
+
+    def _headers(self, user):
+        return {"Authorization": f"Bearer {create_access_token(data={'sub': user.username})}"}
+
+    def test_repeated_requests_skip_users_lookup(self, client, test_admin, query_counter):
+        """Test that only the first authenticated request reads the users table"""
+        headers = self._headers(test_admin)
+
+        client.get("/products", headers=headers)
+        query_counter.clear()
+        client.get("/products", headers=headers)
+
+        assert not [s for s in query_counter if "FROM users" in s]
+
+    def test_deactivation_takes_effect_on_commit(self, client, db_session, test_user):
+        """Test that committing a user update invalidates the cached principal"""
+        headers = self._headers(test_user)
+        assert client.get("/products", headers=headers).status_code == 200
+
+        test_user.is_active = False
+        db_session.commit()
+
+        assert client.get("/products", headers=headers).status_code == 400
+
+    def test_role_change_takes_effect_on_commit(self, client, db_session, test_user):
+        """Test that a promoted user gets the new permissions immediately"""
+        headers = self._headers(test_user)
+        assert client.get("/api/cache/stats", headers=headers).status_code == 403
+
+        test_user.rol = UserRole.ADMIN
+        db_session.commit()
+
+        assert client.get("/api/cache/stats", headers=headers).status_code == 200
+
+    def test_unknown_user_is_not_cached(self, client, db_session):
+        """Test that a 401 for a missing user is not remembered once the user exists"""
+        user = User(
+            username="late_user",
+            email="late@example.com",
+            nombre_completo="Late User",
+            password_hash=get_password_hash("password123"),
+            rol=UserRole.VENDEDOR,
+            ubicacion=UserLocation.COLOMBIA,
+            is_active=True
+        )
+        headers = self._headers(user)
+        assert client.get("/products", headers=headers).status_code == 401
+
+        db_session.add(user)
+        db_session.commit()
+
+        assert client.get("/products", headers=headers).status_code == 200
+
+    def test_cache_stats_report_user_hits(self, client, test_admin):
+        """Test that user cache counters are exposed"""
+        headers = self._headers(test_admin)
+
+        client.get("/products", headers=headers)
+        stats = client.get("/api/cache/stats", headers=headers).json()["users"]
+
+        assert stats["misses"] == 1
+        assert stats["hits"] == 1
+
+
+@pytest.mark.unit
+@pytest.mark.auth
+class TestRoleBearingTokens:
+    """Test access tokens that carry role, location and token version"""
+
+    def _login(self, client, username, password="testpassword123"):
+        response = client.post("/auth/login", json={"username": username, "password": password})
+        assert response.status_code == 200
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    def test_login_token_carries_claims(self, client, test_admin):
+        """Test that login embeds user id, role, location and token version"""
+        from jose import jwt
+        from auth import SECRET_KEY, ALGORITHM
+
+        headers = self._login(client, test_admin.username, "adminpass123")
+        claims = jwt.decode(headers["Authorization"].split()[1], SECRET_KEY, algorithms=[ALGORITHM])
+
+        assert claims["uid"] == test_admin.id
+        assert claims["rol"] == "ADMIN"
+        assert claims["ubi"] == test_admin.ubicacion.value
+        assert claims["tv"] == 0
+
+    def test_protected_reads_skip_users_table(self, client, test_admin, query_counter):
+        """Test that claims plus the cached version map authorize without user queries"""
+        headers = self._login(client, test_admin.username, "adminpass123")
+
+        client.get("/products", headers=headers)
+        query_counter.clear()
+        assert client.get("/api/cache/stats", headers=headers).status_code == 200
+        assert client.get("/products", headers=headers).status_code == 200
+
+        assert not [s for s in query_counter if "FROM users" in s]
+
+    def test_role_change_revokes_existing_tokens(self, client, test_user, test_superuser):
+        """Test that bumping token_version rejects tokens with stale claims"""
+        user_headers = self._login(client, test_user.username)
+        super_headers = self._login(client, test_superuser.username, "superpass123")
+        assert client.get("/products", headers=user_headers).status_code == 200
+
+        response = client.put(f"/users/{test_user.id}", headers=super_headers, json={"rol": "ADMIN"})
+        assert response.status_code == 200
+
+        revoked = client.get("/products", headers=user_headers)
+        assert revoked.status_code == 401
+        assert "revoked" in revoked.json()["detail"].lower()
+        new_headers = self._login(client, test_user.username)
+        assert client.get("/api/cache/stats", headers=new_headers).status_code == 200
+
+    def test_deactivated_user_is_rejected(self, client, db_session, test_user):
+        """Test that deactivation is seen through the version map"""
+        headers = self._login(client, test_user.username)
+        assert client.get("/products", headers=headers).status_code == 200
+
+        test_user.is_active = False
+        db_session.commit()
+
+        assert client.get("/products", headers=headers).status_code == 400
+
+    def test_incomplete_claims_are_rejected(self, client, test_user):
+        """Test that a versioned token without role claims is invalid"""
+        token = create_access_token(data={"sub": test_user.username, "tv": 0})
+
+        response = client.get("/products", headers={"Authorization": f"Bearer {token}"})
+
+        assert response.status_code == 401
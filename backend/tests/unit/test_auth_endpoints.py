@@ -70,3 +70,67 @@ class TestAuthLoginEndpoint:
         assert me_response.status_code == 200
         assert me_response.json()["username"] == test_user.username
 
+
+
+@pytest.mark.unit
+@pytest.mark.auth
+class TestRefreshAndLogoutEndpoints:
+    """Test refresh token rotation and immediate revocation"""
+
+    def _login(self, client, user):
+        response = client.post("/auth/login", json={"username": user.username, "password": "testpassword123"})
+        assert response.status_code == 200
+        return response.json()
+
+    def test_login_returns_refresh_token(self, client, test_user):
+        """Test that login issues a refresh token"""
+        assert self._login(client, test_user)["refresh_token"]
+
+    def test_refresh_rotates_tokens(self, client, test_user, monkeypatch):
+        """Test that a refresh token yields a new usable pair without password verification"""
+        from main import password_hasher
+
+        tokens = self._login(client, test_user)
+        monkeypatch.setattr(password_hasher, "submit", lambda *args: pytest.fail("bcrypt used on refresh"))
+
+        response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+
+        assert response.status_code == 200
+        renewed = response.json()
+        assert renewed["refresh_token"] != tokens["refresh_token"]
+        headers = {"Authorization": f"Bearer {renewed['access_token']}"}
+        assert client.get("/auth/me", headers=headers).status_code == 200
+
+    def test_refresh_token_reuse_revokes_session(self, client, test_user):
+        """Test that replaying a used refresh token revokes every token of the user"""
+        tokens = self._login(client, test_user)
+        renewed = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+
+        replay = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+
+        assert replay.status_code == 401
+        assert "reuse" in replay.json()["detail"].lower()
+        headers = {"Authorization": f"Bearer {renewed['access_token']}"}
+        assert client.get("/auth/me", headers=headers).status_code == 401
+        assert client.post("/auth/refresh", json={"refresh_token": renewed["refresh_token"]}).status_code == 401
+
+    def test_token_types_are_not_interchangeable(self, client, test_user):
+        """Test that refresh tokens cannot call endpoints and access tokens cannot refresh"""
+        tokens = self._login(client, test_user)
+
+        as_access = client.get("/auth/me", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+        as_refresh = client.post("/auth/refresh", json={"refresh_token": tokens["access_token"]})
+
+        assert as_access.status_code == 401
+        assert as_refresh.status_code == 401
+
+    def test_logout_revokes_immediately(self, client, test_user):
+        """Test that logout invalidates the access and refresh tokens at once"""
+        tokens = self._login(client, test_user)
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+        response = client.post("/auth/logout", headers=headers, json={"refresh_token": tokens["refresh_token"]})
+
+        assert response.status_code == 200
+        assert client.get("/auth/me", headers=headers).status_code == 401
+        assert client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
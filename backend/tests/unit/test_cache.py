@@ -0,0 +1,138 @@
+"""
+Unit tests for the in-process cache module (cache.py)
+"""
+import threading
+import time
+import pytest
+
+from cache import TTLCache, invalidate_on_commit
+from models import Supplier
+
+
+@pytest.mark.unit
+class TestTTLCache:
+    """Test TTL, LRU bound, counters and single flight"""
+
+    def test_get_set_and_counters(self):
+        """Test that hits and misses are counted"""
+        cache = TTLCache("test", maxsize=10, ttl=60)
+
+        assert cache.get("a") is None
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+
+    def test_entries_expire_after_ttl(self):
+        """Test that expired entries are not returned"""
+        cache = TTLCache("test", ttl=0.01)
+        cache.set("a", 1)
+
+        time.sleep(0.02)
+
+        assert cache.get("a") is None
+
+    def test_maxsize_evicts_least_recently_used(self):
+        """Test that the cache stays bounded"""
+        cache = TTLCache("test", maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats()["size"] == 2
+
+    def test_get_or_compute_single_flight(self):
+        """Test that concurrent misses share a single computation"""
+        cache = TTLCache("test", ttl=60)
+        calls = []
+        started = threading.Event()
+
+        def compute():
+            calls.append(1)
+            started.set()
+            time.sleep(0.1)
+            return "value"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+                   for _ in range(8)]
+        threads[0].start()
+        started.wait()
+        for thread in threads[1:]:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert results == ["value"] * 8
+        assert cache.stats()["coalesced"] == 7
+
+    def test_get_or_compute_propagates_errors_without_caching(self):
+        """Test that a failed computation is not cached"""
+        cache = TTLCache("test", ttl=60)
+
+        with pytest.raises(ValueError):
+            cache.get_or_compute("k", lambda: (_ for _ in ()).throw(ValueError("boom")))
+
+        assert cache.get_or_compute("k", lambda: 42) == 42
+
+    def test_invalidation_during_compute_discards_result(self):
+        """Test that a value computed before an invalidation is not stored"""
+        cache = TTLCache("test", ttl=60)
+
+        def compute():
+            cache.invalidate()
+            return "stale"
+
+        assert cache.get_or_compute("k", compute) == "stale"
+        assert cache.get("k") is None
+
+
+@pytest.mark.unit
+@pytest.mark.database
+class TestInvalidateOnCommit:
+    """Test commit-driven invalidation"""
+
+    @pytest.fixture
+    def supplier_cache(self):
+        cache = TTLCache("suppliers-test", ttl=60)
+        invalidate_on_commit(cache, (Supplier,), key_for=lambda supplier: supplier.nit)
+        return cache
+
+    def test_commit_invalidates_written_key(self, db_session, supplier_cache, test_supplier):
+        """Test that committing a change drops the object's key only"""
+        supplier_cache.set(test_supplier.nit, "cached")
+        supplier_cache.set("other", "cached")
+
+        test_supplier.ciudad = "Cali"
+        db_session.commit()
+
+        assert supplier_cache.get(test_supplier.nit) is None
+        assert supplier_cache.get("other") == "cached"
+
+    def test_rollback_keeps_cache(self, db_session, supplier_cache, test_supplier):
+        """Test that rolled back writes do not invalidate"""
+        supplier_cache.set(test_supplier.nit, "cached")
+
+        test_supplier.ciudad = "Cali"
+        db_session.flush()
+        db_session.rollback()
+
+        assert supplier_cache.get(test_supplier.nit) == "cached"
+
+    def test_bulk_update_invalidates_everything(self, db_session, supplier_cache, test_supplier):
+        """Test that bulk ORM statements clear the whole cache"""
+        from sqlalchemy import update
+
+        supplier_cache.set("other", "cached")
+
+        db_session.execute(update(Supplier).values(calificacion=5.0))
+        db_session.commit()
+
+        assert supplier_cache.get("other") is None
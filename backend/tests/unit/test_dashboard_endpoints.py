@@ -141,3 +141,80 @@ class TestDashboardEndpoints:
         assert metrics["total_productos"] >= 0
         assert metrics["stock_bajo"] >= 0
         assert metrics["total_clientes"] >= 0
+
+
+@pytest.mark.unit
+@pytest.mark.dashboard
+class TestDashboardMetricsCache:
+    """Test caching and write-driven invalidation of dashboard metrics"""
+
+    def test_second_request_is_served_from_cache(self, client, test_admin, db_session, query_counter):
+        """Test that repeated refreshes do not recompute metrics"""
+        from main import dashboard_cache
+
+        token = create_access_token(data={"sub": test_admin.username})
+        headers = {"Authorization": f"Bearer {token}"}
+
+        client.get("/dashboard/metrics", headers=headers)
+        query_counter.clear()
+        response = client.get("/dashboard/metrics", headers=headers)
+
+        assert response.status_code == 200
+        assert not [s for s in query_counter if "FROM products" in s or "daily_sales_summary" in s]
+        assert dashboard_cache.stats()["hits"] == 1
+
+    def test_metrics_computed_in_two_queries(self, client, test_admin, test_product, query_counter):
+        """Test that a cache miss costs two queries"""
+        token = create_access_token(data={"sub": test_admin.username})
+        headers = {"Authorization": f"Bearer {token}"}
+
+        query_counter.clear()
+        client.get("/dashboard/metrics", headers=headers)
+
+        metric_queries = [s for s in query_counter if "FROM users" not in s and "revoked_tokens" not in s]
+        assert len(metric_queries) == 2
+
+    def test_product_commit_invalidates_cache(self, client, test_admin, db_session):
+        """Test that writing a product refreshes the cached metrics"""
+        token = create_access_token(data={"sub": test_admin.username})
+        headers = {"Authorization": f"Bearer {token}"}
+
+        before = client.get("/dashboard/metrics", headers=headers).json()
+        db_session.add(Product(
+            codigo="CACHE-001", nombre="Cache Product", categoria=ProductCategory.ACCESORIOS,
+            precio_compra=1.0, precio_venta=2.0, stock_actual=0, stock_minimo=5, is_active=True
+        ))
+        db_session.commit()
+        after = client.get("/dashboard/metrics", headers=headers).json()
+
+        assert after["total_productos"] == before["total_productos"] + 1
+        assert after["stock_bajo"] == before["stock_bajo"] + 1
+
+    def test_sale_invalidates_cache(self, client, test_admin, test_client_record, test_product):
+        """Test that a new sale is visible on the next refresh"""
+        token = create_access_token(data={"sub": test_admin.username})
+        headers = {"Authorization": f"Bearer {token}"}
+
+        client.get("/dashboard/metrics", headers=headers)
+        client.post("/sales", headers=headers, json={
+            "client_id": test_client_record.id,
+            "subtotal": 150.0,
+            "total": 150.0,
+            "metodo_pago": "EFECTIVO",
+            "items": [{"product_id": test_product.id, "cantidad": 1, "precio_unitario": 150.0}]
+        })
+
+        assert client.get("/dashboard/metrics", headers=headers).json()["total_ventas_hoy"] == 150.0
+
+    def test_cache_stats_endpoint(self, client, test_admin, test_user):
+        """Test that cache counters are exposed to admins only"""
+        admin_headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_admin.username})}"}
+        user_headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_user.username})}"}
+
+        client.get("/dashboard/metrics", headers=admin_headers)
+        client.get("/dashboard/metrics", headers=admin_headers)
+        response = client.get("/api/cache/stats", headers=admin_headers)
+
+        assert response.status_code == 200
+        assert response.json()["dashboard"]["hit_rate"] == 0.5
+        assert client.get("/api/cache/stats", headers=user_headers).status_code == 403
@@ -125,6 +125,59 @@ class TestTableManagement:
         assert "sales" in table_names
         assert "purchase_invoices" in table_names
 
+    def test_add_missing_columns_upgrades_existing_table(self):
+        """Test that columns added after release are created on existing tables"""
+        from sqlalchemy import create_engine, text
+        from database import add_missing_columns
+
+        old_engine = create_engine("sqlite:///:memory:")
+        with old_engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(50) NOT NULL)"
+            ))
+            conn.execute(text("INSERT INTO users (id, username) VALUES (1, 'legacy')"))
+
+        add_missing_columns(old_engine)
+        add_missing_columns(old_engine)  # idempotent
+
+        with old_engine.connect() as conn:
+            assert conn.execute(text("SELECT token_version FROM users")).scalar() == 0
+
+    def test_add_missing_indexes_upgrades_existing_table(self):
+        """Test that the CUFE and idempotency key indexes are added to existing tables"""
+        from sqlalchemy import create_engine, text
+        from database import add_missing_columns
+
+        old_engine = create_engine("sqlite:///:memory:")
+        with old_engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE purchase_invoices (id INTEGER PRIMARY KEY, numero_factura VARCHAR(50), cufe VARCHAR(200))"
+            ))
+
+        add_missing_columns(old_engine)
+        add_missing_columns(old_engine)  # idempotent
+
+        indexes = {index["name"]: index for index in inspect(old_engine).get_indexes("purchase_invoices")}
+        assert indexes["ix_purchase_invoices_cufe"]["unique"]
+        assert indexes["ix_purchase_invoices_idempotency_key"]["unique"]
+
+    def test_add_missing_indexes_adds_created_at_indexes(self):
+        """Test that the export and summary created_at indexes reach existing databases"""
+        from sqlalchemy import create_engine, text
+        from database import add_missing_indexes
+
+        old_engine = create_engine("sqlite:///:memory:")
+        with old_engine.begin() as conn:
+            conn.execute(text("CREATE TABLE sales (id INTEGER PRIMARY KEY, created_at DATETIME)"))
+            conn.execute(text("CREATE TABLE inventory_movements (id INTEGER PRIMARY KEY, created_at DATETIME)"))
+
+        add_missing_indexes(old_engine)
+
+        assert "ix_sales_created_at" in {index["name"] for index in inspect(old_engine).get_indexes("sales")}
+        assert "ix_inventory_movements_created_at" in {
+            index["name"] for index in inspect(old_engine).get_indexes("inventory_movements")
+        }
+
     def test_drop_tables_removes_all_tables(self):
         """Test that drop_tables removes all tables"""
         # First ensure tables exist
@@ -0,0 +1,137 @@
+"""
+Unit tests for streaming export endpoints (main.py - export routes, exports.py)
+"""
+import csv
+import gzip
+import io
+import json
+import pytest
+from datetime import datetime
+
+from auth import create_access_token, get_password_hash
+from models import (
+    User, UserRole, UserLocation, Sale, SaleItem, SaleStatus,
+    InventoryMovement, MovementType
+)
+
+
+@pytest.fixture
+def test_contador(db_session):
+    """Create a CONTADOR user"""
+    user = User(
+        username="contador",
+        email="contador@example.com",
+        nombre_completo="Contador User",
+        password_hash=get_password_hash("contadorpass123"),
+        rol=UserRole.CONTADOR,
+        ubicacion=UserLocation.COLOMBIA,
+        is_active=True
+    )
+    db_session.add(user)
+    db_session.commit()
+    return user
+
+
+@pytest.fixture
+def sales_history(db_session, test_user, test_client_record, test_product):
+    """Three sales on different days, each with one item and one movement"""
+    for i, day in enumerate([datetime(2025, 1, 10, 12), datetime(2025, 2, 10, 12), datetime(2025, 3, 10, 12)]):
+        sale = Sale(
+            numero_venta=f"VTA-EXP-{i}",
+            client_id=test_client_record.id,
+            user_id=test_user.id,
+            subtotal=150.0,
+            total=178.5,
+            metodo_pago="EFECTIVO",
+            status=SaleStatus.COMPLETADA,
+            created_at=day
+        )
+        sale.items = [SaleItem(product_id=test_product.id, cantidad=1, precio_unitario=150.0, subtotal=150.0)]
+        db_session.add(sale)
+        db_session.add(InventoryMovement(
+            product_id=test_product.id,
+            user_id=test_user.id,
+            tipo=MovementType.SALIDA,
+            cantidad=1,
+            stock_anterior=50 - i,
+            stock_nuevo=49 - i,
+            motivo=f"Venta VTA-EXP-{i}",
+            referencia=f"VTA-EXP-{i}",
+            created_at=day
+        ))
+    db_session.commit()
+
+
+@pytest.mark.unit
+class TestExportEndpoints:
+    """Test streaming exports"""
+
+    def _headers(self, user):
+        return {"Authorization": f"Bearer {create_access_token(data={'sub': user.username})}"}
+
+    def test_export_sales_csv(self, client, test_contador, sales_history):
+        """Test CSV export of sales with header row and plain enum values"""
+        response = client.get("/export/sales", headers=self._headers(test_contador))
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert "attachment" in response.headers["content-disposition"]
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [r["numero_venta"] for r in rows] == ["VTA-EXP-0", "VTA-EXP-1", "VTA-EXP-2"]
+        assert rows[0]["status"] == "COMPLETADA"
+
+    def test_export_date_range_is_inclusive(self, client, test_contador, sales_history):
+        """Test that desde/hasta filter by day, inclusive on both ends"""
+        response = client.get(
+            "/export/sales?desde=2025-02-10&hasta=2025-03-10", headers=self._headers(test_contador)
+        )
+
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [r["numero_venta"] for r in rows] == ["VTA-EXP-1", "VTA-EXP-2"]
+
+    def test_export_sale_items_ndjson(self, client, test_contador, test_product, sales_history):
+        """Test NDJSON export of sale items joined with sale number and product code"""
+        response = client.get("/export/sale-items?format=ndjson", headers=self._headers(test_contador))
+
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert len(lines) == 3
+        assert lines[0]["numero_venta"] == "VTA-EXP-0"
+        assert lines[0]["producto_codigo"] == test_product.codigo
+
+    def test_export_inventory_movements_gzip(self, client, test_contador, sales_history):
+        """Test gzip-compressed export of inventory movements"""
+        response = client.get(
+            "/export/inventory-movements?gzip=true", headers=self._headers(test_contador)
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/gzip"
+        assert response.headers["content-disposition"].endswith('.csv.gz"')
+        text = gzip.decompress(response.content).decode("utf-8")
+        rows = list(csv.DictReader(io.StringIO(text)))
+        assert len(rows) == 3
+        assert rows[0]["tipo"] == "SALIDA"
+
+    def test_export_streams_in_batches(self, db_session, sales_history, monkeypatch):
+        """Test that rows are emitted per fetched batch, not all at once"""
+        import exports
+        from exports import build_export_query, stream_export, ExportDataset, ExportFormat
+
+        monkeypatch.setattr(exports, "EXPORT_BATCH_SIZE", 1)
+
+        chunks = list(stream_export(db_session, build_export_query(ExportDataset.SALES), ExportFormat.NDJSON))
+
+        assert len(chunks) == 3
+
+    def test_export_forbidden_for_vendedor(self, client, test_user):
+        """Test that VENDEDOR cannot export"""
+        response = client.get("/export/sales", headers=self._headers(test_user))
+
+        assert response.status_code == 403
+
+    def test_export_unknown_dataset_returns_422(self, client, test_contador):
+        """Test that unknown datasets are rejected"""
+        response = client.get("/export/users", headers=self._headers(test_contador))
+
+        assert response.status_code == 422
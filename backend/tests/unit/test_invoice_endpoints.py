@@ -77,3 +77,36 @@ class TestInvoiceEndpoints:
 
         # VENDEDOR should be able to view invoices
         assert response.status_code == 200
+
+
+@pytest.mark.unit
+@pytest.mark.invoice_endpoints
+class TestIdempotentInvoiceProcessing:
+    """Test retries of POST /api/invoices/process"""
+
+    def _post(self, client, user, data, idempotency_key=None):
+        import json
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': user.username})}"}
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        return client.post("/api/invoices/process", data={"invoice_data": json.dumps(data)}, headers=headers)
+
+    def test_retry_returns_stored_invoice(self, client, test_admin, sample_invoice_data):
+        """Test that a retried submission returns the same invoice, marked as replayed"""
+        first = self._post(client, test_admin, sample_invoice_data, idempotency_key="upload-1")
+        second = self._post(client, test_admin, sample_invoice_data, idempotency_key="upload-1")
+
+        assert first.status_code == second.status_code == 200
+        assert second.json()["id"] == first.json()["id"]
+        assert "Idempotent-Replayed" not in first.headers
+        assert second.headers["Idempotent-Replayed"] == "true"
+
+    def test_duplicate_number_returns_400_not_500(self, client, test_admin, sample_invoice_data):
+        """Test that another invoice with a stored number is rejected with 400"""
+        self._post(client, test_admin, sample_invoice_data)
+        other = dict(sample_invoice_data, factura=dict(sample_invoice_data["factura"], cufe="otro-cufe"))
+
+        response = self._post(client, test_admin, other)
+
+        assert response.status_code == 400
+        assert "ya existe" in response.json()["detail"]
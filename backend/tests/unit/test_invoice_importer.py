@@ -0,0 +1,198 @@
+"""
+Unit tests for the bulk invoice importer (invoice_importer.py)
+"""
+import io
+import json
+import zipfile
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from auth import UserPrincipal, create_access_token
+from database import Base
+from invoice_importer import ImportSource, import_invoices, load_sources, load_zip, plan_waves
+from models import InventoryMovement, Product, PurchaseInvoice, Supplier, User, UserLocation, UserRole
+
+
+def _invoice(numero, fecha, lines, nit="900111222-3"):
+    return {
+        "proveedor": {"nit": nit, "razon_social": "PROVEEDOR IMPORTACION S.A.S"},
+        "factura": {"numero": numero, "fecha": fecha, "cufe": f"cufe-{numero}"},
+        "productos": [
+            {"referencia": ref, "nombre": f"PRODUCTO IMPORTADO {ref}", "cantidad": qty,
+             "precio_unitario": 1000.0, "total": 1000.0 * qty}
+            for ref, qty in lines
+        ],
+        "totales": {"subtotal": 1000.0, "iva": 190.0, "total": 1190.0},
+    }
+
+
+@pytest.fixture
+def file_session_factory(tmp_path):
+    """Sessions on a file database, so worker threads get their own connections"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'import.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    user = User(username="importer", email="importer@example.com", nombre_completo="Importer",
+                password_hash="x", rol=UserRole.ADMIN, ubicacion=UserLocation.COLOMBIA)
+    db.add(user)
+    db.commit()
+    principal = UserPrincipal.from_user(user)
+    db.close()
+    yield factory, principal
+    engine.dispose()
+
+
+@pytest.mark.unit
+@pytest.mark.invoice
+class TestPlanWaves:
+    """Test the conflict-free wave plan"""
+
+    def test_invoices_sharing_products_run_in_later_waves(self, db_session):
+        """Test that only invoices with disjoint products run together"""
+        sources = [
+            ImportSource(name="a.json", data=_invoice("A", "2024-01-01", [("P1", 1), ("P2", 1)])),
+            ImportSource(name="b.json", data=_invoice("B", "2024-01-02", [("P3", 1)])),
+            ImportSource(name="c.json", data=_invoice("C", "2024-01-03", [("P2", 1)])),
+            ImportSource(name="d.json", data=_invoice("A", "2024-01-04", [("P9", 1)])),
+        ]
+
+        waves = plan_waves(db_session, sources)
+
+        assert [[s.name for s in wave] for wave in waves] == [["a.json", "b.json"], ["c.json", "d.json"]]
+
+
+@pytest.mark.unit
+@pytest.mark.invoice
+class TestImportInvoices:
+    """Test parallel import end to end"""
+
+    def test_parallel_import_keeps_movements_in_invoice_order(self, file_session_factory):
+        """Test that every product's movements follow invoice date order"""
+        factory, principal = file_session_factory
+        sources = [
+            ImportSource(name=f"{i:02d}.json", data=_invoice(f"F-{i:03d}", f"2024-02-{i + 1:02d}", [("COMUN", i + 1), (f"U{i}", 1)]))
+            for i in reversed(range(8))
+        ] + [ImportSource(name="bad.json", error="JSON inválido")]
+        progress = []
+
+        summary = import_invoices(sources, principal, factory, workers=4,
+                                  on_progress=lambda done, total, result: progress.append((done, total)))
+
+        assert summary.processed == 8
+        assert summary.failed == 1
+        assert summary.invoices_per_second > 0
+        assert progress[-1] == (9, 9)
+        db = factory()
+        try:
+            comun = db.query(Product).filter(Product.codigo == "COMUN").one()
+            movements = db.query(InventoryMovement).filter(
+                InventoryMovement.product_id == comun.id
+            ).order_by(InventoryMovement.id).all()
+            assert [m.referencia for m in movements] == [f"F-{i:03d}" for i in range(8)]
+            assert [m.stock_nuevo for m in movements] == [sum(range(1, i + 2)) for i in range(8)]
+            assert db.query(Supplier).count() == 1
+        finally:
+            db.close()
+
+    def test_duplicates_are_reported(self, file_session_factory):
+        """Test that an invoice number seen twice is imported once"""
+        factory, principal = file_session_factory
+        sources = [
+            ImportSource(name="a.json", data=_invoice("F-1", "2024-01-01", [("X1", 1)])),
+            ImportSource(name="a-copy.json", data=_invoice("F-1", "2024-01-01", [("X2", 1)])),
+        ]
+
+        summary = import_invoices(sources, principal, factory, workers=2)
+
+        assert summary.processed == 1
+        assert summary.duplicates == 1
+        assert [r.status for r in summary.results] == ["PROCESADA", "DUPLICADA"]
+
+
+@pytest.mark.unit
+@pytest.mark.invoice
+class TestLoadSources:
+    """Test reading folders and zip archives"""
+
+    def test_load_directory_pairs_pdfs(self, tmp_path):
+        """Test that JSON files are read and PDFs attached by file name"""
+        (tmp_path / "f1.json").write_text(json.dumps(_invoice("F1", "2024-01-01", [("R", 1)])))
+        (tmp_path / "f1.pdf").write_bytes(b"%PDF-1.4")
+        (tmp_path / "f2.json").write_text("{not json")
+
+        sources = load_sources(str(tmp_path))
+
+        assert [(s.name, s.pdf, bool(s.error)) for s in sources] == [("f1.json", b"%PDF-1.4", False), ("f2.json", None, True)]
+
+    def test_load_zip(self):
+        """Test that zip archives are read"""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("lote/f1.json", json.dumps(_invoice("F1", "2024-01-01", [("R", 1)])))
+            archive.writestr("lote/readme.txt", "ignored")
+
+        sources = load_zip(buffer)
+
+        assert [s.numero_factura for s in sources] == ["F1"]
+
+    def test_load_dian_xml(self, tmp_path):
+        """Test that DIAN XML invoices are parsed and broken ones reported"""
+        from tests.unit.test_ubl_parser import make_attached_document, make_invoice_xml
+
+        (tmp_path / "ad0900479120.xml").write_text(make_attached_document(make_invoice_xml("FE7")), encoding="utf-8")
+        (tmp_path / "roto.xml").write_text("<Invoice>", encoding="utf-8")
+
+        sources = {s.name: s for s in load_sources(str(tmp_path))}
+
+        assert sources["ad0900479120.xml"].numero_factura == "FE7"
+        assert sources["roto.xml"].error is not None
+
+
+@pytest.mark.unit
+@pytest.mark.invoice_endpoints
+class TestImportEndpoint:
+    """Test POST /api/invoices/import"""
+
+    def _zip(self, invoices):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            for name, data in invoices.items():
+                archive.writestr(name, json.dumps(data))
+        return buffer.getvalue()
+
+    def test_import_zip(self, client, db_session, test_admin):
+        """Test that admins can import a zip and get a per-file summary"""
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_admin.username})}"}
+        archive = self._zip({
+            "f1.json": _invoice("Z-1", "2024-03-01", [("Z1", 2)]),
+            "f2.json": _invoice("Z-2", "2024-03-02", [("Z1", 3)]),
+        })
+
+        response = client.post("/api/invoices/import?workers=1", headers=headers,
+                               files={"archive": ("lote.zip", archive, "application/zip")})
+
+        assert response.status_code == 200
+        summary = response.json()
+        assert summary["processed"] == 2
+        assert [r["numero_factura"] for r in summary["results"]] == ["Z-1", "Z-2"]
+        assert db_session.query(PurchaseInvoice).count() == 2
+
+    def test_import_requires_admin(self, client, test_user):
+        """Test that regular users cannot bulk import"""
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_user.username})}"}
+
+        response = client.post("/api/invoices/import", headers=headers,
+                               files={"archive": ("lote.zip", self._zip({}), "application/zip")})
+
+        assert response.status_code == 403
+
+    def test_import_rejects_non_zip(self, client, test_admin):
+        """Test that a non-zip upload is a 400"""
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_admin.username})}"}
+
+        response = client.post("/api/invoices/import", headers=headers,
+                               files={"archive": ("lote.zip", b"plain text", "application/zip")})
+
+        assert response.status_code == 400
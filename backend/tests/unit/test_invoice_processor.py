@@ -307,52 +307,80 @@ class TestProductProcessing:
 
 @pytest.mark.unit
 @pytest.mark.invoice
+@pytest.mark.asyncio
 class TestInventoryUpdates:
-    """Test inventory update logic"""
+    """Test inventory updates written by invoice processing"""
 
-    def test_update_inventory_increases_stock(self, db_session, test_user, test_product):
-        """Test that inventory update increases stock correctly"""
-        processor = InvoiceProcessor(db_session, test_user)
+    def _line(self, product, cantidad):
+        return {"referencia": product.codigo, "nombre": product.nombre, "cantidad": cantidad,
+                "precio_unitario": product.precio_compra, "total": product.precio_compra * cantidad}
 
+    async def test_invoice_line_increases_stock(self, db_session, test_user, test_product, sample_invoice_data):
+        """Test that a processed line increases stock correctly"""
         old_stock = test_product.stock_actual
-        quantity = 20
-        referencia = "INV-001"
+        sample_invoice_data["productos"] = [self._line(test_product, 20)]
 
-        movement = processor.update_inventory(test_product, quantity, referencia)
+        await InvoiceProcessor(db_session, test_user).process_invoice(sample_invoice_data)
 
-        # Stock should increase
-        assert test_product.stock_actual == old_stock + quantity
+        db_session.refresh(test_product)
+        assert test_product.stock_actual == old_stock + 20
 
-        # Movement should be created
-        assert movement is not None
+    async def test_invoice_line_creates_movement_record(
+        self, db_session, test_user, test_product, sample_invoice_data
+    ):
+        """Test that a processed line creates an entry movement record"""
+        old_stock = test_product.stock_actual
+        numero = sample_invoice_data["factura"]["numero"]
+        sample_invoice_data["productos"] = [self._line(test_product, 15)]
+
+        await InvoiceProcessor(db_session, test_user).process_invoice(sample_invoice_data)
+
+        movement = db_session.query(InventoryMovement).one()
+        assert movement.product_id == test_product.id
+        assert movement.user_id == test_user.id
         assert movement.tipo == MovementType.ENTRADA
-        assert movement.cantidad == quantity
+        assert movement.cantidad == 15
         assert movement.stock_anterior == old_stock
-        assert movement.stock_nuevo == old_stock + quantity
+        assert movement.stock_nuevo == old_stock + 15
+        assert movement.motivo == f"Compra - Factura {numero}"
+        assert movement.referencia == numero
+
+    async def test_sale_during_invoice_is_not_overwritten(
+        self, db_session, test_user, test_product, sample_invoice_data
+    ):
+        """Test that stock a sale takes after the invoice loaded its products is kept"""
+        from main import _decrement_stock
 
-    def test_update_inventory_creates_movement_record(self, db_session, test_user, test_product):
-        """Test that inventory update creates a movement record"""
+        old_stock = test_product.stock_actual
+        sample_invoice_data["productos"] = [self._line(test_product, 20), self._line(test_product, 5)]
         processor = InvoiceProcessor(db_session, test_user)
+        load_line_products = processor.load_line_products
 
-        quantity = 15
-        referencia = "FAC-123"
+        def load_then_sell(*args):
+            load_line_products(*args)
+            # A sale's atomic decrement reaches the row after the invoice read it
+            assert _decrement_stock(db_session, {test_product.id: 10})
 
-        movement = processor.update_inventory(test_product, quantity, referencia)
+        with patch.object(processor, "load_line_products", side_effect=load_then_sell):
+            await processor.process_invoice(sample_invoice_data)
 
-        assert movement.product_id == test_product.id
-        assert movement.user_id == test_user.id
-        assert movement.motivo == f"Compra - Factura {referencia}"
-        assert movement.referencia == referencia
+        db_session.refresh(test_product)
+        assert test_product.stock_actual == old_stock - 10 + 25
+        movements = db_session.query(InventoryMovement).order_by(InventoryMovement.id).all()
+        assert [(m.stock_anterior, m.stock_nuevo) for m in movements] == [
+            (old_stock - 10, old_stock + 10), (old_stock + 10, old_stock + 15)
+        ]
 
-    def test_update_inventory_from_zero_stock(self, db_session, test_user, test_product_no_stock):
+    async def test_invoice_line_from_zero_stock(
+        self, db_session, test_user, test_product_no_stock, sample_invoice_data
+    ):
         """Test inventory update when starting from zero stock"""
-        processor = InvoiceProcessor(db_session, test_user)
-
         assert test_product_no_stock.stock_actual == 0
+        sample_invoice_data["productos"] = [self._line(test_product_no_stock, 100)]
 
-        quantity = 100
-        processor.update_inventory(test_product_no_stock, quantity, "INV-001")
+        await InvoiceProcessor(db_session, test_user).process_invoice(sample_invoice_data)
 
+        db_session.refresh(test_product_no_stock)
         assert test_product_no_stock.stock_actual == 100
 
 
@@ -371,13 +399,76 @@ class TestInvoiceProcessing:
         # Process invoice once
         await processor.process_invoice(sample_invoice_data)
 
-        # Try to process same invoice again
+        # Try to process another invoice (different CUFE) with the same number
+        other = dict(sample_invoice_data, factura=dict(sample_invoice_data["factura"], cufe="otro-cufe"))
         with pytest.raises(HTTPException) as exc_info:
-            await processor.process_invoice(sample_invoice_data)
+            await processor.process_invoice(other)
 
         assert exc_info.value.status_code == 400
         assert "ya existe" in str(exc_info.value.detail).lower()
 
+    async def test_resubmitted_cufe_returns_stored_invoice(
+        self, db_session, test_user, sample_invoice_data, query_counter
+    ):
+        """Test that the same CUFE is replayed in one lookup without touching stock"""
+        processor = InvoiceProcessor(db_session, test_user)
+        first = await processor.process_invoice(sample_invoice_data)
+        stock = {p.id: p.stock_actual for p in db_session.query(Product).all()}
+
+        query_counter.clear()
+        second = await processor.process_invoice(sample_invoice_data)
+
+        assert second.id == first.id
+        assert processor.replayed is True
+        assert len(query_counter) == 1
+        db_session.expire_all()
+        assert {p.id: p.stock_actual for p in db_session.query(Product).all()} == stock
+        assert db_session.query(PurchaseInvoice).count() == 1
+
+    async def test_concurrent_submission_is_replayed_after_integrity_error(
+        self, db_session, test_user, sample_invoice_data
+    ):
+        """Test that losing the race to the unique indexes returns the winner's invoice"""
+        first = await InvoiceProcessor(db_session, test_user).process_invoice(sample_invoice_data)
+        processor = InvoiceProcessor(db_session, test_user)
+        real_lookup = processor.find_existing_invoice
+
+        # The first lookup misses, as if the other request had not committed yet
+        with patch.object(processor, "find_existing_invoice", side_effect=[None, real_lookup(
+            "F-TEST-001", "test-cufe-123456", None
+        )]):
+            second = await processor.process_invoice(sample_invoice_data)
+
+        assert second.id == first.id
+        assert processor.replayed is True
+        assert db_session.query(PurchaseInvoice).count() == 1
+
+    async def test_idempotency_key_replays_submission(
+        self, db_session, test_user, sample_invoice_data
+    ):
+        """Test that a repeated idempotency key returns the stored invoice"""
+        data = dict(sample_invoice_data, factura=dict(sample_invoice_data["factura"], cufe=None))
+        first = await InvoiceProcessor(db_session, test_user).process_invoice(data, idempotency_key="retry-1")
+
+        processor = InvoiceProcessor(db_session, test_user)
+        second = await processor.process_invoice(data, idempotency_key="retry-1")
+
+        assert second.id == first.id
+        assert processor.replayed is True
+        assert first.idempotency_key == "retry-1"
+
+    async def test_idempotency_key_reused_for_other_invoice_conflicts(
+        self, db_session, test_user, sample_invoice_data
+    ):
+        """Test that a key already used by another invoice returns 409"""
+        await InvoiceProcessor(db_session, test_user).process_invoice(sample_invoice_data, idempotency_key="k-1")
+        other = dict(sample_invoice_data, factura=dict(sample_invoice_data["factura"], numero="F-OTRA", cufe="cufe-otra"))
+
+        with pytest.raises(HTTPException) as exc_info:
+            await InvoiceProcessor(db_session, test_user).process_invoice(other, idempotency_key="k-1")
+
+        assert exc_info.value.status_code == 409
+
     async def test_process_invoice_creates_invoice_with_items(
         self, db_session, test_user, sample_invoice_data
     ):
@@ -496,3 +587,82 @@ class TestInvoiceProcessing:
         assert invoice.subtotal == sample_invoice_data["totales"]["subtotal"]
         assert invoice.iva == sample_invoice_data["totales"]["iva"]
         assert invoice.total == sample_invoice_data["totales"]["total"]
+
+
+@pytest.mark.unit
+@pytest.mark.invoice
+@pytest.mark.asyncio
+class TestInvoiceTransaction:
+    """Test that an invoice is processed as a single unit of work"""
+
+    def _count_commits(self, db_session):
+        from sqlalchemy import event
+
+        commits = []
+        event.listen(db_session, "after_commit", lambda session: commits.append(1))
+        return commits
+
+    def _lines(self, count):
+        return [
+            {"referencia": f"UOW-{i:03d}", "nombre": f"PRODUCTO UNIDAD DE TRABAJO {i:03d}",
+             "cantidad": 2, "precio_unitario": 1000.0, "total": 2000.0}
+            for i in range(count)
+        ]
+
+    async def test_database_phase_runs_off_the_event_loop(self, db_session, test_user, sample_invoice_data):
+        """Test that process_invoice runs its database work in a worker thread"""
+        import threading
+
+        processor = InvoiceProcessor(db_session, test_user)
+        blocking = processor.process_invoice_blocking
+        threads = []
+
+        def record(*args):
+            threads.append(threading.get_ident())
+            return blocking(*args)
+
+        with patch.object(processor, "process_invoice_blocking", side_effect=record):
+            invoice = await processor.process_invoice(sample_invoice_data)
+
+        assert invoice.id is not None
+        assert threads and threads[0] != threading.get_ident()
+
+    async def test_invoice_is_committed_once(self, db_session, test_user, sample_invoice_data, test_product):
+        """Test that supplier, products, items and movements share one commit"""
+        sample_invoice_data["productos"] = self._lines(30) + [
+            {"referencia": test_product.codigo, "nombre": test_product.nombre,
+             "cantidad": 1, "precio_unitario": 80.0, "total": 80.0}
+        ]
+        commits = self._count_commits(db_session)
+
+        invoice = await InvoiceProcessor(db_session, test_user).process_invoice(sample_invoice_data)
+
+        assert len(commits) == 1
+        assert len(invoice.items) == 31
+        assert db_session.query(InventoryMovement).count() == 31
+
+    async def test_repeated_product_lines_keep_running_stock(self, db_session, test_user, sample_invoice_data):
+        """Test that movements chain stock when a product appears twice"""
+        line = self._lines(1)[0]
+        sample_invoice_data["productos"] = [line, dict(line, cantidad=3, total=3000.0)]
+
+        await InvoiceProcessor(db_session, test_user).process_invoice(sample_invoice_data)
+
+        movements = db_session.query(InventoryMovement).order_by(InventoryMovement.id).all()
+        assert [(m.stock_anterior, m.stock_nuevo) for m in movements] == [(0, 2), (2, 5)]
+        assert db_session.query(Product).filter(Product.codigo == "UOW-000").one().stock_actual == 5
+
+    async def test_failure_halfway_leaves_nothing_behind(self, db_session, test_user, sample_invoice_data):
+        """Test that a bad line rolls back products and supplier created before it"""
+        lines = self._lines(3)
+        del lines[2]["cantidad"]
+        sample_invoice_data["productos"] = lines
+        commits = self._count_commits(db_session)
+
+        with pytest.raises(HTTPException):
+            await InvoiceProcessor(db_session, test_user).process_invoice(sample_invoice_data)
+
+        assert commits == []
+        assert db_session.query(Product).filter(Product.codigo.like("UOW-%")).count() == 0
+        assert db_session.query(Supplier).filter(Supplier.nit == sample_invoice_data["proveedor"]["nit"]).count() == 0
+        assert db_session.query(PurchaseInvoice).count() == 0
@@ -0,0 +1,209 @@
+"""
+Unit tests for background jobs (jobs.py) and the job endpoints
+"""
+import io
+import json
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from auth import create_access_token
+from database import Base
+from jobs import JOB_INVOICE_PROCESS, JobQueue
+from models import Job, JobStatus, Product, PurchaseInvoice, User, UserLocation, UserRole
+from storage import ContentStore
+
+
+def _headers(user):
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': user.username})}"}
+
+
+def _invoice(numero, lines=(("J1", 2),)):
+    return {
+        "proveedor": {"nit": "900222333-1", "razon_social": "PROVEEDOR JOBS S.A.S"},
+        "factura": {"numero": numero, "fecha": "2024-03-01", "cufe": f"cufe-{numero}"},
+        "productos": [
+            {"referencia": ref, "nombre": f"PRODUCTO JOB {ref}", "cantidad": qty,
+             "precio_unitario": 1000.0, "total": 1000.0 * qty}
+            for ref, qty in lines
+        ],
+        "totales": {"subtotal": 2000.0, "iva": 380.0, "total": 2380.0},
+    }
+
+
+@pytest.fixture
+def file_session_factory(tmp_path):
+    """Sessions on a file database, so pool threads get their own connections"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    user = User(username="jobs", email="jobs@example.com", nombre_completo="Jobs",
+                password_hash="x", rol=UserRole.ADMIN, ubicacion=UserLocation.COLOMBIA)
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+    yield factory, user_id
+    engine.dispose()
+
+
+@pytest.mark.unit
+@pytest.mark.invoice
+class TestJobQueue:
+    """Test the durable worker pool"""
+
+    def test_pool_processes_jobs_and_records_timings(self, file_session_factory):
+        """Test that queued jobs complete on the pool with queue and processing times"""
+        factory, user_id = file_session_factory
+        queue = JobQueue(workers=2)
+        db = factory()
+        try:
+            jobs = [queue.enqueue(db, JOB_INVOICE_PROCESS, {"invoice_data": _invoice(f"J-{i}", ((f"R{i}", 1),))}, user_id)
+                    for i in range(3)]
+            queue.drain(timeout=30)
+            db.expire_all()
+
+            for job in jobs:
+                job = db.get(Job, job.id)
+                assert job.status == JobStatus.COMPLETADO
+                assert job.progress == 100
+                assert job.queue_seconds >= 0
+                assert job.processing_seconds >= 0
+            assert db.query(PurchaseInvoice).count() == 3
+            assert queue.stats()["completed"] == 3
+        finally:
+            db.close()
+            queue.shutdown()
+
+    def test_failed_job_records_error(self, file_session_factory):
+        """Test that a job whose invoice is rejected ends FALLIDO with the reason"""
+        factory, user_id = file_session_factory
+        queue = JobQueue(workers=0)
+        db = factory()
+        try:
+            queue.enqueue(db, JOB_INVOICE_PROCESS, {"invoice_data": _invoice("J-DUP")}, user_id)
+            other = _invoice("J-DUP")
+            other["factura"]["cufe"] = "otro-cufe"
+            job = queue.enqueue(db, JOB_INVOICE_PROCESS, {"invoice_data": other}, user_id)
+
+            assert job.status == JobStatus.FALLIDO
+            assert "ya existe" in job.error
+            assert job.finished_at is not None
+            assert queue.stats()["failed"] == 1
+        finally:
+            db.close()
+
+    def test_job_is_claimed_once(self, file_session_factory):
+        """Test that running an already claimed job is a no-op"""
+        factory, user_id = file_session_factory
+        queue = JobQueue(workers=0)
+        db = factory()
+        try:
+            job = queue.enqueue(db, JOB_INVOICE_PROCESS, {"invoice_data": _invoice("J-ONCE")}, user_id)
+            queue.run(job.id, factory)
+            db.refresh(job)
+
+            assert job.attempts == 1
+            assert db.query(Product).filter(Product.codigo == "J1").one().stock_actual == 2
+        finally:
+            db.close()
+
+    def test_recover_requeues_pending_and_stale_jobs(self, file_session_factory):
+        """Test that jobs left by a previous run are processed on startup"""
+        factory, user_id = file_session_factory
+        db = factory()
+        try:
+            now = datetime.utcnow()
+            db.add_all([
+                Job(tipo=JOB_INVOICE_PROCESS, status=JobStatus.PENDIENTE, user_id=user_id,
+                    payload=json.dumps({"invoice_data": _invoice("J-P", (("P1", 1),))}), queued_at=now),
+                Job(tipo=JOB_INVOICE_PROCESS, status=JobStatus.EN_PROCESO, user_id=user_id,
+                    payload=json.dumps({"invoice_data": _invoice("J-S", (("S1", 1),))}),
+                    queued_at=now - timedelta(hours=2), started_at=now - timedelta(hours=2), attempts=1),
+                Job(tipo=JOB_INVOICE_PROCESS, status=JobStatus.EN_PROCESO, user_id=user_id,
+                    payload=json.dumps({"invoice_data": _invoice("J-R", (("R1", 1),))}),
+                    queued_at=now, started_at=now, attempts=1),
+            ])
+            db.commit()
+
+            assert JobQueue(workers=0).recover(factory) == 2
+
+            db.expire_all()
+            statuses = {job.payload.count("J-P") and "P" or job.payload.count("J-S") and "S" or "R": job
+                        for job in db.query(Job)}
+            assert statuses["P"].status == JobStatus.COMPLETADO
+            assert statuses["S"].status == JobStatus.COMPLETADO
+            assert statuses["S"].attempts == 2
+            assert statuses["R"].status == JobStatus.EN_PROCESO  # Recently started: still owned by its worker
+        finally:
+            db.close()
+
+
+@pytest.mark.unit
+@pytest.mark.invoice_endpoints
+class TestJobEndpoints:
+    """Test POST /api/invoices/process?background=true and GET /api/jobs/{id}"""
+
+    def test_background_processing_returns_job(self, client, test_admin, sample_invoice_data):
+        """Test that 202 returns the job and polling shows the resulting invoice"""
+        response = client.post(
+            "/api/invoices/process?background=true",
+            data={"invoice_data": json.dumps(sample_invoice_data)},
+            headers=_headers(test_admin),
+        )
+
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+        assert response.headers["Location"] == f"/api/jobs/{job_id}"
+
+        job = client.get(f"/api/jobs/{job_id}", headers=_headers(test_admin)).json()
+        assert job["status"] == "COMPLETADO"
+        assert job["progress"] == 100
+        assert job["result"]["numero_factura"] == sample_invoice_data["factura"]["numero"]
+        assert job["queue_seconds"] is not None
+        assert job["processing_seconds"] is not None
+
+    def test_background_processing_stores_pdf(self, client, test_admin, sample_invoice_data, tmp_path, monkeypatch):
+        """Test that the PDF is stored once before queueing and attached by its key"""
+        import main
+        store = ContentStore(str(tmp_path / "invoices"), suffix=".pdf")
+        monkeypatch.setattr(main, "invoice_pdf_store", store)
+
+        response = client.post(
+            "/api/invoices/process?background=true",
+            data={"invoice_data": json.dumps(sample_invoice_data)},
+            files={"pdf_file": ("factura.pdf", io.BytesIO(b"%PDF-1.4 job"), "application/pdf")},
+            headers=_headers(test_admin),
+        )
+
+        result = response.json()
+        assert result["status"] == "COMPLETADO"
+        assert store.exists(result["result"]["archivo_pdf"])
+        assert store.stats() == {"root": store.root, "saved": 1, "deduplicated": 0, "bytes_written": 12}
+
+    def test_jobs_are_private_to_their_user(self, client, test_user, test_admin, sample_invoice_data):
+        """Test that other non-admin users cannot see a job, but admins can"""
+        response = client.post(
+            "/api/invoices/process?background=true",
+            data={"invoice_data": json.dumps(sample_invoice_data)},
+            headers=_headers(test_admin),
+        )
+        job_id = response.json()["id"]
+
+        assert client.get(f"/api/jobs/{job_id}", headers=_headers(test_user)).status_code == 404
+        assert client.get("/api/jobs/99999", headers=_headers(test_admin)).status_code == 404
+
+    def test_job_stats(self, client, test_admin, sample_invoice_data):
+        """Test that the stats endpoint reports completed jobs and average times"""
+        client.post(
+            "/api/invoices/process?background=true",
+            data={"invoice_data": json.dumps(sample_invoice_data)},
+            headers=_headers(test_admin),
+        )
+
+        stats = client.get("/api/jobs/stats", headers=_headers(test_admin)).json()
+
+        assert stats["completed"] == 1
+        assert "avg_queue_seconds" in stats and "avg_processing_seconds" in stats
@@ -0,0 +1,118 @@
+"""
+Unit tests for list projections (?view=summary)
+"""
+import pytest
+from datetime import datetime
+
+from auth import create_access_token
+from models import Sale, SaleItem, SaleStatus, PurchaseInvoice, PurchaseInvoiceStatus
+from pagination import NEXT_CURSOR_HEADER
+
+
+@pytest.mark.unit
+class TestListProjections:
+    """Test compact summary views of list endpoints"""
+
+    def _headers(self, user):
+        return {"Authorization": f"Bearer {create_access_token(data={'sub': user.username})}"}
+
+    def test_sales_summary_view(self, client, db_session, test_user, test_client_record, test_product, query_counter):
+        """Test that sales summary returns flat rows with the client name"""
+        sale = Sale(
+            numero_venta="VTA-SUM-1",
+            client_id=test_client_record.id,
+            user_id=test_user.id,
+            subtotal=150.0,
+            total=178.5,
+            metodo_pago="EFECTIVO",
+            status=SaleStatus.COMPLETADA
+        )
+        sale.items = [SaleItem(product_id=test_product.id, cantidad=1, precio_unitario=150.0, subtotal=150.0)]
+        db_session.add(sale)
+        db_session.commit()
+        sale_id = sale.id
+
+        query_counter.clear()
+        response = client.get("/sales?view=summary", headers=self._headers(test_user))
+
+        assert response.status_code == 200
+        rows = response.json()
+        assert rows == [{
+            "id": sale_id,
+            "numero_venta": "VTA-SUM-1",
+            "total": 178.5,
+            "status": "COMPLETADA",
+            "created_at": rows[0]["created_at"],
+            "client_nombre": test_client_record.nombre_completo,
+        }]
+        # Only the sales+clients projection is read, no items, products or users
+        data_queries = [s for s in query_counter if "FROM sales" in s]
+        assert len(data_queries) == 1
+        assert "sale_items" not in data_queries[0]
+        assert "products" not in data_queries[0]
+
+    def test_products_summary_view(self, client, test_user, test_product):
+        """Test that products summary only exposes the compact fields"""
+        response = client.get("/products?view=summary", headers=self._headers(test_user))
+
+        assert response.status_code == 200
+        assert response.json() == [{
+            "id": test_product.id,
+            "codigo": test_product.codigo,
+            "nombre": test_product.nombre,
+            "precio_venta": test_product.precio_venta,
+            "stock_actual": test_product.stock_actual,
+        }]
+
+    def test_clients_summary_view(self, client, test_user, test_client_record):
+        """Test that clients summary only exposes the compact fields"""
+        response = client.get("/clients?view=summary", headers=self._headers(test_user))
+
+        assert response.status_code == 200
+        assert set(response.json()[0]) == {"id", "documento", "nombre_completo", "telefono"}
+
+    def test_invoices_summary_view(self, client, db_session, test_admin, test_supplier):
+        """Test that purchase invoices summary includes the supplier name"""
+        db_session.add(PurchaseInvoice(
+            numero_factura="F-SUM-1",
+            supplier_id=test_supplier.id,
+            fecha_emision=datetime(2025, 1, 15),
+            subtotal=100.0,
+            iva=19.0,
+            total=119.0,
+            status=PurchaseInvoiceStatus.PROCESADA
+        ))
+        db_session.commit()
+
+        response = client.get("/api/invoices?view=summary", headers=self._headers(test_admin))
+
+        assert response.status_code == 200
+        row = response.json()[0]
+        assert row["numero_factura"] == "F-SUM-1"
+        assert row["supplier_razon_social"] == test_supplier.razon_social
+        assert "items" not in row
+
+    def test_summary_view_supports_cursor(self, client, db_session, test_user, test_product):
+        """Test that summary views are paginated like full views"""
+        from models import Product, ProductCategory
+
+        db_session.add(Product(
+            codigo="SUM-002", nombre="Second", categoria=ProductCategory.ACCESORIOS,
+            precio_compra=1.0, precio_venta=2.0, is_active=True
+        ))
+        db_session.commit()
+        headers = self._headers(test_user)
+
+        first = client.get("/products?view=summary&limit=1", headers=headers)
+        next_cursor = first.headers[NEXT_CURSOR_HEADER]
+        second = client.get(f"/products?view=summary&limit=1&cursor={next_cursor}", headers=headers)
+
+        assert first.json()[0]["codigo"] == test_product.codigo
+        assert second.json()[0]["codigo"] == "SUM-002"
+        assert NEXT_CURSOR_HEADER not in second.headers
+
+    def test_invalid_view_is_rejected(self, client, test_user):
+        """Test that unknown view names return 422"""
+        response = client.get("/products?view=everything", headers=self._headers(test_user))
+
+        assert response.status_code == 422
@@ -0,0 +1,196 @@
+"""
+Unit tests for the login rate limiter (login_limiter.py)
+"""
+import pytest
+from unittest.mock import patch
+
+from login_limiter import LoginRateLimiter, client_ip
+from models import LoginFailure
+
+
+@pytest.mark.unit
+@pytest.mark.auth
+class TestLoginRateLimiter:
+    """Test sliding window, backoff and persistence"""
+
+    def _limiter(self, **kwargs):
+        options = dict(window=60, max_per_user=3, max_per_ip=10, backoff_base=10, backoff_max=100, persist=False)
+        options.update(kwargs)
+        return LoginRateLimiter(**options)
+
+    def test_allows_until_limit_then_backs_off(self):
+        """Test that the attempt after the limit is rejected with a retry delay"""
+        limiter = self._limiter()
+        keys = limiter.keys_for("Cajero", "10.0.0.1")
+
+        with patch("login_limiter.time.time", return_value=1000.0):
+            assert [limiter.acquire(keys)[0] for _ in range(3)] == [0.0, 0.0, 0.0]
+            assert limiter.acquire(keys) == (10.0, None)
+
+        assert limiter.stats()["rejected_by_user"] == 1
+
+    def test_backoff_grows_exponentially(self):
+        """Test that each failure after the lockout doubles the wait"""
+        limiter = self._limiter()
+        keys = limiter.keys_for("cajero", None)
+        now = 1000.0
+        waits = []
+        for _ in range(6):
+            with patch("login_limiter.time.time", return_value=now):
+                wait, _ = limiter.acquire(keys)
+            waits.append(wait)
+            now += wait or 0.1
+
+        assert waits[3:6] == [pytest.approx(9.9), 0.0, pytest.approx(19.9)]
+
+    def test_window_slides(self):
+        """Test that attempts older than the window no longer count"""
+        limiter = self._limiter()
+        keys = limiter.keys_for("cajero", None)
+        with patch("login_limiter.time.time", return_value=1000.0):
+            for _ in range(3):
+                limiter.acquire(keys)
+        with patch("login_limiter.time.time", return_value=1061.0):
+            assert limiter.acquire(keys)[0] == 0.0
+
+    def test_success_clears_user_failures(self):
+        """Test that a successful login resets the username's window"""
+        limiter = self._limiter()
+        keys = limiter.keys_for("cajero", "10.0.0.1")
+        for _ in range(2):
+            limiter.acquire(keys)
+            limiter.record_failure(keys)
+        _, attempt = limiter.acquire(keys)
+        limiter.record_success(keys, attempt)
+
+        assert limiter.acquire(keys)[0] == 0.0
+        assert limiter.stats()["failures"] == 2
+
+    def test_success_removes_its_own_ip_attempt(self):
+        """Test that a success forgets its own IP entry, not a concurrent attempt's"""
+        limiter = self._limiter(max_per_ip=2)
+        with patch("login_limiter.time.time", return_value=1000.0):
+            _, first = limiter.acquire(limiter.keys_for("user1", "10.0.0.9"))
+        with patch("login_limiter.time.time", return_value=1050.0):
+            limiter.acquire(limiter.keys_for("user2", "10.0.0.9"))  # Still pending
+            limiter.record_success(limiter.keys_for("user1", "10.0.0.9"), first)
+
+        with patch("login_limiter.time.time", return_value=1070.0):
+            assert limiter.acquire(limiter.keys_for("user3", "10.0.0.9"))[0] == 0.0
+            assert limiter.acquire(limiter.keys_for("user4", "10.0.0.9"))[0] > 0
+
+    def test_released_attempts_do_not_count(self):
+        """Test that attempts ending without a password check leave no trace"""
+        limiter = self._limiter()
+        keys = limiter.keys_for("cajero", "10.0.0.1")
+        for _ in range(5):
+            _, attempt = limiter.acquire(keys)
+            limiter.release(keys, attempt)
+
+        assert limiter.acquire(keys)[0] == 0.0
+
+    def test_ip_limit_covers_many_usernames(self):
+        """Test that spraying usernames from one IP is limited"""
+        limiter = self._limiter(max_per_ip=4)
+        with patch("login_limiter.time.time", return_value=1000.0):
+            results = [limiter.acquire(limiter.keys_for(f"user{i}", "10.0.0.9"))[0] for i in range(5)]
+
+        assert results[:4] == [0.0] * 4
+        assert results[4] > 0
+        assert limiter.stats()["rejected_by_ip"] == 1
+
+    def test_persisted_failures_survive_restart(self, db_session):
+        """Test that a new limiter restores stored failures"""
+        keys = LoginRateLimiter.keys_for("cajero", None)
+        first = self._limiter(persist=True)
+        for _ in range(3):
+            first.acquire(keys)
+            first.record_failure(keys, db_session)
+
+        restarted = self._limiter(persist=True)
+        assert restarted.load(db_session) == 3
+        assert restarted.acquire(keys)[0] > 0
+        assert db_session.query(LoginFailure).count() == 3
+
+    def test_client_ip_trusts_forwarded_for_only_from_proxies(self):
+        """Test that X-Forwarded-For is used only when the peer is a trusted proxy"""
+        proxies = {"10.0.0.2", "10.0.0.3"}
+
+        assert client_ip("10.0.0.2", "203.0.113.7", proxies) == "203.0.113.7"
+        assert client_ip("10.0.0.2", "198.51.100.1, 203.0.113.7, 10.0.0.3", proxies) == "203.0.113.7"
+        assert client_ip("203.0.113.99", "198.51.100.1", proxies) == "203.0.113.99"
+        assert client_ip("10.0.0.2", None, proxies) == "10.0.0.2"
+        assert client_ip("10.0.0.2", "203.0.113.7", set()) == "10.0.0.2"
+
+
+@pytest.mark.unit
+@pytest.mark.auth
+class TestLoginEndpointLimiter:
+    """Test the limiter on /auth/login"""
+
+    def test_flood_is_rejected_before_bcrypt(self, client, test_user, monkeypatch):
+        """Test that locked-out attempts return 429 without verifying a password"""
+        from main import login_limiter, password_hasher
+
+        monkeypatch.setattr(login_limiter, "limits", {"user": 2, "ip": 100})
+        for _ in range(2):
+            response = client.post("/auth/login", json={"username": test_user.username, "password": "wrong"})
+            assert response.status_code == 401
+
+        monkeypatch.setattr(password_hasher, "submit", lambda *args: pytest.fail("bcrypt ran"))
+        response = client.post("/auth/login", json={"username": test_user.username, "password": "wrong"})
+
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) > 0
+
+    def test_busy_hashing_pool_does_not_lock_out(self, client, test_user, monkeypatch):
+        """Test that logins answered 503 by a saturated pool are not counted as failures"""
+        from main import login_limiter, password_hasher
+        from password_hashing import PasswordHashPoolBusy
+
+        def busy(*args):
+            raise PasswordHashPoolBusy()
+
+        monkeypatch.setattr(login_limiter, "limits", {"user": 2, "ip": 2})
+        with monkeypatch.context() as saturated:
+            saturated.setattr(password_hasher, "submit", busy)
+            for _ in range(4):
+                response = client.post("/auth/login", json={"username": test_user.username, "password": "testpassword123"})
+                assert response.status_code == 503
+
+        response = client.post("/auth/login", json={"username": test_user.username, "password": "testpassword123"})
+
+        assert response.status_code == 200
+        assert login_limiter.stats()["failures"] == 0
+
+    def test_forwarded_for_from_trusted_proxy_keys_the_ip(self, client, test_user, monkeypatch):
+        """Test that clients behind a trusted proxy get their own IP window"""
+        import main
+        from main import login_limiter
+
+        monkeypatch.setattr(login_limiter, "limits", {"user": 100, "ip": 2})
+        monkeypatch.setattr(main, "client_ip", lambda peer, forwarded_for: client_ip(peer, forwarded_for, {peer}))
+        for _ in range(2):
+            client.post("/auth/login", json={"username": test_user.username, "password": "wrong"},
+                        headers={"X-Forwarded-For": "203.0.113.7"})
+
+        blocked = client.post("/auth/login", json={"username": test_user.username, "password": "wrong"},
+                              headers={"X-Forwarded-For": "203.0.113.7"})
+        other = client.post("/auth/login", json={"username": test_user.username, "password": "wrong"},
+                            headers={"X-Forwarded-For": "203.0.113.8"})
+
+        assert blocked.status_code == 429
+        assert other.status_code == 401
+
+    def test_limiter_stats_endpoint(self, client, test_admin, test_user):
+        """Test that rejected attempt metrics are exposed to admins"""
+        from auth import create_access_token
+
+        client.post("/auth/login", json={"username": test_user.username, "password": "wrong"})
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_admin.username})}"}
+
+        response = client.get("/api/auth/limiter/stats", headers=headers)
+
+        assert response.status_code == 200
+        assert response.json()["failures"] == 1
+        assert response.json()["rejected"] == 0
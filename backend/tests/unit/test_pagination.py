@@ -0,0 +1,124 @@
+"""
+Unit tests for keyset pagination (pagination.py and list endpoints)
+"""
+import pytest
+
+from auth import create_access_token
+from models import Product, ProductCategory
+from pagination import encode_cursor, decode_cursor, NEXT_CURSOR_HEADER, MAX_PAGE_SIZE
+
+
+def _create_products(db_session, count):
+    db_session.add_all([
+        Product(
+            codigo=f"PAGE-{i:03d}",
+            nombre=f"Paged Product {i}",
+            categoria=ProductCategory.ACCESORIOS,
+            precio_compra=10.0,
+            precio_venta=15.0,
+            is_active=True
+        )
+        for i in range(count)
+    ])
+    db_session.commit()
+
+
+@pytest.mark.unit
+class TestCursorEncoding:
+    """Test opaque cursor encoding"""
+
+    def test_cursor_round_trip(self):
+        """Test that a cursor decodes to the id it was built from"""
+        assert decode_cursor(encode_cursor(1234)) == 1234
+
+    @pytest.mark.parametrize("cursor", ["not-a-cursor", "e30", encode_cursor(1)[:-2] + "!!"])
+    def test_invalid_cursor_raises_400(self, cursor):
+        """Test that malformed cursors are rejected"""
+        from fastapi import HTTPException
+
+        with pytest.raises(HTTPException) as exc_info:
+            decode_cursor(cursor)
+        assert exc_info.value.status_code == 400
+
+
+@pytest.mark.unit
+@pytest.mark.products
+class TestCursorPagination:
+    """Test cursor pagination on list endpoints"""
+
+    def test_walk_all_pages_with_cursor(self, client, test_user, db_session):
+        """Test that following next cursors returns every row exactly once"""
+        _create_products(db_session, 12)
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_user.username})}"}
+
+        seen = []
+        url = "/products?limit=5"
+        pages = 0
+        while url:
+            response = client.get(url, headers=headers)
+            assert response.status_code == 200
+            seen.extend(p["id"] for p in response.json())
+            pages += 1
+            next_cursor = response.headers.get(NEXT_CURSOR_HEADER)
+            url = f"/products?limit=5&cursor={next_cursor}" if next_cursor else None
+
+        assert pages == 3
+        assert len(seen) == 12
+        assert seen == sorted(set(seen))
+
+    def test_cursor_is_stable_when_rows_are_inserted(self, client, test_user, db_session):
+        """Test that new rows do not shift the next page"""
+        _create_products(db_session, 6)
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_user.username})}"}
+
+        first = client.get("/products?limit=3", headers=headers)
+        next_cursor = first.headers[NEXT_CURSOR_HEADER]
+
+        db_session.add(Product(
+            codigo="PAGE-NEW", nombre="Inserted", categoria=ProductCategory.ACCESORIOS,
+            precio_compra=1.0, precio_venta=2.0, is_active=True
+        ))
+        db_session.commit()
+
+        second = client.get(f"/products?limit=3&cursor={next_cursor}", headers=headers)
+        first_ids = [p["id"] for p in first.json()]
+        second_ids = [p["id"] for p in second.json()]
+
+        assert not set(first_ids) & set(second_ids)
+        assert second_ids[0] == first_ids[-1] + 1
+
+    def test_last_page_has_no_cursor(self, client, test_user, db_session):
+        """Test that no next cursor is returned when there are no more rows"""
+        _create_products(db_session, 2)
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_user.username})}"}
+
+        response = client.get("/products?limit=5", headers=headers)
+
+        assert len(response.json()) == 2
+        assert NEXT_CURSOR_HEADER not in response.headers
+
+    def test_skip_still_supported(self, client, test_user, db_session):
+        """Test that the legacy skip parameter keeps working"""
+        _create_products(db_session, 4)
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_user.username})}"}
+
+        all_ids = [p["id"] for p in client.get("/products", headers=headers).json()]
+        skipped = client.get("/products?skip=2&limit=10", headers=headers)
+
+        assert [p["id"] for p in skipped.json()] == all_ids[2:]
+
+    def test_limit_above_maximum_is_rejected(self, client, test_user):
+        """Test that limit is capped at MAX_PAGE_SIZE"""
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_user.username})}"}
+
+        response = client.get(f"/clients?limit={MAX_PAGE_SIZE + 1}", headers=headers)
+
+        assert response.status_code == 422
+
+    def test_invalid_cursor_on_endpoint_returns_400(self, client, test_user):
+        """Test that endpoints reject malformed cursors"""
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_user.username})}"}
+
+        response = client.get("/sales?cursor=garbage", headers=headers)
+
+        assert response.status_code == 400
@@ -0,0 +1,96 @@
+"""
+Unit tests for the bounded password hashing pool (password_hashing.py)
+"""
+import asyncio
+import threading
+import pytest
+
+from auth import verify_password
+from password_hashing import PasswordHashPool, PasswordHashPoolBusy
+
+
+@pytest.fixture
+def pool():
+    pool = PasswordHashPool(workers=1, max_pending=1)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.unit
+@pytest.mark.auth
+class TestPasswordHashPool:
+    """Test hashing offload and queue limits"""
+
+    def test_hash_and_verify_run_on_pool(self, pool):
+        """Test that async hash/verify produce regular bcrypt results"""
+        async def scenario():
+            hashed = await pool.hash("secret123")
+            return hashed, await pool.verify("secret123", hashed), await pool.verify("wrong", hashed)
+
+        hashed, ok, wrong = asyncio.run(scenario())
+
+        assert verify_password("secret123", hashed)
+        assert ok is True
+        assert wrong is False
+        assert pool.stats()["completed"] == 3
+
+    def test_hash_blocking(self, pool):
+        """Test the synchronous entry point used by sync handlers"""
+        assert verify_password("secret123", pool.hash_blocking("secret123"))
+
+    def test_full_queue_rejects(self, pool):
+        """Test that work beyond workers + queue is rejected instead of piling up"""
+        release = threading.Event()
+        running = pool.submit(release.wait)
+        queued = pool.submit(release.wait)
+
+        with pytest.raises(PasswordHashPoolBusy):
+            pool.submit(release.wait)
+
+        release.set()
+        running.result()
+        queued.result()
+        assert pool.stats()["rejected"] == 1
+        assert pool.stats()["in_flight"] == 0
+
+
+@pytest.mark.unit
+@pytest.mark.auth
+class TestLoginHashingOffload:
+    """Test the login endpoint on top of the hashing pool"""
+
+    def test_login_returns_503_when_pool_is_busy(self, client, test_user, monkeypatch):
+        """Test that a saturated hashing pool answers 503 with Retry-After"""
+        from main import password_hasher
+
+        def busy(*args):
+            raise PasswordHashPoolBusy()
+
+        monkeypatch.setattr(password_hasher, "submit", busy)
+
+        response = client.post("/auth/login", json={"username": test_user.username, "password": "testpassword123"})
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+    def test_create_user_hashes_on_pool(self, client, test_superuser):
+        """Test that users created through the API get a valid bcrypt hash"""
+        from auth import create_access_token
+        from main import password_hasher
+
+        completed = password_hasher.stats()["completed"]
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_superuser.username})}"}
+        response = client.post("/users", headers=headers, json={
+            "username": "pooluser",
+            "email": "pool@example.com",
+            "nombre_completo": "Pool User",
+            "password": "Password123!",
+            "rol": "VENDEDOR",
+            "ubicacion": "COLOMBIA",
+            "is_active": True
+        })
+
+        assert response.status_code == 200
+        assert password_hasher.stats()["completed"] == completed + 1
+        login = client.post("/auth/login", json={"username": "pooluser", "password": "Password123!"})
+        assert login.status_code == 200
@@ -0,0 +1,116 @@
+"""
+Unit tests for the password hashing policy (password_policy.py)
+"""
+import bcrypt
+import pytest
+
+from password_policy import BCRYPT_ROUNDS, configured_rounds, hash_rounds, needs_rehash
+
+
+@pytest.mark.unit
+@pytest.mark.auth
+class TestPasswordPolicy:
+    """Test work factor selection and rehash detection"""
+
+    def test_environment_defaults(self):
+        """Test that each environment gets its own work factor"""
+        assert configured_rounds("production") == 12
+        assert configured_rounds("development") == 10
+        assert configured_rounds("test") == 4
+        assert configured_rounds("staging") == 12
+
+    def test_unset_environment_is_production(self, monkeypatch):
+        """Test that a deployment without ENVIRONMENT hashes at the production cost"""
+        import importlib
+        import password_policy
+
+        monkeypatch.delenv("ENVIRONMENT", raising=False)
+        monkeypatch.delenv("BCRYPT_ROUNDS", raising=False)
+        monkeypatch.setattr("dotenv.load_dotenv", lambda *args, **kwargs: False)
+        try:
+            assert importlib.reload(password_policy).BCRYPT_ROUNDS == 12
+        finally:
+            monkeypatch.undo()
+            importlib.reload(password_policy)
+
+    def test_override_is_applied(self):
+        """Test that BCRYPT_ROUNDS overrides the environment default"""
+        assert configured_rounds("development", "8") == 8
+        assert configured_rounds("production", "13") == 13
+
+    def test_production_cannot_be_weakened(self):
+        """Test that production rejects a cost below its minimum"""
+        with pytest.raises(ValueError):
+            configured_rounds("production", "4")
+
+    def test_invalid_cost_is_rejected(self):
+        """Test that costs outside bcrypt's range are rejected"""
+        with pytest.raises(ValueError):
+            configured_rounds("development", "3")
+
+    def test_hash_rounds_and_needs_rehash(self):
+        """Test that the stored cost is read back from the hash"""
+        hashed = bcrypt.hashpw(b"secret", bcrypt.gensalt(5)).decode()
+
+        assert hash_rounds(hashed) == 5
+        assert needs_rehash(hashed, rounds=6)
+        assert not needs_rehash(hashed, rounds=5)
+        assert needs_rehash("not-a-bcrypt-hash")
+
+    def test_stronger_hash_is_never_downgraded(self):
+        """Test that a hash above the policy cost does not need a rehash"""
+        hashed = bcrypt.hashpw(b"secret", bcrypt.gensalt(6)).decode()
+
+        assert not needs_rehash(hashed, rounds=4)
+
+    def test_suite_runs_with_test_cost(self):
+        """Test that the suite hashes with the cheap test work factor"""
+        from auth import get_password_hash
+
+        assert BCRYPT_ROUNDS == 4
+        assert hash_rounds(get_password_hash("secret")) == 4
+
+
+@pytest.mark.unit
+@pytest.mark.auth
+class TestRehashOnLogin:
+    """Test transparent upgrade of stored hashes"""
+
+    def test_login_rehashes_outdated_hash(self, client, db_session, test_user, monkeypatch):
+        """Test that a hash weaker than the policy is replaced on successful login"""
+        monkeypatch.setattr("password_policy.BCRYPT_ROUNDS", 5)
+        monkeypatch.setattr("auth.BCRYPT_ROUNDS", 5)
+        test_user.password_hash = bcrypt.hashpw(b"testpassword123", bcrypt.gensalt(4)).decode()
+        db_session.commit()
+
+        response = client.post("/auth/login", json={"username": test_user.username, "password": "testpassword123"})
+
+        assert response.status_code == 200
+        db_session.refresh(test_user)
+        assert hash_rounds(test_user.password_hash) == 5
+        again = client.post("/auth/login", json={"username": test_user.username, "password": "testpassword123"})
+        assert again.status_code == 200
+
+    def test_failed_login_keeps_hash(self, client, db_session, test_user):
+        """Test that a wrong password never rewrites the stored hash"""
+        old_hash = bcrypt.hashpw(b"testpassword123", bcrypt.gensalt(5)).decode()
+        test_user.password_hash = old_hash
+        db_session.commit()
+
+        response = client.post("/auth/login", json={"username": test_user.username, "password": "wrong"})
+
+        assert response.status_code == 401
+        db_session.refresh(test_user)
+        assert test_user.password_hash == old_hash
+
+    def test_login_keeps_stronger_hash(self, client, db_session, test_user):
+        """Test that a hash above the policy cost is not rewritten on login"""
+        strong_hash = bcrypt.hashpw(b"testpassword123", bcrypt.gensalt(6)).decode()
+        test_user.password_hash = strong_hash
+        db_session.commit()
+
+        response = client.post("/auth/login", json={"username": test_user.username, "password": "testpassword123"})
+
+        assert response.status_code == 200
+        db_session.refresh(test_user)
+        assert test_user.password_hash == strong_hash
@@ -0,0 +1,96 @@
+"""
+Unit tests for the in-memory product matching index (product_matching.py)
+"""
+import pytest
+
+from invoice_processor import InvoiceProcessor
+from models import Product, ProductCategory
+from product_matching import ProductMatchIndex, normalize_name
+
+
+def _index():
+    return ProductMatchIndex([
+        (3, "MAC001", "Base Liquida MAC Studio Fix"),
+        (1, "AUTO-1", "Labial Mate Rojo Pasion Edicion Especial"),
+        (2, "LAB-02", "labial mate rojo pasion edicion especial"),
+        (4, "SER-01", "Serum Facial Vitamina C"),
+    ])
+
+
+@pytest.mark.unit
+@pytest.mark.invoice
+class TestProductMatchIndex:
+    """Test precedence and lookups of the matching index"""
+
+    def test_code_takes_precedence_over_name(self):
+        """Test that an exact reference wins over a name match"""
+        assert _index().match("SER-01", "Base Liquida MAC Studio Fix") == 4
+
+    def test_exact_name_is_case_insensitive(self):
+        """Test that names match ignoring case and extra whitespace"""
+        assert _index().match("UNKNOWN", "  BASE liquida  MAC studio fix ") == 3
+
+    def test_lowest_id_wins_on_ties(self):
+        """Test that duplicates resolve to the lowest id, like .first()"""
+        assert _index().match("", "LABIAL MATE ROJO PASION EDICION ESPECIAL") == 1
+
+    def test_substring_match_on_name_prefix(self):
+        """Test that long names match products containing their first 30 characters"""
+        index = _index()
+
+        assert index.match("", "Studio Fix") is None  # too short for substring matching
+        assert index.match("", "Mate Rojo Pasion Edicion Especial 3.5g") == 1
+        assert index.match("", "Vitamina C Nueva Formula") is None
+
+    def test_added_and_recoded_products_are_found(self):
+        """Test that products created or recoded during an invoice are indexed"""
+        index = _index()
+        index.find_containing("warm up trigrams")
+        index.add(10, "NEW-10", "Rimel Volumen Extremo Negro")
+        index.set_codigo(1, "AUTO-1", "LAB-01")
+
+        assert index.match("NEW-10", "") == 10
+        assert index.match("", "Volumen Extremo Negro") == 10
+        assert index.match("LAB-01", "") == 1
+        assert index.match("AUTO-1", "") is None
+
+    def test_normalize_name(self):
+        """Test name normalization"""
+        assert normalize_name("  Base\tLÍQUIDA  Mac ") == "base líquida mac"
+
+
+@pytest.mark.unit
+@pytest.mark.invoice
+class TestProcessorUsesIndex:
+    """Test that invoice lines resolve without per-line product searches"""
+
+    async def test_invoice_lines_do_not_scan_products(self, db_session, test_user, sample_invoice_data, query_counter):
+        """Test that the catalog is read once regardless of the number of lines"""
+        db_session.add_all([
+            Product(codigo=f"CAT-{i:04d}", nombre=f"Producto Catalogo Numero {i:04d}",
+                    categoria=ProductCategory.MAQUILLAJE, precio_compra=1000.0, precio_venta=1500.0)
+            for i in range(200)
+        ])
+        db_session.commit()
+        sample_invoice_data["productos"] = [
+            {"referencia": "", "nombre": f"PRODUCTO CATALOGO NUMERO {i:04d} X", "cantidad": 1,
+             "precio_unitario": 1000.0, "total": 1000.0}
+            for i in range(40)
+        ]
+        processor = InvoiceProcessor(db_session, test_user)
+
+        query_counter.clear()
+        invoice = await processor.process_invoice(sample_invoice_data)
+        statements = list(query_counter)
+
+        assert len(invoice.items) == 40
+        assert {item.product.codigo for item in invoice.items} == {f"CAT-{i:04d}" for i in range(40)}
+        scans = [s for s in query_counter if "FROM products" in s and "lower(" in s.lower()]
+        catalog_loads = [s for s in query_counter if "FROM products" in s and "WHERE" not in s]
+        assert scans == []
+        assert len(catalog_loads) == 1
+        # Matched products are loaded together, not with one lookup per line
+        by_id = [s for s in statements if "FROM products" in s and "products.id = ?" in s]
+        batched = [s for s in statements if "FROM products" in s and "products.id IN" in s]
+        assert by_id == []
+        assert len(batched) == 1
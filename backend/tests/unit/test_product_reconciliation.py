@@ -0,0 +1,279 @@
+"""
+Unit tests for the product reconciliation engine (product_reconciliation.py)
+"""
+import math
+import random
+import pytest
+
+from auth import create_access_token
+from invoice_importer import ImportSource, plan_waves
+from invoice_processor import InvoiceProcessor
+from models import Product, ProductCategory, Supplier
+from product_matching import normalize_name
+from product_reconciliation import ProductReconciler, get_reconciler, reconciler_cache
+from supplier_aliases import get_aliases
+
+CATALOG = [
+    (1, "MAC001", "Base Liquida MAC Studio Fix NC20"),
+    (2, "SER-30", "Serum Facial Vitamina C 30ML"),
+    (3, "SER-50", "Serum Facial Vitamina C 50ML"),
+    (4, "LAB-01", "Labial Mate Rojo Pasion"),
+    (5, "SHA-01", "Shampoo Keratina Argan 400ML"),
+]
+
+
+def _product(codigo, nombre, **kwargs):
+    return Product(codigo=codigo, nombre=nombre, categoria=ProductCategory.CUIDADO_PIEL,
+                   precio_compra=1000.0, precio_venta=1500.0, **kwargs)
+
+
+def _invoice(numero, lines):
+    return {
+        "proveedor": {"nit": "900777888-1", "razon_social": "PROVEEDOR RECONCILIACION S.A.S"},
+        "factura": {"numero": numero, "fecha": "2024-05-01", "cufe": f"cufe-{numero}"},
+        "productos": [
+            {"referencia": ref, "nombre": nombre, "cantidad": 1, "precio_unitario": 1000.0, "total": 1000.0}
+            for ref, nombre in lines
+        ],
+        "totales": {"subtotal": 1000.0, "iva": 190.0, "total": 1190.0},
+    }
+
+
+@pytest.fixture
+def auto_apply(monkeypatch):
+    """Enable RECONCILE_AUTO_APPLY where it is read"""
+    for module in ("invoice_processor", "invoice_importer", "main"):
+        monkeypatch.setattr(f"{module}.RECONCILE_AUTO_APPLY", True)
+
+
+def _brute_force_scores(catalog, nombre):
+    """Cosine similarity of binary TF-IDF trigram vectors, one product at a time"""
+    def grams(text):
+        text = f"  {normalize_name(text)} "
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    vectors = {product_id: grams(name) for product_id, _, name in catalog}
+    df = {}
+    for vector in vectors.values():
+        for gram in vector:
+            df[gram] = df.get(gram, 0) + 1
+
+    def idf(gram):
+        return math.log((1 + len(catalog)) / (1 + df.get(gram, 0))) + 1
+
+    query = grams(nombre)
+    query_norm = math.sqrt(sum(idf(gram) ** 2 for gram in query))
+    return {
+        product_id: sum(idf(gram) ** 2 for gram in query & vector)
+        / (query_norm * math.sqrt(sum(idf(gram) ** 2 for gram in vector)))
+        for product_id, vector in vectors.items()
+    }
+
+
+@pytest.mark.unit
+@pytest.mark.invoice
+class TestProductReconciler:
+    """Test scoring and ranking of the trigram matrix"""
+
+    def test_candidates_are_ranked_by_score(self):
+        """Test that the closest name ranks first and scores fall in [0, 1]"""
+        ranked = ProductReconciler(CATALOG).rank(["SERUM FACIAL VIT C 30 ML"])[0]
+
+        assert [candidate.product_id for candidate in ranked] == [2, 3]
+        assert 1 >= ranked[0].score > ranked[1].score > 0
+        assert ranked[0].codigo == "SER-30"
+
+    def test_identical_name_scores_one(self):
+        """Test that case and whitespace do not change the score"""
+        ranked = ProductReconciler(CATALOG).rank(["  labial MATE rojo   pasion"])[0]
+
+        assert ranked[0].product_id == 4
+        assert ranked[0].score == 1.0
+
+    def test_unrelated_and_empty_lines_have_no_candidates(self):
+        """Test that lines below the minimum score get an empty list"""
+        assert ProductReconciler(CATALOG).rank(["XYZ QWERTY", ""]) == [[], []]
+        assert ProductReconciler([]).rank(["Serum"]) == [[]]
+
+    def test_scores_match_brute_force_cosine(self):
+        """Test that batched scores equal the cosine computed product by product"""
+        rng = random.Random(3)
+        words = ["crema", "serum", "labial", "mate", "rosa", "karite", "argan", "vitamina", "hidratante", "noche"]
+        catalog = [(i, None, " ".join(rng.sample(words, 4))) for i in range(1, 201)]
+        lines = [" ".join(rng.sample(words, 3)) for _ in range(10)]
+
+        ranked = ProductReconciler(catalog).rank(lines, limit=3, min_score=0)
+
+        for nombre, candidates in zip(lines, ranked):
+            expected = sorted(_brute_force_scores(catalog, nombre).items(), key=lambda item: (-item[1], item[0]))[:3]
+            assert [(c.product_id, c.score) for c in candidates] == [(i, round(s, 4)) for i, s in expected]
+
+    def test_best_matches_require_same_numbers(self):
+        """Test that sizes or shades that differ are never matched automatically"""
+        reconciler = ProductReconciler(CATALOG)
+
+        assert reconciler.best_matches([
+            "SERUM FACIAL VITAMINA C 30ML.",  # Close enough, same size
+            "SERUM FACIAL VITAMINA C 100ML",  # Different size
+            "LABIAL",  # Too far
+        ]) == [2, None, None]
+
+    def test_added_products_are_candidates(self):
+        """Test that products registered after loading are scored with the catalog"""
+        reconciler = ProductReconciler(CATALOG)
+        reconciler.add(-1, None, "Crema Manos Karite")
+
+        assert reconciler.best_matches(["CREMA DE MANOS KARITE"]) == [-1]
+        assert len(reconciler) == 6
+
+    def test_load_skips_inactive_products(self, db_session):
+        """Test that only active products are loaded"""
+        db_session.add_all([
+            _product("ACT-1", "Crema Hidratante Noche"),
+            _product("INA-1", "Crema Hidratante Noche Vieja", is_active=False),
+        ])
+        db_session.commit()
+
+        ranked = ProductReconciler.load(db_session).rank(["CREMA HIDRATANTE NOCHE VIEJA"])[0]
+
+        assert [candidate.codigo for candidate in ranked] == ["ACT-1"]
+
+
+@pytest.mark.unit
+@pytest.mark.invoice
+class TestReconcilerCache:
+    """Test the shared reconciler of the committed catalog"""
+
+    def test_stock_updates_keep_the_cached_matrix(self, db_session):
+        """Test that only catalog changes (names, codes, active flag) rebuild the matrix"""
+        product = _product("CACHE-1", "Crema Hidratante Noche")
+        db_session.add(product)
+        db_session.commit()
+        reconciler = get_reconciler(db_session)
+        invalidations = reconciler_cache.stats()["invalidations"]
+
+        product.stock_actual = 10
+        db_session.commit()
+        assert get_reconciler(db_session) is reconciler
+
+        product.nombre = "Crema Hidratante Dia"
+        db_session.commit()
+        assert get_reconciler(db_session) is not reconciler
+        assert reconciler_cache.stats()["invalidations"] == invalidations + 1
+
+
+@pytest.mark.unit
+@pytest.mark.invoice
+class TestInvoiceReconciliation:
+    """Test fuzzy matching of invoice lines that nothing matches exactly"""
+
+    async def test_fuzzy_matches_are_not_applied_by_default(self, db_session, test_admin):
+        """Test that without the opt-in a reworded line becomes a new product"""
+        db_session.add(_product("INT-1", "SERUM FACIAL VITAMINA C 30ML"))
+        db_session.commit()
+
+        await InvoiceProcessor(db_session, test_admin).process_invoice(
+            _invoice("REC-1", [("BIO-81", "SERUM FACIAL VITAMINA C X 30ML")])
+        )
+
+        assert db_session.query(Product).count() == 2
+
+    async def test_close_name_reuses_existing_product(self, db_session, test_admin, auto_apply):
+        """Test that a reworded line updates the catalog product instead of creating a duplicate"""
+        product = _product("INT-1", "SERUM FACIAL VITAMINA C 30ML", stock_actual=0)
+        db_session.add(product)
+        db_session.commit()
+
+        invoice = await InvoiceProcessor(db_session, test_admin).process_invoice(
+            _invoice("REC-1", [("BIO-81", "SERUM FACIAL VITAMINA C X 30ML")])
+        )
+
+        assert [item.product_id for item in invoice.items] == [product.id]
+        assert db_session.query(Product).count() == 1
+        db_session.refresh(product)
+        assert product.stock_actual == 1
+
+    async def test_fuzzy_match_is_not_learned_as_alias(self, db_session, test_admin, auto_apply):
+        """Test that the supplier reference of a fuzzy-matched line is not remembered"""
+        db_session.add(_product("INT-1", "SERUM FACIAL VITAMINA C 30ML"))
+        db_session.commit()
+
+        await InvoiceProcessor(db_session, test_admin).process_invoice(
+            _invoice("REC-1", [("BIO-81", "SERUM FACIAL VITAMINA C X 30ML")])
+        )
+
+        supplier = db_session.query(Supplier).filter(Supplier.nit == "900777888-1").one()
+        assert get_aliases(db_session, supplier.id) == {}
+
+    async def test_different_size_creates_new_product(self, db_session, test_admin, auto_apply):
+        """Test that a similar name with another size is a new product"""
+        db_session.add(_product("INT-1", "SERUM FACIAL VITAMINA C 30ML"))
+        db_session.commit()
+
+        await InvoiceProcessor(db_session, test_admin).process_invoice(
+            _invoice("REC-1", [("BIO-82", "SERUM FACIAL VITAMINA C 50ML")])
+        )
+
+        assert db_session.query(Product).count() == 2
+
+    async def test_plan_waves_follows_fuzzy_matches(self, db_session, test_admin, auto_apply):
+        """Test that invoices whose lines reconcile to the same product run in order"""
+        db_session.add(_product("INT-1", "SERUM FACIAL VITAMINA C 30ML"))
+        db_session.commit()
+        sources = [
+            ImportSource(name="a.json", data=_invoice("REC-1", [("A-1", "SERUM FACIAL VITAMINA C X 30ML")])),
+            ImportSource(name="b.json", data=_invoice("REC-2", [("B-1", "Serum Facial Vitamina C 30ML X")])),
+            ImportSource(name="c.json", data=_invoice("REC-3", [("C-1", "SHAMPOO KERATINA 400ML")])),
+        ]
+
+        waves = plan_waves(db_session, sources)
+
+        assert [[s.name for s in wave] for wave in waves] == [["a.json", "c.json"], ["b.json"]]
+
+
+@pytest.mark.unit
+@pytest.mark.products
+class TestReconcileEndpoint:
+    """Test POST /products/reconcile"""
+
+    def test_reconcile_returns_ranked_candidates(self, client, db_session, test_user, auto_apply):
+        """Test that every line gets its candidates and the product processing would take"""
+        db_session.add_all([_product(codigo, nombre) for _, codigo, nombre in CATALOG])
+        db_session.commit()
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_user.username})}"}
+
+        response = client.post("/products/reconcile", json={
+            "productos": [
+                {"referencia": "X-1", "nombre": "SERUM FACIAL VITAMINA C 30ML."},
+                {"nombre": "SERUM FACIAL VITAMINA C 100ML"},
+            ],
+            "limit": 2,
+        }, headers=headers)
+
+        assert response.status_code == 200
+        first, second = response.json()
+        assert first["referencia"] == "X-1"
+        assert [c["codigo"] for c in first["candidates"]] == ["SER-30", "SER-50"]
+        assert first["auto_match_id"] == first["candidates"][0]["product_id"]
+        assert second["auto_match_id"] is None
+        assert len(second["candidates"]) == 2
+
+    def test_no_auto_match_without_opt_in(self, client, db_session, test_user):
+        """Test that candidates are only suggestions when auto-apply is disabled"""
+        db_session.add_all([_product(codigo, nombre) for _, codigo, nombre in CATALOG])
+        db_session.commit()
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_user.username})}"}
+
+        response = client.post("/products/reconcile", json={
+            "productos": [{"nombre": "SERUM FACIAL VITAMINA C 30ML."}],
+        }, headers=headers)
+
+        assert response.status_code == 200
+        assert response.json()[0]["auto_match_id"] is None
+        assert response.json()[0]["candidates"][0]["codigo"] == "SER-30"
+
+    def test_reconcile_requires_authentication(self, client):
+        """Test that anonymous requests are rejected"""
+        response = client.post("/products/reconcile", json={"productos": [{"nombre": "Serum"}]})
+
+        assert response.status_code in (401, 403)
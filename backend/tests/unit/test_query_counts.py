@@ -0,0 +1,161 @@
+"""
+Query-count tests for nested list and detail endpoints
+Ensures loading profiles fetch the whole response graph in a constant number of queries
+"""
+import pytest
+from datetime import datetime
+
+from auth import create_access_token
+from models import (
+    Sale, SaleItem, Product, ProductCategory, SaleStatus,
+    PurchaseInvoice, PurchaseInvoiceItem, PurchaseInvoiceStatus
+)
+
+
+def _create_products(db_session, count):
+    products = [
+        Product(
+            codigo=f"QC-{i:03d}",
+            nombre=f"Query Count Product {i}",
+            categoria=ProductCategory.MAQUILLAJE,
+            precio_compra=10.0,
+            precio_venta=20.0,
+            stock_actual=100,
+            is_active=True
+        )
+        for i in range(count)
+    ]
+    db_session.add_all(products)
+    db_session.commit()
+    return products
+
+
+def _create_sales(db_session, user, client_record, products, count, start=0):
+    for i in range(start, start + count):
+        sale = Sale(
+            numero_venta=f"QC-{i:06d}",
+            client_id=client_record.id,
+            user_id=user.id,
+            subtotal=60.0,
+            total=60.0,
+            metodo_pago="EFECTIVO",
+            status=SaleStatus.COMPLETADA
+        )
+        sale.items = [
+            SaleItem(product_id=p.id, cantidad=1, precio_unitario=20.0, subtotal=20.0)
+            for p in products
+        ]
+        db_session.add(sale)
+    db_session.commit()
+
+
+def _create_invoices(db_session, supplier, products, count):
+    for i in range(count):
+        invoice = PurchaseInvoice(
+            numero_factura=f"QC-F-{i:04d}",
+            supplier_id=supplier.id,
+            fecha_emision=datetime(2025, 1, 15),
+            subtotal=30.0,
+            iva=5.7,
+            total=35.7,
+            status=PurchaseInvoiceStatus.PROCESADA
+        )
+        invoice.items = [
+            PurchaseInvoiceItem(product_id=p.id, cantidad=1, precio_unitario=10.0, subtotal=10.0)
+            for p in products
+        ]
+        db_session.add(invoice)
+    db_session.commit()
+
+
+def _count_selects(client, db_session, query_counter, url, headers):
+    db_session.expire_all()
+    query_counter.clear()
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    # The periodic revocation sync is auth bookkeeping, not part of the response graph
+    return response, len([
+        s for s in query_counter
+        if s.lstrip().startswith("SELECT") and "FROM revoked_tokens" not in s
+    ])
+
+
+@pytest.mark.unit
+class TestLoadingProfiles:
+    """Test that nested responses do not lazy-load per row"""
+
+    def test_sales_list_query_count_is_constant(
+        self, client, db_session, test_user, test_client_record, query_counter
+    ):
+        """Test that GET /sales uses the same number of queries for 1 or 20 sales"""
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_user.username})}"}
+        products = _create_products(db_session, 3)
+        client.get("/sales", headers=headers)  # warm the authenticated-user cache
+
+        _create_sales(db_session, test_user, test_client_record, products, 1)
+        response, few = _count_selects(client, db_session, query_counter, "/sales", headers)
+        assert len(response.json()) == 1
+
+        _create_sales(db_session, test_user, test_client_record, products, 19, start=1)
+        response, many = _count_selects(client, db_session, query_counter, "/sales", headers)
+        assert len(response.json()) == 20
+        assert all(len(sale["items"]) == 3 for sale in response.json())
+
+        assert many == few
+        # sales (joined client/user) + items (joined product); the principal is cached
+        assert many <= 2
+
+    def test_purchase_invoices_list_query_count_is_constant(
+        self, client, db_session, test_admin, test_supplier, query_counter
+    ):
+        """Test that GET /api/invoices uses a constant number of queries"""
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_admin.username})}"}
+        products = _create_products(db_session, 4)
+        _create_invoices(db_session, test_supplier, products, 15)
+
+        response, count = _count_selects(client, db_session, query_counter, "/api/invoices", headers)
+
+        assert len(response.json()) == 15
+        assert all(invoice["supplier"]["nit"] == test_supplier.nit for invoice in response.json())
+        assert count <= 3
+
+    def test_purchase_invoice_detail_query_count(
+        self, client, db_session, test_admin, test_supplier, query_counter
+    ):
+        """Test that GET /api/invoices/{id} loads supplier and items eagerly"""
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_admin.username})}"}
+        products = _create_products(db_session, 10)
+        _create_invoices(db_session, test_supplier, products, 1)
+        invoice_id = db_session.query(PurchaseInvoice.id).scalar()
+
+        response, count = _count_selects(client, db_session, query_counter, f"/api/invoices/{invoice_id}", headers)
+
+        assert len(response.json()["items"]) == 10
+        assert count <= 3
+
+    def test_create_sale_response_query_count(
+        self, client, db_session, test_user, test_client_record, query_counter
+    ):
+        """Test that POST /sales builds its nested response without per-item queries"""
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_user.username})}"}
+        products = _create_products(db_session, 8)
+        sale_data = {
+            "client_id": test_client_record.id,
+            "subtotal": 160.0,
+            "total": 160.0,
+            "metodo_pago": "EFECTIVO",
+            "items": [{"product_id": p.id, "cantidad": 1, "precio_unitario": 20.0} for p in products]
+        }
+
+        db_session.expire_all()
+        query_counter.clear()
+        response = client.post("/sales", json=sale_data, headers=headers)
+
+        assert response.status_code == 200
+        assert len(response.json()["items"]) == 8
+        product_selects = [
+            s for s in query_counter
+            if s.lstrip().startswith("SELECT") and "FROM products" in s and "JOIN" not in s
+        ]
+        # only the basket lock query reads products on its own
+        assert len(product_selects) == 1
@@ -348,3 +348,187 @@ class TestSalesEndpoints:
         assert response.status_code == 200
         sale = response.json()
         assert len(sale["items"]) == 2
+
+    def test_create_sale_decrements_stock_with_single_update(
+        self, client, test_user, test_client_record, db_session, query_counter
+    ):
+        """Test that a multi-line basket locks and decrements stock in fixed round trips"""
+        from models import Product, ProductCategory
+
+        products = []
+        for i in range(5):
+            product = Product(
+                codigo=f"BASKET-{i:03d}",
+                nombre=f"Basket Product {i}",
+                categoria=ProductCategory.MAQUILLAJE,
+                precio_compra=10.0,
+                precio_venta=20.0,
+                stock_actual=10,
+                stock_minimo=1,
+                is_active=True
+            )
+            db_session.add(product)
+            products.append(product)
+        db_session.commit()
+
+        token = create_access_token(data={"sub": test_user.username})
+        headers = {"Authorization": f"Bearer {token}"}
+
+        sale_data = {
+            "client_id": test_client_record.id,
+            "subtotal": 100.0,
+            "total": 100.0,
+            "metodo_pago": "EFECTIVO",
+            "items": [
+                {"product_id": product.id, "cantidad": 1, "precio_unitario": 20.0}
+                for product in products
+            ]
+        }
+
+        response = client.post("/sales", json=sale_data, headers=headers)
+
+        assert response.status_code == 200
+        stock_updates = [s for s in query_counter if s.startswith("UPDATE products")]
+        assert len(stock_updates) == 1
+
+        for product in products:
+            db_session.refresh(product)
+            assert product.stock_actual == 9
+
+    def test_create_sale_aggregates_repeated_product_lines(
+        self, client, test_user, test_client_record, test_product, db_session
+    ):
+        """Test that repeated lines of the same product are checked against total stock"""
+        from models import InventoryMovement
+
+        token = create_access_token(data={"sub": test_user.username})
+        headers = {"Authorization": f"Bearer {token}"}
+
+        initial_stock = test_product.stock_actual
+        line = {"product_id": test_product.id, "cantidad": initial_stock // 2 + 1, "precio_unitario": 150.0}
+        sale_data = {
+            "client_id": test_client_record.id,
+            "subtotal": 150.0,
+            "total": 150.0,
+            "metodo_pago": "EFECTIVO",
+            "items": [line, line]
+        }
+
+        response = client.post("/sales", json=sale_data, headers=headers)
+        assert response.status_code == 400
+        db_session.refresh(test_product)
+        assert test_product.stock_actual == initial_stock
+
+        line["cantidad"] = 2
+        response = client.post("/sales", json=sale_data, headers=headers)
+        assert response.status_code == 200
+
+        movements = db_session.query(InventoryMovement).filter(
+            InventoryMovement.referencia == response.json()["numero_venta"]
+        ).order_by(InventoryMovement.id).all()
+        assert [(m.stock_anterior, m.stock_nuevo) for m in movements] == [
+            (initial_stock, initial_stock - 2),
+            (initial_stock - 2, initial_stock - 4),
+        ]
+
+
+@pytest.mark.unit
+@pytest.mark.sales
+class TestSalesBatchEndpoint:
+    """Test bulk sale ingestion (POST /sales/batch)"""
+
+    def _sale(self, client_id, product_id, cantidad):
+        return {
+            "client_id": client_id,
+            "subtotal": 150.0 * cantidad,
+            "total": 150.0 * cantidad,
+            "metodo_pago": "EFECTIVO",
+            "items": [{"product_id": product_id, "cantidad": cantidad, "precio_unitario": 150.0}]
+        }
+
+    def test_batch_creates_sales_items_and_movements(
+        self, client, test_user, test_client_record, test_product, db_session
+    ):
+        """Test that every accepted sale gets its items, movements and stock update"""
+        from models import Sale, SaleItem, InventoryMovement
+
+        token = create_access_token(data={"sub": test_user.username})
+        headers = {"Authorization": f"Bearer {token}"}
+        initial_stock = test_product.stock_actual
+
+        batch = [self._sale(test_client_record.id, test_product.id, 2) for _ in range(3)]
+        response = client.post("/sales/batch", json=batch, headers=headers)
+
+        assert response.status_code == 200
+        results = response.json()
+        assert [r["status"] for r in results] == ["COMPLETADA"] * 3
+        assert len({r["numero_venta"] for r in results}) == 3
+
+        db_session.refresh(test_product)
+        assert test_product.stock_actual == initial_stock - 6
+        assert db_session.query(Sale).count() == 3
+        assert db_session.query(SaleItem).count() == 3
+
+        movements = db_session.query(InventoryMovement).order_by(InventoryMovement.id).all()
+        assert [m.stock_nuevo for m in movements] == [initial_stock - 2, initial_stock - 4, initial_stock - 6]
+        assert movements[0].referencia == results[0]["numero_venta"]
+
+    def test_batch_rejects_sales_exceeding_remaining_stock(
+        self, client, test_user, test_client_record, test_product, db_session
+    ):
+        """Test that stock is validated cumulatively across the batch"""
+        token = create_access_token(data={"sub": test_user.username})
+        headers = {"Authorization": f"Bearer {token}"}
+        initial_stock = test_product.stock_actual
+
+        batch = [
+            self._sale(test_client_record.id, test_product.id, initial_stock - 1),
+            self._sale(test_client_record.id, test_product.id, 2),
+            self._sale(test_client_record.id, 99999, 1),
+            self._sale(test_client_record.id, test_product.id, 1),
+        ]
+        response = client.post("/sales/batch", json=batch, headers=headers)
+
+        assert response.status_code == 200
+        results = response.json()
+        assert [r["status"] for r in results] == ["COMPLETADA", "RECHAZADA", "RECHAZADA", "COMPLETADA"]
+        assert "Insufficient stock" in results[1]["detail"]
+        assert "not found" in results[2]["detail"]
+        assert results[1]["sale_id"] is None
+
+        db_session.refresh(test_product)
+        assert test_product.stock_actual == 0
+
+    def test_batch_uses_fixed_number_of_statements(
+        self, client, test_user, test_client_record, test_product, query_counter
+    ):
+        """Test that the batch cost does not grow with the number of sales"""
+        token = create_access_token(data={"sub": test_user.username})
+        headers = {"Authorization": f"Bearer {token}"}
+
+        batch = [self._sale(test_client_record.id, test_product.id, 1) for _ in range(20)]
+        response = client.post("/sales/batch", json=batch, headers=headers)
+
+        assert response.status_code == 200
+        writes = [s for s in query_counter if s.startswith(("INSERT", "UPDATE"))]
+        # sequence reservation (update + insert), sales, stock update, items, movements, daily summary
+        assert len(writes) <= 7
+
+    def test_batch_too_large_returns_400(self, client, test_user, test_client_record, test_product, monkeypatch):
+        """Test that batches above SALES_BATCH_MAX are refused"""
+        import main
+
+        monkeypatch.setattr(main, "SALES_BATCH_MAX", 2)
+        token = create_access_token(data={"sub": test_user.username})
+        headers = {"Authorization": f"Bearer {token}"}
+
+        batch = [self._sale(test_client_record.id, test_product.id, 1) for _ in range(3)]
+        response = client.post("/sales/batch", json=batch, headers=headers)
+
+        assert response.status_code == 400
+
+    def test_batch_requires_authentication(self, client):
+        """Test that batch ingestion requires authentication"""
+        response = client.post("/sales/batch", json=[])
+
+        assert response.status_code == 403
@@ -0,0 +1,130 @@
+"""
+Unit tests for the daily sales summary (sales_summary.py)
+Tests incremental maintenance, cancellation, bulk sales and rebuild
+"""
+import pytest
+from datetime import datetime
+
+from auth import create_access_token
+from models import DailySalesSummary, Sale, SaleStatus, UserLocation
+from sales_summary import rebuild_daily_sales_summary
+
+
+def _sale_payload(client_id, product_id, total):
+    return {
+        "client_id": client_id,
+        "subtotal": total,
+        "total": total,
+        "metodo_pago": "EFECTIVO",
+        "items": [{"product_id": product_id, "cantidad": 1, "precio_unitario": total}]
+    }
+
+
+def _summary_rows(db_session):
+    db_session.expire_all()
+    return {
+        (row.fecha, row.ubicacion): (row.num_ventas, row.total_ventas)
+        for row in db_session.query(DailySalesSummary).all()
+    }
+
+
+@pytest.mark.unit
+@pytest.mark.dashboard
+class TestDailySalesSummary:
+    """Test that the summary follows sales in the same transaction"""
+
+    def test_create_sale_updates_summary(self, client, db_session, test_user, test_client_record, test_product):
+        """Test that POST /sales adds to today's row for the seller location"""
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_user.username})}"}
+
+        client.post("/sales", json=_sale_payload(test_client_record.id, test_product.id, 100.0), headers=headers)
+        client.post("/sales", json=_sale_payload(test_client_record.id, test_product.id, 50.0), headers=headers)
+
+        today = datetime.utcnow().date()
+        assert _summary_rows(db_session) == {(today, UserLocation.COLOMBIA): (2, 150.0)}
+
+    def test_batch_sales_update_summary(self, client, db_session, test_user, test_client_record, test_product):
+        """Test that bulk-inserted sales are also counted"""
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_user.username})}"}
+        batch = [_sale_payload(test_client_record.id, test_product.id, 10.0) for _ in range(3)]
+
+        client.post("/sales/batch", json=batch, headers=headers)
+
+        today = datetime.utcnow().date()
+        assert _summary_rows(db_session) == {(today, UserLocation.COLOMBIA): (3, 30.0)}
+
+    def test_sale_without_created_at_keeps_its_day_on_rebuild(
+        self, db_session, test_user, test_client_record, monkeypatch
+    ):
+        """Test that a sale left to the default timestamp is dated by one clock (UTC)"""
+        import sales_summary
+
+        class LateEvening(datetime):
+            """22:00 local in UTC-5, already the next day in UTC"""
+            @classmethod
+            def now(cls, tz=None):
+                return datetime(2026, 10, 17, 22, 0)
+
+            @classmethod
+            def utcnow(cls):
+                return datetime(2026, 10, 18, 3, 0)
+
+        monkeypatch.setattr(sales_summary, "datetime", LateEvening)
+        db_session.add(Sale(
+            numero_venta="VTA-SUMM-UTC", client_id=test_client_record.id, user_id=test_user.id,
+            subtotal=25.0, total=25.0, metodo_pago="EFECTIVO", status=SaleStatus.COMPLETADA
+        ))
+        db_session.commit()
+        incremental = _summary_rows(db_session)
+
+        rebuild_daily_sales_summary(db_session)
+
+        assert incremental == {(datetime(2026, 10, 18).date(), UserLocation.COLOMBIA): (1, 25.0)}
+        assert _summary_rows(db_session) == incremental
+
+    def test_cancellation_subtracts_from_summary(self, db_session, test_user, test_client_record):
+        """Test that cancelling a completed sale removes it from its day"""
+        day = datetime(2025, 3, 1, 10, 0)
+        sale = Sale(
+            numero_venta="VTA-SUMM-1", client_id=test_client_record.id, user_id=test_user.id,
+            subtotal=80.0, total=80.0, metodo_pago="EFECTIVO",
+            status=SaleStatus.COMPLETADA, created_at=day
+        )
+        db_session.add(sale)
+        db_session.commit()
+        assert _summary_rows(db_session) == {(day.date(), UserLocation.COLOMBIA): (1, 80.0)}
+
+        sale.status = SaleStatus.CANCELADA
+        db_session.commit()
+
+        assert _summary_rows(db_session) == {(day.date(), UserLocation.COLOMBIA): (0, 0.0)}
+
+    def test_rebuild_matches_incremental(self, db_session, test_user, test_superuser, test_client_record):
+        """Test that rebuilding from sales reproduces the incremental rows"""
+        for i, (user, status) in enumerate([
+            (test_user, SaleStatus.COMPLETADA),
+            (test_user, SaleStatus.CANCELADA),
+            (test_superuser, SaleStatus.COMPLETADA),
+        ]):
+            db_session.add(Sale(
+                numero_venta=f"VTA-RB-{i}", client_id=test_client_record.id, user_id=user.id,
+                subtotal=10.0 * (i + 1), total=10.0 * (i + 1), metodo_pago="EFECTIVO",
+                status=status, created_at=datetime(2025, 4, 2, 9, 0)
+            ))
+        db_session.commit()
+        incremental = _summary_rows(db_session)
+
+        rebuild_daily_sales_summary(db_session)
+
+        assert _summary_rows(db_session) == incremental
+        assert incremental[(datetime(2025, 4, 2).date(), UserLocation.EEUU)] == (1, 30.0)
+
+    def test_dashboard_reads_summary(self, client, test_admin, test_client_record, test_product):
+        """Test that dashboard today/month totals come from the summary"""
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_admin.username})}"}
+        client.post("/sales", json=_sale_payload(test_client_record.id, test_product.id, 120.0), headers=headers)
+
+        metrics = client.get("/dashboard/metrics", headers=headers).json()
+
+        assert metrics["total_ventas_hoy"] == 120.0
+        assert metrics["ventas_mes"] == 120.0
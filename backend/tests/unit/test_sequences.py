@@ -0,0 +1,107 @@
+"""
+Unit tests for sequence allocation module (sequences.py)
+Tests block reservation, uniqueness across allocators and sale numbering
+"""
+import pytest
+
+from sequences import SequenceAllocator
+from models import SequenceCounter, Sale
+from auth import create_access_token
+
+
+@pytest.mark.unit
+@pytest.mark.sales
+class TestSequenceAllocator:
+    """Test block-based number allocation"""
+
+    def test_next_value_starts_at_one(self, db_session):
+        """Test that a new sequence starts at 1 by default"""
+        allocator = SequenceAllocator("test_seq", block_size=5)
+
+        assert allocator.next_value(db_session) == 1
+        assert allocator.next_value(db_session) == 2
+
+    def test_reserves_one_block_per_round_trip(self, db_session, query_counter):
+        """Test that the counter table is only touched once per block"""
+        allocator = SequenceAllocator("test_seq", block_size=10)
+
+        values = [allocator.next_value(db_session) for _ in range(10)]
+
+        assert values == list(range(1, 11))
+        reservations = [s for s in query_counter if s.startswith("INSERT INTO sequence_counters")]
+        assert len(reservations) == 1
+
+    def test_allocators_sharing_database_never_overlap(self, db_session):
+        """Test that two workers reserving from the same counter get disjoint numbers"""
+        worker_a = SequenceAllocator("test_seq", block_size=3)
+        worker_b = SequenceAllocator("test_seq", block_size=3)
+
+        values = []
+        for _ in range(7):
+            values.append(worker_a.next_value(db_session))
+            values.append(worker_b.next_value(db_session))
+
+        assert len(values) == len(set(values))
+
+        counter = db_session.get(SequenceCounter, "test_seq")
+        assert counter.next_value > max(values)
+
+    def test_reserve_larger_than_block(self, db_session):
+        """Test reserving more numbers than the block size at once"""
+        allocator = SequenceAllocator("test_seq", block_size=2)
+
+        values = allocator.reserve(db_session, 5)
+
+        assert values == [1, 2, 3, 4, 5]
+
+    def test_initial_value_callback(self, db_session):
+        """Test that the first block continues from the provided initial value"""
+        allocator = SequenceAllocator("test_seq", block_size=5, initial_value=lambda conn: 100)
+
+        assert allocator.next_value(db_session) == 100
+
+    def test_reset_skips_reserved_numbers(self, db_session):
+        """Test that reset discards the in-memory block without reusing numbers"""
+        allocator = SequenceAllocator("test_seq", block_size=5)
+        first = allocator.next_value(db_session)
+
+        allocator.reset()
+
+        assert allocator.next_value(db_session) > first + 4
+
+
+@pytest.mark.unit
+@pytest.mark.sales
+class TestSaleNumbering:
+    """Test that sales draw their numbers from the sequence"""
+
+    def test_sale_number_continues_after_existing_sales(
+        self, client, db_session, test_user, test_client_record, test_product
+    ):
+        """Test that numbering continues after sales created before the sequence existed"""
+        legacy_sale = Sale(
+            numero_venta="VTA-000041",
+            client_id=test_client_record.id,
+            user_id=test_user.id,
+            subtotal=10.0,
+            total=10.0,
+            metodo_pago="EFECTIVO"
+        )
+        legacy_sale.id = 41
+        db_session.add(legacy_sale)
+        db_session.commit()
+
+        token = create_access_token(data={"sub": test_user.username})
+        headers = {"Authorization": f"Bearer {token}"}
+        sale_data = {
+            "client_id": test_client_record.id,
+            "subtotal": 150.0,
+            "total": 150.0,
+            "metodo_pago": "EFECTIVO",
+            "items": [{"product_id": test_product.id, "cantidad": 1, "precio_unitario": 150.0}]
+        }
+
+        response = client.post("/sales", json=sale_data, headers=headers)
+
+        assert response.status_code == 200
+        assert response.json()["numero_venta"] == "VTA-000042"
@@ -0,0 +1,138 @@
+"""
+Unit tests for content-addressed storage (storage.py)
+"""
+import hashlib
+import io
+import os
+import pytest
+from datetime import datetime
+from fastapi import UploadFile
+
+from auth import create_access_token
+from invoice_processor import InvoiceProcessor
+from models import PurchaseInvoice
+from storage import ContentStore
+
+PDF = b"%PDF-1.4 " + b"x" * 5000
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ContentStore(str(tmp_path / "invoices"), suffix=".pdf", chunk_size=1024)
+
+
+def _stored_files(root):
+    return [
+        os.path.join(dirpath, name)
+        for dirpath, _, files in os.walk(root) for name in files
+        if ".tmp" not in dirpath
+    ]
+
+
+@pytest.mark.unit
+@pytest.mark.invoice
+class TestContentStore:
+    """Test streaming, hashing and deduplication"""
+
+    def test_key_is_sha256_and_path_is_sharded(self, store):
+        """Test that the key is the content hash and the file lives under two shard levels"""
+        key = store.save_fileobj(io.BytesIO(PDF))
+
+        assert key == hashlib.sha256(PDF).hexdigest()
+        assert store.path_for(key) == os.path.join(store.root, key[:2], key[2:4], f"{key}.pdf")
+        with open(store.path_for(key), "rb") as fh:
+            assert fh.read() == PDF
+
+    def test_same_content_is_stored_once(self, store):
+        """Test that re-uploading the same bytes reuses the stored copy"""
+        first = store.save_fileobj(io.BytesIO(PDF))
+        second = store.save_fileobj(io.BytesIO(PDF))
+        other = store.save_fileobj(io.BytesIO(PDF + b"!"))
+
+        assert first == second != other
+        assert len(_stored_files(store.root)) == 2
+        assert os.listdir(os.path.join(store.root, ".tmp")) == []
+        assert store.stats()["saved"] == 2
+        assert store.stats()["deduplicated"] == 1
+
+    def test_failed_copy_leaves_no_temp_file(self, store):
+        """Test that an error while reading the upload cleans up the partial file"""
+        class Broken(io.BytesIO):
+            def read(self, size=-1):
+                if self.tell() > 0:
+                    raise IOError("connection lost")
+                return super().read(size)
+
+        with pytest.raises(IOError):
+            store.save_fileobj(Broken(PDF))
+
+        assert _stored_files(store.root) == []
+        assert os.listdir(os.path.join(store.root, ".tmp")) == []
+
+    async def test_async_save_from_upload(self, store):
+        """Test that an UploadFile is stored from the start, whatever was read before"""
+        upload = UploadFile(file=io.BytesIO(PDF), filename="factura.pdf")
+        await upload.read(10)
+
+        key = await store.save(upload)
+
+        assert key == hashlib.sha256(PDF).hexdigest()
+
+    def test_legacy_paths_are_passed_through(self, store):
+        """Test that archivo_pdf values saved before content keys still resolve"""
+        assert store.path_for("uploads/invoices/F1_20240101_000000.pdf") == "uploads/invoices/F1_20240101_000000.pdf"
+        assert not store.exists(None)
+
+
+@pytest.mark.unit
+@pytest.mark.invoice
+class TestInvoicePdfStorage:
+    """Test that invoices reference their PDF by content key"""
+
+    async def test_invoices_with_same_pdf_share_content_key(self, db_session, test_admin, sample_invoice_data, store):
+        """Test that archivo_pdf holds the content key and duplicates share the file"""
+        processor = InvoiceProcessor(db_session, test_admin, pdf_store=store)
+        first = await processor.process_invoice(
+            sample_invoice_data, UploadFile(file=io.BytesIO(PDF), filename="a.pdf")
+        )
+        second_data = dict(sample_invoice_data, factura=dict(sample_invoice_data["factura"], numero="OTRA-1"))
+        second = await InvoiceProcessor(db_session, test_admin, pdf_store=store).process_invoice(
+            second_data, UploadFile(file=io.BytesIO(PDF), filename="b.pdf")
+        )
+
+        assert first.archivo_pdf == second.archivo_pdf == hashlib.sha256(PDF).hexdigest()
+        assert len(_stored_files(store.root)) == 1
+
+    def test_download_pdf(self, client, db_session, test_admin, test_supplier, store, monkeypatch):
+        """Test that the stored PDF is served for the invoice"""
+        import main
+        monkeypatch.setattr(main, "invoice_pdf_store", store)
+        key = store.save_fileobj(io.BytesIO(PDF))
+        invoice = PurchaseInvoice(
+            numero_factura="PDF-1", supplier_id=test_supplier.id, fecha_emision=datetime.now(),
+            subtotal=100, iva=19, total=119, archivo_pdf=key
+        )
+        db_session.add(invoice)
+        db_session.commit()
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_admin.username})}"}
+
+        response = client.get(f"/api/invoices/{invoice.id}/pdf", headers=headers)
+
+        assert response.status_code == 200
+        assert response.content == PDF
+        assert response.headers["content-type"] == "application/pdf"
+
+    def test_download_without_pdf_returns_404(self, client, db_session, test_admin, test_supplier):
+        """Test that invoices without a stored PDF return 404"""
+        invoice = PurchaseInvoice(
+            numero_factura="SIN-PDF", supplier_id=test_supplier.id, fecha_emision=datetime.now(),
+            subtotal=100, iva=19, total=119
+        )
+        db_session.add(invoice)
+        db_session.commit()
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_admin.username})}"}
+
+        response = client.get(f"/api/invoices/{invoice.id}/pdf", headers=headers)
+
+        assert response.status_code == 404
+
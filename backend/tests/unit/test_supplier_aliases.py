@@ -0,0 +1,129 @@
+"""
+Unit tests for supplier reference aliases (supplier_aliases.py)
+"""
+import pytest
+
+from invoice_importer import ImportSource, plan_waves
+from invoice_processor import InvoiceProcessor
+from models import Product, ProductCategory, Supplier, SupplierProduct
+from supplier_aliases import get_aliases, supplier_aliases
+
+
+def _invoice(numero, lines, nit="900555666-1"):
+    return {
+        "proveedor": {"nit": nit, "razon_social": "PROVEEDOR ALIAS S.A.S"},
+        "factura": {"numero": numero, "fecha": "2024-04-01", "cufe": f"cufe-{numero}"},
+        "productos": [
+            {"referencia": ref, "nombre": nombre, "cantidad": 1,
+             "precio_unitario": 1000.0, "total": 1000.0}
+            for ref, nombre in lines
+        ],
+        "totales": {"subtotal": 1000.0, "iva": 190.0, "total": 1190.0},
+    }
+
+
+def _catalog_scans(statements):
+    """Full catalog loads (the match index), as opposed to lookups by id"""
+    return [s for s in statements if "FROM products" in s and "WHERE" not in s]
+
+
+@pytest.mark.unit
+@pytest.mark.invoice
+class TestSupplierAliases:
+    """Test learning and using supplier reference aliases"""
+
+    async def test_processed_invoice_learns_aliases(self, db_session, test_admin):
+        """Test that every referenced line records its supplier reference"""
+        await InvoiceProcessor(db_session, test_admin).process_invoice(
+            _invoice("AL-1", [("SR-1", "CREMA ALIAS UNO"), ("SR-2", "CREMA ALIAS DOS"), ("", "SIN REFERENCIA")])
+        )
+
+        supplier = db_session.query(Supplier).filter(Supplier.nit == "900555666-1").one()
+        aliases = get_aliases(db_session, supplier.id)
+        products = {p.codigo: p.id for p in db_session.query(Product)}
+        assert aliases == {"SR-1": products["SR-1"], "SR-2": products["SR-2"]}
+
+    async def test_repeat_invoice_skips_catalog_matching(self, db_session, test_admin, query_counter):
+        """Test that a repeat invoice resolves its lines without loading the catalog"""
+        lines = [("SR-1", "CREMA ALIAS UNO"), ("SR-2", "CREMA ALIAS DOS")]
+        await InvoiceProcessor(db_session, test_admin).process_invoice(_invoice("AL-1", lines))
+        query_counter.clear()
+
+        await InvoiceProcessor(db_session, test_admin).process_invoice(_invoice("AL-2", lines))
+
+        assert _catalog_scans(query_counter) == []
+        assert db_session.query(Product).count() == 2
+        assert {p.stock_actual for p in db_session.query(Product)} == {2}
+
+    async def test_alias_wins_over_name_matching(self, db_session, test_admin):
+        """Test that a renamed line still lands on the product its reference was learned for"""
+        product = Product(codigo="INT-001", nombre="SERUM FACIAL VITAMINA C", categoria=ProductCategory.CUIDADO_PIEL,
+                          precio_compra=900, precio_venta=1500, stock_actual=0)
+        db_session.add(product)
+        db_session.commit()
+
+        # First invoice: the supplier's reference is unknown, the name matches
+        await InvoiceProcessor(db_session, test_admin).process_invoice(
+            _invoice("AL-1", [("BIO-81", "SERUM FACIAL VITAMINA C")])
+        )
+        # Second invoice: the supplier renamed the line
+        await InvoiceProcessor(db_session, test_admin).process_invoice(
+            _invoice("AL-2", [("BIO-81", "BIOAQUA VIT C 30ML NUEVA PRESENTACION")])
+        )
+
+        db_session.refresh(product)
+        assert db_session.query(Product).count() == 1
+        assert product.stock_actual == 2
+
+    async def test_stale_alias_falls_back_to_matching(self, db_session, test_admin):
+        """Test that an alias to a deleted product is relearned from catalog matching"""
+        await InvoiceProcessor(db_session, test_admin).process_invoice(_invoice("AL-1", [("SR-1", "CREMA ALIAS UNO")]))
+        supplier = db_session.query(Supplier).filter(Supplier.nit == "900555666-1").one()
+        old = db_session.query(Product).one()
+        db_session.query(SupplierProduct).filter(SupplierProduct.supplier_id == supplier.id).delete()
+        db_session.add(SupplierProduct(supplier_id=supplier.id, supplier_ref="SR-1", product_id=999999,
+                                       precio_compra=1000, is_active=True))
+        db_session.commit()
+
+        await InvoiceProcessor(db_session, test_admin).process_invoice(_invoice("AL-2", [("SR-1", "CREMA ALIAS UNO")]))
+
+        db_session.refresh(old)
+        assert old.stock_actual == 2
+        assert get_aliases(db_session, supplier.id) == {"SR-1": old.id}
+
+    async def test_cache_is_invalidated_on_commit(self, db_session, test_admin, query_counter):
+        """Test that the alias map is cached per supplier and dropped when it changes"""
+        await InvoiceProcessor(db_session, test_admin).process_invoice(_invoice("AL-1", [("SR-1", "CREMA ALIAS UNO")]))
+        supplier = db_session.query(Supplier).filter(Supplier.nit == "900555666-1").one()
+        assert get_aliases(db_session, supplier.id) == get_aliases(db_session, supplier.id)
+        hits = supplier_aliases.stats()["hits"]
+
+        query_counter.clear()
+        get_aliases(db_session, supplier.id)
+        assert not [s for s in query_counter if "FROM supplier_products" in s]
+
+        await InvoiceProcessor(db_session, test_admin).process_invoice(_invoice("AL-2", [("SR-3", "CREMA ALIAS TRES")]))
+
+        assert set(get_aliases(db_session, supplier.id)) == {"SR-1", "SR-3"}
+        assert supplier_aliases.stats()["hits"] > hits
+
+
+@pytest.mark.unit
+@pytest.mark.invoice
+class TestPlanWavesWithAliases:
+    """Test that the import wave planner resolves lines like the processor"""
+
+    async def test_aliased_lines_share_a_wave_key(self, db_session, test_admin):
+        """Test that invoices whose references alias the same product never run together"""
+        await InvoiceProcessor(db_session, test_admin).process_invoice(
+            _invoice("AL-0", [("BIO-81", "SERUM FACIAL VITAMINA C")])
+        )
+        # Different name and no catalog code match: only the alias links them
+        sources = [
+            ImportSource(name="a.json", data=_invoice("AL-1", [("BIO-81", "NOMBRE DISTINTO A")])),
+            ImportSource(name="b.json", data=_invoice("AL-2", [("XYZ-1", "SERUM FACIAL VITAMINA C")])),
+        ]
+
+        waves = plan_waves(db_session, sources)
+
+        assert [[s.name for s in wave] for wave in waves] == [["a.json"], ["b.json"]]
@@ -0,0 +1,58 @@
+"""
+Unit tests for the token revocation store (token_revocation.py)
+"""
+import pytest
+from datetime import datetime, timedelta
+
+from models import RevokedToken
+from token_revocation import RevocationStore, TokenAlreadyRevoked
+
+
+@pytest.mark.unit
+@pytest.mark.auth
+class TestRevocationStore:
+    """Test persistence, sync and expiry of revoked token ids"""
+
+    def test_revoke_persists_and_remembers(self, db_session):
+        """Test that a revoked jti is stored and checked in memory"""
+        store = RevocationStore()
+        expires = datetime.utcnow() + timedelta(hours=1)
+
+        store.revoke(db_session, [("jti-1", expires, None)])
+
+        assert store.is_revoked("jti-1")
+        assert not store.is_revoked("jti-2")
+        assert db_session.query(RevokedToken).filter(RevokedToken.jti == "jti-1").count() == 1
+
+    def test_revoking_twice_raises(self, db_session):
+        """Test that a second revocation of the same jti is reported"""
+        store = RevocationStore()
+        expires = datetime.utcnow() + timedelta(hours=1)
+        store.revoke(db_session, [("jti-1", expires, None)])
+
+        with pytest.raises(TokenAlreadyRevoked):
+            store.revoke(db_session, [("jti-1", expires, None), ("jti-2", expires, None)])
+
+        assert store.is_revoked("jti-2")
+
+    def test_sync_picks_up_other_workers(self, db_session):
+        """Test that revocations written by another store are loaded on sync"""
+        writer, reader = RevocationStore(), RevocationStore(sync_interval=60)
+        reader.sync(db_session)
+        writer.revoke(db_session, [("jti-1", datetime.utcnow() + timedelta(hours=1), None)])
+
+        reader.sync(db_session)
+        assert not reader.is_revoked("jti-1")  # within the sync interval
+
+        reader.sync(db_session, force=True)
+        assert reader.is_revoked("jti-1")
+
+    def test_expired_revocations_are_dropped(self, db_session):
+        """Test that expired tokens leave memory and can be purged from the table"""
+        store = RevocationStore()
+        store.revoke(db_session, [("old", datetime.utcnow() - timedelta(seconds=1), None)])
+
+        store.sync(db_session, force=True)
+
+        assert not store.is_revoked("old")
+        assert store.purge_expired(db_session) == 1
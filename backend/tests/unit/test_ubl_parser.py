@@ -0,0 +1,282 @@
+"""
+Unit tests for the DIAN UBL invoice parser (ubl_parser.py)
+"""
+import io
+import tracemalloc
+import pytest
+
+from auth import create_access_token
+from invoice_processor import InvoiceProcessor
+from models import Product, PurchaseInvoice, Supplier
+from ubl_parser import UBLParseError, format_nit, parse_ubl_invoice
+
+NAMESPACES = (
+    'xmlns="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2" '
+    'xmlns:cac="urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2" '
+    'xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2" '
+    'xmlns:ext="urn:oasis:names:specification:ubl:schema:xsd:CommonExtensionComponents-2" '
+    'xmlns:ds="http://www.w3.org/2000/09/xmldsig#"'
+)
+ATTACHED_NAMESPACES = NAMESPACES.replace("Invoice-2", "AttachedDocument-2")
+
+
+def _line(number, referencia, nombre, cantidad, precio):
+    return f"""
+    <cac:InvoiceLine>
+        <cbc:ID>{number}</cbc:ID>
+        <cbc:InvoicedQuantity unitCode="94">{cantidad:.2f}</cbc:InvoicedQuantity>
+        <cbc:LineExtensionAmount currencyID="COP">{cantidad * precio:.2f}</cbc:LineExtensionAmount>
+        <cac:TaxTotal><cbc:TaxAmount currencyID="COP">{cantidad * precio * 0.19:.2f}</cbc:TaxAmount></cac:TaxTotal>
+        <cac:Item>
+            <cbc:Description>{nombre}</cbc:Description>
+            <cac:SellersItemIdentification><cbc:ID>{referencia}</cbc:ID></cac:SellersItemIdentification>
+        </cac:Item>
+        <cac:Price><cbc:PriceAmount currencyID="COP">{precio:.2f}</cbc:PriceAmount></cac:Price>
+    </cac:InvoiceLine>"""
+
+
+def make_invoice_xml(numero="FE1001", lines=None, extra_lines=""):
+    lines = lines if lines is not None else [("30K", "BOLSA DE EMPAQUE 30K PCR", 1, 500), ("6659", "ACONDICIONADOR 500ML", 2, 13000)]
+    subtotal = sum(cantidad * precio for _, _, cantidad, precio in lines)
+    return f"""<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<Invoice {NAMESPACES}>
+    <ext:UBLExtensions><ext:UBLExtension><ext:ExtensionContent>
+        <ds:Signature><ds:SignatureValue>fVXmF0gRFxTf
+        qCl789tPwYjJ0G==</ds:SignatureValue></ds:Signature>
+    </ext:ExtensionContent></ext:UBLExtension></ext:UBLExtensions>
+    <cbc:UBLVersionID>UBL 2.1</cbc:UBLVersionID>
+    <cbc:ID>{numero}</cbc:ID>
+    <cbc:UUID schemeName="CUFE-SHA384">cufe-{numero}</cbc:UUID>
+    <cbc:IssueDate>2024-10-24</cbc:IssueDate>
+    <cbc:IssueTime>17:40:49-05:00</cbc:IssueTime>
+    <cac:AccountingSupplierParty>
+        <cac:Party>
+            <cac:PartyName><cbc:Name>EL HUECO</cbc:Name></cac:PartyName>
+            <cac:PhysicalLocation><cac:Address>
+                <cbc:CityName>BUCARAMANGA</cbc:CityName>
+                <cac:AddressLine><cbc:Line>CALLE 36 # 15-20</cbc:Line></cac:AddressLine>
+            </cac:Address></cac:PhysicalLocation>
+            <cac:PartyTaxScheme>
+                <cbc:RegistrationName>DISTRIBUIDORA EL HUECO S.A.S</cbc:RegistrationName>
+                <cbc:CompanyID schemeAgencyID="195" schemeID="7" schemeName="31">900479120</cbc:CompanyID>
+            </cac:PartyTaxScheme>
+            <cac:Contact>
+                <cbc:Telephone>3154795581</cbc:Telephone>
+                <cbc:ElectronicMail>servicioalcliente@tiendaselhueco.com.co</cbc:ElectronicMail>
+            </cac:Contact>
+        </cac:Party>
+    </cac:AccountingSupplierParty>
+    <cac:AccountingCustomerParty>
+        <cac:Party>
+            <cac:PartyTaxScheme>
+                <cbc:RegistrationName>AEJ COSMETIC</cbc:RegistrationName>
+                <cbc:CompanyID schemeID="1">123456789</cbc:CompanyID>
+            </cac:PartyTaxScheme>
+        </cac:Party>
+    </cac:AccountingCustomerParty>
+    <cac:TaxTotal>
+        <cbc:TaxAmount currencyID="COP">{subtotal * 0.19:.2f}</cbc:TaxAmount>
+        <cac:TaxSubtotal><cac:TaxCategory><cac:TaxScheme><cbc:ID>01</cbc:ID><cbc:Name>IVA</cbc:Name></cac:TaxScheme></cac:TaxCategory></cac:TaxSubtotal>
+    </cac:TaxTotal>
+    <cac:TaxTotal>
+        <cbc:TaxAmount currencyID="COP">80.00</cbc:TaxAmount>
+        <cac:TaxSubtotal><cac:TaxCategory><cac:TaxScheme><cbc:ID>04</cbc:ID><cbc:Name>INC</cbc:Name></cac:TaxScheme></cac:TaxCategory></cac:TaxSubtotal>
+    </cac:TaxTotal>
+    <cac:LegalMonetaryTotal>
+        <cbc:LineExtensionAmount currencyID="COP">{subtotal:.2f}</cbc:LineExtensionAmount>
+        <cbc:TaxExclusiveAmount currencyID="COP">{subtotal:.2f}</cbc:TaxExclusiveAmount>
+        <cbc:TaxInclusiveAmount currencyID="COP">{subtotal * 1.19:.2f}</cbc:TaxInclusiveAmount>
+        <cbc:PayableAmount currencyID="COP">{subtotal * 1.19 + 80:.2f}</cbc:PayableAmount>
+    </cac:LegalMonetaryTotal>
+    {"".join(_line(i + 1, *line) for i, line in enumerate(lines))}{extra_lines}
+</Invoice>"""
+
+
+def make_attached_document(invoice_xml):
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<AttachedDocument {ATTACHED_NAMESPACES}>
+    <cbc:ID>AD-1</cbc:ID>
+    <cac:SenderParty><cac:PartyTaxScheme><cbc:CompanyID schemeID="7">900479120</cbc:CompanyID></cac:PartyTaxScheme></cac:SenderParty>
+    <cac:Attachment>
+        <cac:ExternalReference>
+            <cbc:MimeCode>text/xml</cbc:MimeCode>
+            <cbc:Description><![CDATA[
+{invoice_xml}]]></cbc:Description>
+        </cac:ExternalReference>
+    </cac:Attachment>
+    <cac:ParentDocumentLineReference>
+        <cbc:LineID>1</cbc:LineID>
+        <cac:DocumentReference>
+            <cbc:ID>FE1001</cbc:ID>
+            <cac:Attachment><cac:ExternalReference>
+                <cbc:Description><![CDATA[<?xml version="1.0"?><ApplicationResponse/>]]></cbc:Description>
+            </cac:ExternalReference></cac:Attachment>
+            <cac:ResultOfVerification>
+                <cbc:ValidatorID>DIAN</cbc:ValidatorID>
+                <cbc:ValidationResultCode>02</cbc:ValidationResultCode>
+                <cbc:ValidationDate>2024-10-24</cbc:ValidationDate>
+                <cbc:ValidationTime>17:41:23-05:00</cbc:ValidationTime>
+            </cac:ResultOfVerification>
+        </cac:DocumentReference>
+    </cac:ParentDocumentLineReference>
+</AttachedDocument>"""
+
+
+@pytest.mark.unit
+@pytest.mark.invoice
+class TestParseUBLInvoice:
+    """Test extraction of the processor dict from DIAN XML"""
+
+    def test_invoice_fields_are_extracted(self):
+        """Test that supplier, header, lines and totals come out in processor format"""
+        data = parse_ubl_invoice(make_invoice_xml().encode("utf-8"))
+
+        assert data["proveedor"] == {
+            "nit": "900.479.120-7",
+            "razon_social": "DISTRIBUIDORA EL HUECO S.A.S",
+            "ciudad": "BUCARAMANGA",
+            "direccion": "CALLE 36 # 15-20",
+            "telefono": "3154795581",
+            "email": "servicioalcliente@tiendaselhueco.com.co",
+        }
+        assert data["factura"] == {
+            "numero": "FE1001",
+            "fecha": "2024-10-24",
+            "hora": "17:40:49-05:00",
+            "cufe": "cufe-FE1001",
+            "firma_digital": "fVXmF0gRFxTfqCl789tPwYjJ0G==",
+        }
+        assert data["productos"] == [
+            {"referencia": "30K", "nombre": "BOLSA DE EMPAQUE 30K PCR", "cantidad": 1, "precio_unitario": 500, "total": 500},
+            {"referencia": "6659", "nombre": "ACONDICIONADOR 500ML", "cantidad": 2, "precio_unitario": 13000, "total": 26000},
+        ]
+        # Only the IVA tax total counts as iva; line tax totals are ignored
+        assert data["totales"] == {"subtotal": 26500, "iva": 5035, "total": 31615}
+
+    def test_attached_document_unwraps_embedded_invoice(self):
+        """Test that the invoice inside an AttachedDocument is parsed, with the DIAN validation time"""
+        data = parse_ubl_invoice(make_attached_document(make_invoice_xml()).encode("utf-8"))
+
+        assert data["factura"]["numero"] == "FE1001"
+        assert data["factura"]["fecha_aceptacion"] == "2024-10-24 17:41:23-05:00"
+        assert data["proveedor"]["nit"] == "900.479.120-7"
+        assert len(data["productos"]) == 2
+
+    def test_small_chunks_give_same_result(self):
+        """Test that the result does not depend on how the input is split"""
+        raw = make_attached_document(make_invoice_xml()).encode("utf-8")
+
+        assert parse_ubl_invoice(io.BytesIO(raw), chunk_size=7) == parse_ubl_invoice(raw)
+
+    def test_path_source(self, tmp_path):
+        """Test that a file path can be parsed"""
+        path = tmp_path / "factura.xml"
+        path.write_text(make_invoice_xml(), encoding="utf-8")
+
+        assert parse_ubl_invoice(str(path))["factura"]["numero"] == "FE1001"
+
+    def test_standard_item_identification_is_fallback_reference(self):
+        """Test that the standard item id is used when there is no seller id"""
+        extra = _line(3, "IGNORED", "CREMA SIN REF", 1, 100).replace(
+            "<cac:SellersItemIdentification><cbc:ID>IGNORED</cbc:ID></cac:SellersItemIdentification>",
+            "<cac:StandardItemIdentification><cbc:ID>7701234</cbc:ID></cac:StandardItemIdentification>",
+        )
+        data = parse_ubl_invoice(make_invoice_xml(extra_lines=extra).encode("utf-8"))
+
+        assert data["productos"][-1]["referencia"] == "7701234"
+
+    def test_fractional_quantity_is_kept(self):
+        """Test that non-integral amounts are returned as floats"""
+        data = parse_ubl_invoice(make_invoice_xml(lines=[("X1", "GRANEL", 1.5, 1000)]).encode("utf-8"))
+
+        assert data["productos"][0]["cantidad"] == 1.5
+        assert data["productos"][0]["total"] == 1500
+
+    def test_non_invoice_document_is_rejected(self):
+        """Test that other UBL documents raise UBLParseError"""
+        with pytest.raises(UBLParseError, match="CreditNote"):
+            parse_ubl_invoice(b'<CreditNote xmlns="urn:oasis:names:specification:ubl:schema:xsd:CreditNote-2"/>')
+
+    def test_malformed_xml_is_rejected(self):
+        """Test that broken XML raises UBLParseError"""
+        with pytest.raises(UBLParseError):
+            parse_ubl_invoice(make_invoice_xml().encode("utf-8")[:500])
+
+    def test_invoice_without_lines_is_rejected(self):
+        """Test that an invoice without lines is not emitted"""
+        with pytest.raises(UBLParseError, match="líneas"):
+            parse_ubl_invoice(make_invoice_xml(lines=[]).encode("utf-8"))
+
+    def test_attached_document_without_invoice_is_rejected(self):
+        """Test that an AttachedDocument without the embedded invoice is rejected"""
+        raw = make_attached_document("").replace("<![CDATA[\n]]>", "Factura electrónica")
+
+        with pytest.raises(UBLParseError, match="no contiene la factura"):
+            parse_ubl_invoice(raw.encode("utf-8"))
+
+    def test_memory_does_not_grow_with_embedded_attachments(self):
+        """Test that a large embedded attachment is streamed past, not held in memory"""
+        blob = "QUJD" * 1_000_000  # 4 MB of base64, as when the PDF travels inside the invoice
+        attachment = (
+            "<cac:AdditionalDocumentReference><cbc:ID>PDF</cbc:ID><cac:Attachment>"
+            f'<cbc:EmbeddedDocumentBinaryObject mimeCode="application/pdf">{blob}</cbc:EmbeddedDocumentBinaryObject>'
+            "</cac:Attachment></cac:AdditionalDocumentReference>"
+        )
+        invoice_xml = make_invoice_xml().replace("<cac:AccountingSupplierParty>", attachment + "<cac:AccountingSupplierParty>")
+        raw = make_attached_document(invoice_xml).encode("utf-8")
+
+        tracemalloc.start()
+        try:
+            data = parse_ubl_invoice(io.BytesIO(raw))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        assert len(data["productos"]) == 2
+        assert peak < 1_000_000
+
+    def test_format_nit(self):
+        """Test NIT formatting with and without check digit"""
+        assert format_nit("900479120", "7") == "900.479.120-7"
+        assert format_nit("1098765432") == "1.098.765.432"
+        assert format_nit("CE-12345", "") == "CE-12345"
+
+
+@pytest.mark.unit
+@pytest.mark.invoice
+class TestUBLInvoiceProcessing:
+    """Test that parsed XML feeds the invoice processor and upload endpoint"""
+
+    @pytest.mark.asyncio
+    async def test_parsed_invoice_is_processed(self, db_session, test_admin):
+        """Test that the parser output is accepted by InvoiceProcessor"""
+        data = parse_ubl_invoice(make_attached_document(make_invoice_xml()).encode("utf-8"))
+
+        invoice = await InvoiceProcessor(db_session, test_admin).process_invoice(data)
+
+        assert invoice.numero_factura == "FE1001"
+        assert invoice.cufe == "cufe-FE1001"
+        assert invoice.fecha_aceptacion is not None
+        assert db_session.query(Supplier).filter(Supplier.nit == "900.479.120-7").count() == 1
+        assert db_session.query(Product).filter(Product.codigo == "6659").one().stock_actual == 2
+
+    def test_upload_xml_returns_invoice_data(self, client, test_admin):
+        """Test that uploading a DIAN XML returns the extracted invoice data"""
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_admin.username})}"}
+        raw = make_attached_document(make_invoice_xml()).encode("utf-8")
+        files = {"file": ("ad0900479120.xml", io.BytesIO(raw), "application/xml")}
+
+        response = client.post("/api/invoices/upload", files=files, headers=headers)
+
+        assert response.status_code == 200
+        assert response.json()["invoice_data"]["factura"]["cufe"] == "cufe-FE1001"
+
+    def test_upload_invalid_xml_returns_400(self, client, test_admin, db_session):
+        """Test that an unusable XML upload is rejected with 400"""
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': test_admin.username})}"}
+        files = {"file": ("factura.xml", io.BytesIO(b"<Invoice>"), "application/xml")}
+
+        response = client.post("/api/invoices/upload", files=files, headers=headers)
+
+        assert response.status_code == 400
+        assert db_session.query(PurchaseInvoice).count() == 0
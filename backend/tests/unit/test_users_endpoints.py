@@ -86,3 +86,48 @@ class TestUsersEndpoints:
         """Test that GET /auth/me requires authentication"""
         response = client.get("/auth/me")
         assert response.status_code == 403
+
+    def test_update_user_success_superuser(self, client, db_session, test_superuser, test_user):
+        """Test that PUT /users/{id} updates fields and bumps token_version on role changes"""
+        token = create_access_token(data={"sub": test_superuser.username})
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response = client.put(f"/users/{test_user.id}", headers=headers, json={
+            "nombre_completo": "Renamed User",
+            "rol": "ADMIN"
+        })
+
+        assert response.status_code == 200
+        assert response.json()["nombre_completo"] == "Renamed User"
+        assert response.json()["rol"] == "ADMIN"
+        db_session.refresh(test_user)
+        assert test_user.token_version == 1
+
+    def test_update_user_without_authorization_change_keeps_tokens(self, client, db_session, test_superuser, test_user):
+        """Test that cosmetic updates do not revoke tokens"""
+        token = create_access_token(data={"sub": test_superuser.username})
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response = client.put(f"/users/{test_user.id}", headers=headers, json={"nombre_completo": "Same Role"})
+
+        assert response.status_code == 200
+        db_session.refresh(test_user)
+        assert test_user.token_version == 0
+
+    def test_update_user_not_found(self, client, test_superuser):
+        """Test that updating a missing user returns 404"""
+        token = create_access_token(data={"sub": test_superuser.username})
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response = client.put("/users/99999", headers=headers, json={"rol": "ADMIN"})
+
+        assert response.status_code == 404
+
+    def test_update_user_requires_superuser_role(self, client, test_admin, test_user):
+        """Test that only superusers can update users"""
+        token = create_access_token(data={"sub": test_admin.username})
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response = client.put(f"/users/{test_user.id}", headers=headers, json={"rol": "ADMIN"})
+
+        assert response.status_code == 403
@@ -0,0 +1,125 @@
+"""
+Token Revocation Store
+In-memory set of revoked token ids (jti) backed by the revoked_tokens table:
+checked in O(1) on every request and synced incrementally across workers
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import RevokedToken
+
+load_dotenv()
+
+# How stale a worker's view of revocations made by other workers may get
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "5"))
+# Rows whose token already expired are deleted at most this often
+REVOCATION_PURGE_SECONDS = 3600
+# Ids are re-read this far back on each sync: a row committed after a higher id
+# (concurrent transactions) is still picked up
+SYNC_ID_OVERLAP = 100
+
+# (jti, expires_at in naive UTC, user_id)
+Revocation = Tuple[str, datetime, Optional[int]]
+
+
+class TokenAlreadyRevoked(Exception):
+    """Raised when revoking a jti that was revoked before (e.g. refresh token reuse)"""
+
+
+class RevocationStore:
+    """Revoked jti -> expiry, mirrored from the database"""
+
+    def __init__(self, sync_interval: float = REVOCATION_SYNC_SECONDS):
+        self.sync_interval = sync_interval
+        self._revoked = {}
+        self._last_id = 0
+        self._synced_at = None
+        self._purged_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        return jti is not None and jti in self._revoked
+
+    def sync(self, db: Session, force: bool = False):
+        """Load revocations committed since the last sync (at most every ``sync_interval``)"""
+        now = time.monotonic()
+        if not force and self._synced_at is not None and now - self._synced_at < self.sync_interval:
+            return
+        self._synced_at = now
+
+        utcnow = datetime.utcnow()
+        rows = db.query(RevokedToken.id, RevokedToken.jti, RevokedToken.expires_at).filter(
+            RevokedToken.id > self._last_id - SYNC_ID_OVERLAP,
+            RevokedToken.expires_at > utcnow
+        ).all()
+        with self._lock:
+            for row_id, jti, expires_at in rows:
+                self._revoked[jti] = expires_at
+                self._last_id = max(self._last_id, row_id)
+            # Expired tokens are rejected by their signature anyway
+            for jti in [jti for jti, expires_at in self._revoked.items() if expires_at <= utcnow]:
+                del self._revoked[jti]
+
+        if now - self._purged_at >= REVOCATION_PURGE_SECONDS:
+            self._purged_at = now
+            self.purge_expired(db)
+
+    def revoke(self, db: Session, revocations: Iterable[Revocation]):
+        """
+        Persist and remember revocations in one commit.
+
+        Raises TokenAlreadyRevoked if any jti had already been revoked (by this or
+        another worker); the rest are still revoked.
+        """
+        revocations = [r for r in revocations if r[0] is not None]
+        if not revocations:
+            return
+        jtis = [jti for jti, _, _ in revocations]
+        already = {jti for (jti,) in db.query(RevokedToken.jti).filter(RevokedToken.jti.in_(jtis))}
+        new = [r for r in revocations if r[0] not in already]
+
+        if new:
+            db.add_all([
+                RevokedToken(jti=jti, expires_at=expires_at, user_id=user_id)
+                for jti, expires_at, user_id in new
+            ])
+            try:
+                db.commit()
+            except IntegrityError:
+                # Lost a race with a concurrent revocation of the same jti
+                db.rollback()
+                return self.revoke(db, revocations)
+
+        with self._lock:
+            for jti, expires_at, _ in revocations:
+                self._revoked[jti] = expires_at
+        if already:
+            raise TokenAlreadyRevoked(", ".join(sorted(already)))
+
+    def purge_expired(self, db: Session) -> int:
+        """Delete revocations of tokens that have expired"""
+        deleted = db.query(RevokedToken).filter(
+            RevokedToken.expires_at <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+
+    def reset(self):
+        with self._lock:
+            self._revoked.clear()
+            self._last_id = 0
+            self._synced_at = None
+            self._purged_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._revoked)
+
+
+revocation_store = RevocationStore()
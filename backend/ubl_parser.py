@@ -0,0 +1,313 @@
+"""
+DIAN UBL Invoice Parser
+Streams DIAN UBL 2.1 electronic invoices (an ``Invoice`` or the
+``AttachedDocument`` that wraps it) and emits the proveedor/factura/productos/
+totales dict that InvoiceProcessor.process_invoice expects
+"""
+import os
+import xml.etree.ElementTree as ET
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Optional, Tuple
+
+# Bytes read from the source per parser feed
+CHUNK_SIZE = 64 * 1024
+
+# DIAN tax scheme id for IVA
+IVA_SCHEME_ID = "01"
+
+# Element paths below the Invoice root (namespace prefixes dropped)
+_FACTURA_FIELDS = {
+    ("ID",): "numero",
+    ("IssueDate",): "fecha",
+    ("IssueTime",): "hora",
+    ("UUID",): "cufe",
+}
+_SUPPLIER_PARTY = ("AccountingSupplierParty", "Party")
+_PROVEEDOR_FIELDS = {
+    ("PartyTaxScheme", "CompanyID"): "nit",
+    ("PartyTaxScheme", "RegistrationName"): "razon_social",
+    ("PartyLegalEntity", "RegistrationName"): "razon_social",
+    ("PartyName", "Name"): "nombre_comercial",
+    ("Contact", "Telephone"): "telefono",
+    ("Contact", "ElectronicMail"): "email",
+    ("PhysicalLocation", "Address", "CityName"): "ciudad",
+    ("PhysicalLocation", "Address", "AddressLine", "Line"): "direccion",
+    ("PartyTaxScheme", "RegistrationAddress", "CityName"): "ciudad",
+    ("PartyTaxScheme", "RegistrationAddress", "AddressLine", "Line"): "direccion",
+}
+_LINE = ("InvoiceLine",)
+_LINE_FIELDS = {
+    ("InvoicedQuantity",): "cantidad",
+    ("LineExtensionAmount",): "total",
+    ("Item", "Description"): "nombre",
+    ("Item", "SellersItemIdentification", "ID"): "referencia",
+    ("Item", "StandardItemIdentification", "ID"): "referencia_estandar",
+    ("Price", "PriceAmount"): "precio_unitario",
+}
+_TOTALES_FIELDS = {
+    ("LegalMonetaryTotal", "LineExtensionAmount"): "subtotal",
+    ("LegalMonetaryTotal", "TaxExclusiveAmount"): "base_gravable",
+    ("LegalMonetaryTotal", "TaxInclusiveAmount"): "total_con_impuestos",
+    ("LegalMonetaryTotal", "PayableAmount"): "total",
+}
+_TAX_TOTAL = ("TaxTotal",)
+_TAX_AMOUNT = ("TaxTotal", "TaxAmount")
+_TAX_SCHEME = ("TaxTotal", "TaxSubtotal", "TaxCategory", "TaxScheme", "ID")
+
+# Element paths below the AttachedDocument root
+_EMBEDDED_INVOICE = ("Attachment", "ExternalReference", "Description")
+_VALIDATION = ("ParentDocumentLineReference", "DocumentReference", "ResultOfVerification")
+_VALIDATION_FIELDS = {
+    _VALIDATION + ("ValidationDate",): "fecha",
+    _VALIDATION + ("ValidationTime",): "hora",
+}
+
+
+class UBLParseError(ValueError):
+    """The document is not a DIAN UBL invoice the processor can use"""
+
+
+def _local(tag: str) -> str:
+    return tag.rpartition("}")[2]
+
+
+def _number(text: str):
+    try:
+        value = Decimal(text.strip())
+    except InvalidOperation:
+        raise UBLParseError(f"Valor numérico inválido: {text!r}")
+    return int(value) if value == value.to_integral_value() else float(value)
+
+
+def format_nit(company_id: str, check_digit: Optional[str] = None) -> str:
+    """NIT as the supplier records use it, e.g. ``900.479.120-7``"""
+    nit = company_id.strip()
+    if nit.isdigit():
+        nit = f"{int(nit):,}".replace(",", ".")
+    return f"{nit}-{check_digit.strip()}" if check_digit and check_digit.strip() else nit
+
+
+class _InvoiceReader:
+    """
+    Parser target for a UBL ``Invoice``. Only the text of the elements it maps
+    is kept, and each line is emitted as soon as it closes, so memory does not
+    grow with the size of the document (or of embedded attachments/signatures).
+    """
+
+    def __init__(self):
+        self.path = []
+        self.proveedor: Dict = {}
+        self.factura: Dict = {}
+        self.productos = []
+        self.totales: Dict = {}
+        self.iva = 0
+        self._line: Optional[Dict] = None
+        self._tax: Optional[Dict] = None
+        self._text = None  # List of chunks while inside a mapped element
+        self._attrib = {}
+
+    def _wanted(self, path: Tuple[str, ...]) -> bool:
+        if path[-1] == "SignatureValue":
+            return True
+        if path[:2] == _SUPPLIER_PARTY:
+            return path[2:] in _PROVEEDOR_FIELDS
+        if path[:1] == _LINE:
+            return path[1:] in _LINE_FIELDS
+        return path in _FACTURA_FIELDS or path in _TOTALES_FIELDS or path in (_TAX_AMOUNT, _TAX_SCHEME)
+
+    def start(self, tag, attrib):
+        self.path.append(_local(tag))
+        if len(self.path) == 1:
+            if self.path[0] != "Invoice":
+                raise UBLParseError(f"Se esperaba un documento Invoice, no {self.path[0]}")
+            return
+        path = tuple(self.path[1:])
+        if path == _LINE:
+            self._line = {}
+        elif path == _TAX_TOTAL:
+            self._tax = {}
+        if self._wanted(path):
+            self._text = []
+            self._attrib = attrib
+
+    def data(self, data):
+        if self._text is not None:
+            self._text.append(data)
+
+    def end(self, tag):
+        path = tuple(self.path[1:])
+        self.path.pop()
+        if self._text is not None:
+            self._field(path, "".join(self._text).strip(), self._attrib)
+            self._text = None
+        elif path == _LINE:
+            self._close_line()
+        elif path == _TAX_TOTAL:
+            if self._tax.get("scheme") == IVA_SCHEME_ID and "amount" in self._tax:
+                self.iva += self._tax["amount"]
+            self._tax = None
+
+    def _field(self, path, text, attrib):
+        if not text:
+            return
+        if path[-1] == "SignatureValue":
+            self.factura.setdefault("firma_digital", "".join(text.split()))
+        elif path[:2] == _SUPPLIER_PARTY:
+            key = _PROVEEDOR_FIELDS[path[2:]]
+            if key == "nit":
+                text = format_nit(text, attrib.get("schemeID"))
+            self.proveedor.setdefault(key, text)
+        elif path[:1] == _LINE:
+            key = _LINE_FIELDS[path[1:]]
+            self._line.setdefault(key, _number(text) if key in ("cantidad", "total", "precio_unitario") else text)
+        elif path == _TAX_AMOUNT:
+            self._tax["amount"] = _number(text)
+        elif path == _TAX_SCHEME:
+            self._tax.setdefault("scheme", text)
+        elif path in _FACTURA_FIELDS:
+            self.factura.setdefault(_FACTURA_FIELDS[path], text)
+        else:
+            self.totales.setdefault(_TOTALES_FIELDS[path], _number(text))
+
+    def _close_line(self):
+        line, self._line = self._line, None
+        estandar = line.pop("referencia_estandar", None)
+        line.setdefault("referencia", estandar or "")
+        line.setdefault("nombre", "")
+        line.setdefault("cantidad", 0)
+        line.setdefault("precio_unitario", 0)
+        line.setdefault("total", line["cantidad"] * line["precio_unitario"])
+        self.productos.append(line)
+
+    def close(self):
+        pass  # Called by the parser; the dict is built by result()
+
+    def result(self) -> Dict:
+        if not self.factura.get("numero") or not self.factura.get("fecha"):
+            raise UBLParseError("La factura no tiene número (cbc:ID) o fecha de emisión (cbc:IssueDate)")
+        if not self.proveedor.get("nit"):
+            raise UBLParseError("La factura no tiene el NIT del proveedor")
+        if not self.productos:
+            raise UBLParseError("La factura no tiene líneas (cac:InvoiceLine)")
+
+        # The legal name wins over the trade name wherever it appears
+        nombre_comercial = self.proveedor.pop("nombre_comercial", None)
+        if nombre_comercial:
+            self.proveedor.setdefault("razon_social", nombre_comercial)
+
+        totales = {
+            "subtotal": self.totales.get("subtotal", 0),
+            "iva": self.iva,
+            "total": self.totales.get("total", self.totales.get("total_con_impuestos", 0)),
+        }
+        if not self.iva and "total_con_impuestos" in self.totales and "base_gravable" in self.totales:
+            totales["iva"] = self.totales["total_con_impuestos"] - self.totales["base_gravable"]
+        return {
+            "proveedor": self.proveedor,
+            "factura": self.factura,
+            "productos": self.productos,
+            "totales": totales,
+        }
+
+
+class _DocumentReader:
+    """
+    Parser target that dispatches on the root element. For an AttachedDocument
+    the invoice travels as text (usually CDATA) in cbc:Description; that text
+    is fed chunk by chunk into a nested parser instead of being accumulated.
+    """
+
+    def __init__(self):
+        self.path = []
+        self.invoice = _InvoiceReader()
+        self.attached = False
+        self._nested: Optional[ET.XMLParser] = None
+        self._nested_started = False
+        self._nested_done = False
+        self._validation: Dict = {}
+        self._text = None
+
+    def start(self, tag, attrib):
+        self.path.append(_local(tag))
+        if len(self.path) == 1:
+            self.attached = self.path[0] == "AttachedDocument"
+        if not self.attached:
+            return self.invoice.start(tag, attrib)
+
+        path = tuple(self.path[1:])
+        if path == _EMBEDDED_INVOICE and not self._nested_done:
+            self._nested = ET.XMLParser(target=self.invoice)
+            self._nested_started = False
+        elif path in _VALIDATION_FIELDS:
+            self._text = []
+
+    def data(self, data):
+        if not self.attached:
+            return self.invoice.data(data)
+        if self._nested is not None:
+            if not self._nested_started:
+                # The embedded XML declaration must be the first thing the parser sees
+                data = data.lstrip()
+                if not data:
+                    return
+                if not data.startswith("<"):
+                    self._nested = None  # A plain description, not the invoice
+                    return
+                self._nested_started = True
+            self._nested.feed(data)
+        elif self._text is not None:
+            self._text.append(data)
+
+    def end(self, tag):
+        if not self.attached:
+            self.path.pop()
+            return self.invoice.end(tag)
+
+        path = tuple(self.path[1:])
+        self.path.pop()
+        if path == _EMBEDDED_INVOICE and self._nested is not None:
+            nested, self._nested = self._nested, None
+            try:
+                nested.close()
+            except ET.ParseError as e:
+                raise UBLParseError(f"XML de la factura embebida inválido: {e}")
+            self._nested_done = True
+        elif self._text is not None:
+            self._validation[_VALIDATION_FIELDS[path]] = "".join(self._text).strip()
+            self._text = None
+
+    def close(self) -> Dict:
+        if self.attached and not self._nested_done:
+            raise UBLParseError("El AttachedDocument no contiene la factura (cac:Attachment)")
+        invoice_data = self.invoice.result()
+        if self._validation.get("fecha"):
+            fecha_aceptacion = self._validation["fecha"]
+            if self._validation.get("hora"):
+                fecha_aceptacion = f"{fecha_aceptacion} {self._validation['hora']}"
+            invoice_data["factura"]["fecha_aceptacion"] = fecha_aceptacion
+        return invoice_data
+
+
+def parse_ubl_invoice(source, chunk_size: int = CHUNK_SIZE) -> Dict:
+    """
+    Parse a DIAN Invoice or AttachedDocument from a path, bytes or binary file
+    object, reading it in chunks. Raises UBLParseError for anything else.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        chunks = (source[i:i + chunk_size] for i in range(0, len(source), chunk_size))
+        return _parse_chunks(chunks)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as fh:
+            return _parse_chunks(iter(lambda: fh.read(chunk_size), b""))
+    return _parse_chunks(iter(lambda: source.read(chunk_size), b""))
+
+
+def _parse_chunks(chunks) -> Dict:
+    reader = _DocumentReader()
+    parser = ET.XMLParser(target=reader)
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+        return parser.close()
+    except ET.ParseError as e:
+        raise UBLParseError(f"XML inválido: {e}")